@@ -0,0 +1,57 @@
+"""
+Time of the VirtualPacketProvider -> VirtualLuminosity -> Flux -> SSum
+links with Quantities and in the unit-free fast mode, on synthetic virtual
+packets.
+
+Usage: python bench_fast_path.py [no_of_packets] [repeat]
+"""
+import sys
+import timeit
+
+import numpy as np
+from astropy import units as u
+
+from dalek.tools.base import Chain
+from dalek.tools.likelihood import SSum
+from dalek.tools.providers import VirtualPacketProvider, VirtualLuminosity, Flux
+
+
+class Runner(object):
+
+    def __init__(self, no_of_packets):
+        wl = np.random.uniform(2000, 10000, no_of_packets)
+        self.virt_packet_nus = (wl * u.angstrom).to(u.Hz, u.spectral()).value
+        self.virt_packet_energies = np.random.random(no_of_packets) * 1e38
+        self.time_of_simulation = 1e6 * u.s
+
+
+class Model(object):
+
+    def __init__(self, no_of_packets):
+        self.runner = Runner(no_of_packets)
+
+
+def build_chain(fast):
+    wl = np.linspace(3000, 9000, 2001) * u.angstrom
+    observed = (np.ones(2000) * 1e-15 *
+                u.erg / (u.s * u.angstrom * u.cm**2))
+    return Chain(
+            VirtualPacketProvider(fast=fast),
+            VirtualLuminosity(wl, fast=fast),
+            Flux(10 * u.Mpc, fast=fast),
+            SSum(wl, observed, fast=fast))
+
+
+def main(no_of_packets=10**6, repeat=5):
+    data = {'model': Model(no_of_packets)}
+    chains = [('quantities', build_chain(False)), ('fast', build_chain(True))]
+    results = [chain(data)['loglikelihood'] for _, chain in chains]
+    assert np.isclose(getattr(results[0], 'value', results[0]), results[1])
+    print('{} virtual packets'.format(no_of_packets))
+    for name, chain in chains:
+        best = min(timeit.repeat(lambda: chain(data), number=1, repeat=repeat))
+        print('{:<15}{:>12.4g} s'.format(name, best))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
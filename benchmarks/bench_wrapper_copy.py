@@ -0,0 +1,49 @@
+"""
+Per-call overhead of copying the configuration and the atomic data in
+TardisWrapper, comparing the previous deepcopy with the current shared copies.
+
+Usage: python bench_wrapper_copy.py tardis_config.yml [repeat]
+"""
+import sys
+import timeit
+from copy import deepcopy
+
+from dalek.wrapper.tardis_wrapper import TardisWrapper
+
+
+class DeepCopyWrapper(TardisWrapper):
+
+    @property
+    def atom_data(self):
+        return deepcopy(self._atom_data)
+
+    @property
+    def config(self):
+        return deepcopy(self._config)
+
+
+def bench(wrapper, repeat):
+    def generate():
+        wrapper._generate_config(lambda config: config)
+    results = {}
+    for name, func in [
+            ('atom_data', lambda: wrapper.atom_data),
+            ('config', lambda: wrapper.config),
+            ('_generate_config', generate)]:
+        results[name] = min(timeit.repeat(func, number=1, repeat=repeat))
+    return results
+
+
+def main(config_fname, repeat=5):
+    wrapper = TardisWrapper(config_fname, log_dir='.')
+    deep = DeepCopyWrapper(
+            config_fname, atom_data=wrapper._atom_data, log_dir='.')
+    before = bench(deep, repeat)
+    after = bench(wrapper, repeat)
+    print('{:<20}{:>15}{:>15}'.format('', 'deepcopy [s]', 'shared [s]'))
+    for name in before:
+        print('{:<20}{:>15.4g}{:>15.4g}'.format(name, before[name], after[name]))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], *[int(a) for a in sys.argv[2:]])
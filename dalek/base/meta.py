@@ -1,10 +1,36 @@
 # coding: utf-8
 import os
+import copy
+import time
+import atexit
+import logging
+import threading
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+import numpy as np
 import pandas as pd
 from dalek.wrapper import SafeHDFStore
 import warnings
 import tables
 
+logger = logging.getLogger(__name__)
+
+# Containers with buffered records, flushed at interpreter shutdown. The
+# strong references keep them alive until their records are written.
+_buffered_containers = set()
+
+
+@atexit.register
+def _flush_buffered_containers():
+    for container in list(_buffered_containers):
+        try:
+            container.flush()
+        except Exception:
+            logger.exception('Flushing %s failed', container._file)
+
 class MetaContainer(object):
     """
     Class to control storing of metainformation
@@ -16,11 +42,45 @@ class MetaContainer(object):
         summary_data: dictionary-like object
             Additional information that should be saved.
             For example dalek_version, tardis_version, time, ranks, iterations
+        storage: 'nodes' or 'columnar'
+            'nodes' writes every data item of a run as its own pandas object
+            under data/<uuid>/<name>. 'columnar' appends it as a row to one
+            extendable 2-D array per name under /columns/<name> and records
+            the row of each uuid in the column_index table. The index of
+            the data (e.g. the wavelength bins) goes to /column_labels/<name>.
+        chunkrows: int
+            number of runs per HDF5 chunk in the columnar storage
+        complevel: int
+            compression level of the columnar storage (0: no compression)
+        complib: string
+            compression library of the columnar storage
+        buffer_size: int
+            keep up to buffer_size records in memory before they are written
+            (default: write every record right away)
+        flush_interval: float
+            also write the buffered records if the last write is more than
+            flush_interval seconds ago. Only checked when a record is added.
+
+    Buffered records are written when the buffer is full, by `flush`, when a
+    `with container` block is left and at interpreter shutdown.
 
     """
-    def __init__(self, path, summary_data=None):
+    def __init__(self, path, summary_data=None, storage='nodes',
+                 chunkrows=64, complevel=5, complib='blosc',
+                 buffer_size=None, flush_interval=None):
+        if storage not in ('nodes', 'columnar'):
+            raise ValueError(
+                    'storage must be nodes or columnar, not {}'.format(storage))
         self._path, self._file = os.path.split(path)
         self.open = False
+        self.storage = storage
+        self.chunkrows = chunkrows
+        self.complevel = complevel
+        self.complib = complib
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.time()
         if summary_data is not None:
             self._write_summary(summary_data)
 
@@ -50,10 +110,239 @@ class MetaContainer(object):
         close store after 'with'
         '''
         if self.open:
-            self.store.__exit__(type, value, traceback)
-            self.open = False
+            try:
+                if type is None:
+                    self._write_buffer(self.store)
+            finally:
+                self.store.__exit__(type, value, traceback)
+                self.open = False
         return
 
+    @property
+    def buffered(self):
+        return self.buffer_size is not None or self.flush_interval is not None
+
+    def unbuffered(self):
+        '''
+        A closed copy of the container that writes right away.
+        '''
+        container = copy.copy(self)
+        container.open = False
+        container.buffer_size = container.flush_interval = None
+        container._buffer = []
+        return container
+
+    def write(self, records):
+        '''
+        Save several MetaInformation records with a single open of the file
+        and a single append to the run_table. A buffered container only
+        writes them once the buffer is full or the flush_interval has passed.
+        '''
+        if not self.buffered:
+            self._write(list(records))
+            return
+        self._buffer.extend(records)
+        _buffered_containers.add(self)
+        if ((self.buffer_size is not None and
+                len(self._buffer) >= self.buffer_size) or
+            (self.flush_interval is not None and
+                time.time() - self._last_flush >= self.flush_interval)):
+            self.flush()
+
+    def flush(self):
+        '''
+        Write the buffered records. They stay in the buffer if the write
+        fails.
+        '''
+        if not self._buffer:
+            return
+        if self.open:
+            self._write_buffer(self.store)
+        else:
+            # leaving the block writes the buffer
+            with self:
+                pass
+
+    def _write_buffer(self, store):
+        records = list(self._buffer)
+        if records:
+            self._write_records(store, records)
+            del self._buffer[:len(records)]
+        self._last_flush = time.time()
+        _buffered_containers.discard(self)
+
+    def _write(self, records):
+        if not records:
+            return
+        with self as store:
+            self._write_records(store, records)
+
+    def _write_records(self, store, records):
+        if self.storage == 'columnar':
+            self._append_columns(store, records)
+        else:
+            for record in records:
+                record._save_data(store)
+        store.append('run_table', MetaInformation.run_table(records))
+
+    def _column(self, store, name, series):
+        handle = store._handle
+        path = '/columns/' + name
+        if path in handle:
+            return handle.get_node(path)
+        node = handle.create_earray(
+                '/columns', name,
+                atom=tables.Atom.from_dtype(series.values.dtype),
+                shape=(0, len(series)),
+                filters=tables.Filters(self.complevel, self.complib),
+                chunkshape=(self.chunkrows, len(series)),
+                createparents=True)
+        handle.create_array('/column_labels', name, np.asarray(series.index),
+                            createparents=True)
+        return node
+
+    def _append_columns(self, store, records):
+        names = []
+        for record in records:
+            names.extend(n for n in record._data if n not in names)
+        index = []
+        for name in names:
+            rows = [(str(r._uuid), getattr(r, '_' + name))
+                    for r in records if name in r._data]
+            node = self._column(store, name, rows[0][1])
+            start = node.nrows
+            node.append(np.vstack([np.asarray(v) for _, v in rows]))
+            index.extend((uuid, name, start + i)
+                         for i, (uuid, _) in enumerate(rows))
+        if index:
+            store.append('column_index',
+                         pd.DataFrame(index, columns=['uuid', 'name', 'row']),
+                         index=False, data_columns=['uuid', 'name'],
+                         min_itemsize={'uuid': 36, 'name': 64})
+
+    def read_column(self, name, uuids=None):
+        '''
+        Read a quantity of the columnar storage.
+
+        Parameters
+        -----
+            name: string
+                name of the data item, e.g. 'spec'
+            uuids: sequence of strings
+                only read these runs (default: all)
+
+        Returns
+        -----
+            pandas.DataFrame with one row per run indexed by uuid
+        '''
+        with self as store:
+            node = store._handle.get_node('/columns/' + name)
+            index = store.select('column_index',
+                                 where="name == '{}'".format(name))
+            index = index.set_index('uuid')['row']
+            if uuids is None:
+                index = index.sort_values()
+                values = node.read()
+            else:
+                index = index.loc[[str(uuid) for uuid in uuids]]
+                values = node[index.values.tolist(), :]
+            columns = store._handle.get_node('/column_labels/' + name).read()
+        return pd.DataFrame(values, index=index.index, columns=columns)
+
+
+class MetaWriter(object):
+    '''
+    Save MetaInformation records to a MetaContainer from a background thread.
+
+    `write` only puts the records on a queue. The thread takes up to
+    batch_size records, waiting at most flush_interval seconds for more, and
+    writes them with `MetaContainer.write`, so the file is locked once per
+    batch instead of once per run. The thread opens the file through its own
+    MetaContainer, the lock of SafeHDFStore keeps it apart from other users
+    of the file. Can be used in place of the container:
+
+        with MetaWriter(container) as writer:
+            meta.save(writer)
+
+    A batch that cannot be written is kept and written together with the
+    next one. Records that are still not written when the writer is closed
+    are left in `failed` and `close` raises an IOError.
+
+    Parameters
+    -----
+        container: MetaContainer
+        batch_size: int
+        flush_interval: float
+            seconds
+    '''
+    _stop = object()
+
+    def __init__(self, container, batch_size=100, flush_interval=5.):
+        self.container = container.unbuffered()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = Queue()
+        self.failed = []
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, records):
+        for record in records:
+            self._queue.put(record)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size and batch[-1] is not self._stop:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        running = True
+        while running:
+            batch = self._next_batch()
+            if batch[-1] is self._stop:
+                batch.pop()
+                running = False
+            batch = self.failed + batch
+            try:
+                self.container.write(batch)
+            except Exception as e:
+                logger.exception('Writing %d records failed', len(batch))
+                self.failed, self._error = batch, e
+            else:
+                self.failed, self._error = [], None
+
+    def close(self):
+        '''
+        Write the queued records and stop the thread.
+        '''
+        if self._thread.is_alive():
+            self._queue.put(self._stop)
+            self._thread.join()
+        if self.failed:
+            raise IOError('{} records could not be written: {}'.format(
+                len(self.failed), self._error))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        try:
+            self.close()
+        except IOError:
+            # do not hide the exception that left the with block
+            if type is None:
+                raise
+
 
 
 class MetaInformation(object):
@@ -108,7 +397,11 @@ class MetaInformation(object):
 
     @property
     def details(self):
-        return (pd.DataFrame.from_records([self.run_details]).
+        return self.run_table([self])
+
+    @staticmethod
+    def run_table(records):
+        return (pd.DataFrame.from_records([r.run_details for r in records]).
                     set_index(['iteration','rank']))
 
 
@@ -119,6 +412,4 @@ class MetaInformation(object):
 
 
     def save(self, container):
-        with container as store:
-            self._save_data(store)
-            store.append('run_table', self.details)
+        container.write([self])
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class PacketSchedule(object):
+    """
+    Number of Monte Carlo packets for each iteration of a TinnerSimulation.
+
+    The simulation calls start() at the beginning of a run and next() before
+    every iteration with the convergence metric of the previous iteration
+    (None before the first one). The packets used are kept in history.
+
+    Keyword arguments:
+    minimum -- smallest number of packets (default: 1000)
+    maximum -- largest number of packets. If None the configured
+               montecarlo.no_of_packets is used (default: None)
+    """
+
+    def __init__(self, minimum=1000, maximum=None):
+        self._minimum = minimum
+        self._maximum = maximum
+        self.history = []
+
+    def start(self, no_of_packets, convergence_threshold):
+        self.maximum = (no_of_packets if self._maximum is None
+                        else self._maximum)
+        self.minimum = min(self._minimum, self.maximum)
+        self.convergence_threshold = convergence_threshold
+        self.history = []
+
+    def next(self, metric):
+        packets = int(np.clip(self.packets(metric), self.minimum,
+                              self.maximum))
+        self.history.append(packets)
+        return packets
+
+    @property
+    def at_maximum(self):
+        return bool(self.history) and self.history[-1] >= self.maximum
+
+    def packets(self, metric):
+        raise NotImplementedError
+
+
+class FixedPacketSchedule(PacketSchedule):
+    """
+    Use the full number of packets in every iteration.
+    """
+
+    def packets(self, metric):
+        return self.maximum
+
+
+class GeometricPacketSchedule(PacketSchedule):
+    """
+    Start with minimum packets and multiply them by factor every iteration.
+    """
+
+    def __init__(self, factor=2., **kwargs):
+        self.factor = factor
+        super(GeometricPacketSchedule, self).__init__(**kwargs)
+
+    def packets(self, metric):
+        return self.minimum * self.factor ** len(self.history)
+
+
+class ConvergencePacketSchedule(PacketSchedule):
+    """
+    Scale the packets with the convergence metric.
+
+    The Monte Carlo noise of the estimators falls as 1/sqrt(packets), so
+    resolving a relative change of metric needs packets proportional to
+    metric**-2. The full number of packets is used once the metric reaches
+    the convergence threshold. The number of packets never decreases.
+
+    Keyword arguments:
+    exponent -- packets scale as (threshold / metric)**exponent (default: 2)
+    """
+
+    def __init__(self, exponent=2., **kwargs):
+        self.exponent = exponent
+        super(ConvergencePacketSchedule, self).__init__(**kwargs)
+
+    def packets(self, metric):
+        if metric is None:
+            return self.minimum
+        packets = self.maximum * min(
+                1., (self.convergence_threshold / metric) ** self.exponent)
+        if self.history:
+            packets = max(packets, self.history[-1])
+        return packets
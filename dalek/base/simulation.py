@@ -8,13 +8,28 @@ from astropy import units as u
 
 from tardis.simulation import Simulation
 
+from dalek.base.schedule import FixedPacketSchedule
+
 logger = logging.getLogger(__name__)
 
 class TinnerSimulation(Simulation):
 
-    def __init__(self, tardis_config, convergence_threshold=0.05):
+    def __init__(self, tardis_config, convergence_threshold=0.05,
+                 packet_schedule=None):
+        """
+        Parameters
+        ----------
+        tardis_config
+        convergence_threshold: ~float
+        packet_schedule: ~dalek.base.schedule.PacketSchedule
+            number of packets per iteration, the default uses
+            montecarlo.no_of_packets for all iterations
+        """
         super(TinnerSimulation, self).__init__(tardis_config)
         self.convergence_threshold = convergence_threshold
+        if packet_schedule is None:
+            packet_schedule = FixedPacketSchedule()
+        self.packet_schedule = packet_schedule
 
     def log_plasma_state(self, t_rad, w, t_inner, next_t_rad, next_w,
                          next_t_inner, log_sampling=5):
@@ -61,24 +76,35 @@ class TinnerSimulation(Simulation):
             t_inner, next_t_inner))
 
 
-    def get_convergence_status(self, t_rad, w, estimated_t_rad, estimated_w):
+    def get_convergence_metric(self, t_rad, w, estimated_t_rad, estimated_w):
+        """
+        The larger of the median relative changes of t_rad and w
+        """
+
+        t_rad_change = np.median(np.abs(t_rad - estimated_t_rad) / t_rad)
 
-        t_rad_converged = (np.median(np.abs(t_rad - estimated_t_rad) / t_rad)
-                           < self.convergence_threshold)
+        w_change = np.median(np.abs(w - estimated_w) / w)
 
-        w_converged = (np.median(np.abs(w - estimated_w) / w)
-                           < self.convergence_threshold)
+        return max(getattr(t_rad_change, 'value', t_rad_change),
+                   getattr(w_change, 'value', w_change))
 
+    def get_convergence_status(self, t_rad, w, estimated_t_rad, estimated_w):
 
-        return t_rad_converged and w_converged
+        return (self.get_convergence_metric(t_rad, w, estimated_t_rad,
+                                            estimated_w)
+                < self.convergence_threshold)
 
-    def run_simulation(self, model, t_inner):
+    def run_simulation(self, model, t_inner=None, initial_state=None):
         """
         Run the model with a given temperature of the inner boundary
         Parameters
         ----------
         model
         t_inner
+            if None the t_inner of initial_state is used
+        initial_state: ~dalek.base.warmstart.PlasmaState
+            converged state of a similar model to start the iterations from.
+            Its t_rads are scaled by the ratio of the inner temperatures.
 
         Returns
         -------
@@ -90,15 +116,36 @@ class TinnerSimulation(Simulation):
 
         iterations_remaining = self.tardis_config.montecarlo.iterations
         iterations_executed = 0
+        self.converged = False
+        self.packet_schedule.start(
+            self.tardis_config.montecarlo.no_of_packets,
+            self.convergence_threshold)
+        self.packets_per_iteration = []
+        metric = None
+
+        if t_inner is None:
+            t_inner = initial_state.t_inner * u.K
 
         model.t_inner = t_inner
 
-        model.t_rads = np.linspace(t_inner, 0.5 * t_inner, len(model.t_rads))
+        if (initial_state is not None and
+                len(initial_state.t_rads) == len(model.t_rads)):
+            logger.info('Warm start from t_inner {0:.3f}'.format(
+                initial_state.t_inner))
+            model.t_rads = (initial_state.t_rads *
+                            (t_inner / initial_state.t_inner))
+            model.ws = initial_state.ws.copy()
+            model.calculate_j_blues(init_detailed_j_blues=True)
+            model.update_plasmas(initialize_nlte=False)
+        else:
+            model.t_rads = np.linspace(t_inner, 0.5 * t_inner,
+                                       len(model.t_rads))
 
         while iterations_remaining > 1:
             logger.info('Remaining run %d', iterations_remaining)
-            self.run_single_montecarlo(
-                model, self.tardis_config.montecarlo.no_of_packets)
+            no_of_packets = self.packet_schedule.next(metric)
+            self.packets_per_iteration.append(no_of_packets)
+            self.run_single_montecarlo(model, no_of_packets)
             self.log_run_results(self.calculate_emitted_luminosity(),
                                  self.calculate_reabsorbed_luminosity())
             iterations_executed += 1
@@ -107,11 +154,14 @@ class TinnerSimulation(Simulation):
             estimated_t_rad, estimated_w = (
                 self.runner.calculate_radiationfield_properties())
 
-            converged = self.get_convergence_status(
+            metric = self.get_convergence_metric(
                 model.t_rads, model.ws, estimated_t_rad,
                 estimated_w)
 
-            if converged:
+            # only trust convergence measured with full packet statistics
+            if (metric < self.convergence_threshold and
+                    self.packet_schedule.at_maximum):
+                self.converged = True
                 break
 
             self.log_plasma_state(model.t_rads, model.ws, np.nan,
@@ -138,10 +188,14 @@ class TinnerSimulation(Simulation):
         no_of_virtual_packets = (
             self.tardis_config.montecarlo.no_of_virtual_packets)
 
+        self.packets_per_iteration.append(no_of_packets)
         self.run_single_montecarlo(model, no_of_packets, no_of_virtual_packets)
 
         self.legacy_update_spectrum(model, no_of_virtual_packets)
 
+        self.iterations_executed = iterations_executed
         logger.info("Finished in {0:d} iterations and took {1:.2f} s".format(
             iterations_executed, time.time()-start_time))
+        logger.info("Packets per iteration: {0}".format(
+            self.packets_per_iteration))
 
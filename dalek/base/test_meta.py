@@ -1,11 +1,16 @@
+import gc
 import os
+import time
 import pytest
 import tempfile
+import threading
 from uuid import uuid4
 import numpy as np
 import pandas as pd
 
-from dalek.base.meta import MetaContainer, MetaInformation
+from dalek.base import meta
+from dalek.base.meta import MetaContainer, MetaInformation, MetaWriter
+from dalek.wrapper import SafeHDFStore
 
 class DummyRadial1D(object):
 
@@ -108,3 +113,215 @@ class TestMetaInformation(object):
             #print(store.keys())
             #print(store['run_table'])
 
+
+    def test_write(self, parameter_dict):
+        messages = []
+        for i in range(3):
+            wrapper = DummyWrapper()
+            wrapper.iteration = i
+            messages.append(MetaInformation.from_wrapper(wrapper,
+                                                         parameter_dict))
+        self.container.write(messages)
+        with self.container as store:
+            assert len(store['run_table']) == 3
+            for m in messages:
+                assert m.data_path('ws') in store
+                diff = (store['run_table'].loc[m._iteration, 0] ==
+                        m.details.loc[m._iteration, 0])
+                assert diff.all()
+
+    def test_meta_writer(self, parameter_dict):
+        with MetaWriter(self.container, batch_size=2,
+                        flush_interval=0.1) as writer:
+            for i in range(5):
+                wrapper = DummyWrapper()
+                wrapper.iteration = i
+                MetaInformation.from_wrapper(wrapper,
+                                             parameter_dict).save(writer)
+        with self.container as store:
+            assert sorted(store['run_table'].index.get_level_values(
+                'iteration')) == list(range(5))
+
+    def test_meta_writer_failure(self, parameter_dict):
+        writer = MetaWriter(self.container, batch_size=2, flush_interval=0.1)
+        write = writer.container.write
+        calls = []
+
+        def fail_once(records):
+            calls.append(len(records))
+            if len(calls) == 1:
+                raise IOError('disk full')
+            write(records)
+        writer.container.write = fail_once
+        messages = []
+        for i in range(3):
+            wrapper = DummyWrapper()
+            wrapper.iteration = 10 + i
+            messages.append(MetaInformation.from_wrapper(wrapper,
+                                                         parameter_dict))
+        messages[0].save(writer)
+        time.sleep(0.3)
+        # the failed record is written with the next batch
+        messages[1].save(writer)
+        messages[2].save(writer)
+        writer.close()
+        assert calls[0] == 1 and sum(calls[1:]) == 3
+        assert writer.failed == []
+        with self.container as store:
+            iterations = store['run_table'].index.get_level_values(
+                'iteration')
+            assert set([10, 11, 12]).issubset(iterations)
+
+        writer = MetaWriter(self.container, flush_interval=0.1)
+        writer.container.write = lambda records: 1 / 0
+        messages[0].save(writer)
+        with pytest.raises(IOError):
+            writer.close()
+        assert writer.failed == [messages[0]]
+
+
+def test_lock_waits_for_release():
+    fname = tempfile.mktemp(suffix='.h5')
+    released = []
+    acquired_after_release = []
+
+    def second_writer():
+        with SafeHDFStore(fname, probe_interval=0.01) as store:
+            acquired_after_release.append(bool(released))
+            store['s'] = pd.Series(np.arange(3))
+
+    try:
+        with SafeHDFStore(fname) as store:
+            thread = threading.Thread(target=second_writer)
+            thread.start()
+            time.sleep(0.2)
+            assert thread.is_alive()
+            store['s'] = pd.Series(np.arange(2))
+            released.append(True)
+        thread.join()
+        assert acquired_after_release == [True]
+        with SafeHDFStore(fname) as store:
+            assert len(store['s']) == 3
+    finally:
+        for f in (fname, fname + '.lock', fname + '.flock'):
+            if os.path.exists(f):
+                os.remove(f)
+
+
+def test_columnar_storage():
+    fname = tempfile.mktemp(suffix='.h5')
+    container = MetaContainer(fname, storage='columnar', chunkrows=4)
+    messages = []
+    for i in range(5):
+        wrapper = DummyWrapper()
+        wrapper.iteration = i
+        messages.append(MetaInformation.from_wrapper(wrapper, {'o': 0.1}))
+    try:
+        container.write(messages[:3])
+        messages[3].save(container)
+        messages[4].save(container)
+        with container as store:
+            assert 'data' not in store._handle.root
+            assert len(store['run_table']) == 5
+        spec = container.read_column('spec')
+        assert spec.shape == (5, 10000)
+        for m in messages:
+            assert np.all(spec.loc[str(m._uuid)].values == m._spec.values)
+        uuids = [messages[4]._uuid, messages[1]._uuid]
+        ws = container.read_column('ws', uuids)
+        assert list(ws.index) == [str(u) for u in uuids]
+        assert np.all(ws.values[0] == messages[4]._ws.values)
+        assert np.all(ws.values[1] == messages[1]._ws.values)
+    finally:
+        for f in (fname, fname + '.lock', fname + '.flock'):
+            if os.path.exists(f):
+                os.remove(f)
+
+
+def test_buffered_container():
+    fname = tempfile.mktemp(suffix='.h5')
+    container = MetaContainer(fname, buffer_size=3)
+    messages = []
+    for i in range(5):
+        wrapper = DummyWrapper()
+        wrapper.iteration = i
+        messages.append(MetaInformation.from_wrapper(wrapper, {'o': 0.1}))
+    try:
+        for m in messages[:2]:
+            m.save(container)
+        assert not os.path.exists(fname)
+        messages[2].save(container)
+        messages[3].save(container)
+        with container as store:
+            assert len(store['run_table']) == 3
+        with container as store:
+            assert len(store['run_table']) == 4
+        messages[4].save(container)
+        container.flush()
+        with container as store:
+            assert len(store['run_table']) == 5
+            assert messages[4].data_path('spec') in store
+    finally:
+        for f in (fname, fname + '.lock', fname + '.flock'):
+            if os.path.exists(f):
+                os.remove(f)
+
+
+def test_flush_interval():
+    fname = tempfile.mktemp(suffix='.h5')
+    container = MetaContainer(fname, flush_interval=0.05)
+    try:
+        MetaInformation.from_wrapper(DummyWrapper(), {}).save(container)
+        time.sleep(0.1)
+        wrapper = DummyWrapper()
+        wrapper.iteration = 2
+        MetaInformation.from_wrapper(wrapper, {}).save(container)
+        assert len(container._buffer) == 0
+        with container as store:
+            assert len(store['run_table']) == 2
+    finally:
+        for f in (fname, fname + '.lock', fname + '.flock'):
+            if os.path.exists(f):
+                os.remove(f)
+
+
+def test_buffered_container_failed_flush():
+    fname = tempfile.mktemp(suffix='.h5')
+    container = MetaContainer(fname, buffer_size=10)
+    write_records = container._write_records
+    try:
+        MetaInformation.from_wrapper(DummyWrapper(), {}).save(container)
+
+        def fail(store, records):
+            raise IOError('disk full')
+        container._write_records = fail
+        with pytest.raises(IOError):
+            container.flush()
+        assert len(container._buffer) == 1
+        container._write_records = write_records
+        container.flush()
+        assert len(container._buffer) == 0
+        with container as store:
+            assert len(store['run_table']) == 1
+    finally:
+        for f in (fname, fname + '.lock', fname + '.flock'):
+            if os.path.exists(f):
+                os.remove(f)
+
+
+def test_buffered_container_flushed_at_exit():
+    fname = tempfile.mktemp(suffix='.h5')
+    container = MetaContainer(fname, buffer_size=10)
+    try:
+        MetaInformation.from_wrapper(DummyWrapper(), {}).save(container)
+        # the records of a dropped container are still written at shutdown
+        del container
+        gc.collect()
+        meta._flush_buffered_containers()
+        assert not meta._buffered_containers
+        with MetaContainer(fname) as store:
+            assert len(store['run_table']) == 1
+    finally:
+        for f in (fname, fname + '.lock', fname + '.flock'):
+            if os.path.exists(f):
+                os.remove(f)
@@ -0,0 +1,30 @@
+from dalek.base.schedule import (
+        FixedPacketSchedule, GeometricPacketSchedule,
+        ConvergencePacketSchedule)
+
+
+def run(schedule, metrics, no_of_packets=100000, threshold=0.05):
+    schedule.start(no_of_packets, threshold)
+    return [schedule.next(m) for m in metrics]
+
+
+def test_fixed():
+    schedule = FixedPacketSchedule()
+    assert run(schedule, [None, 1., 0.01]) == [100000] * 3
+    assert schedule.at_maximum
+
+
+def test_geometric():
+    schedule = GeometricPacketSchedule(factor=4, minimum=1000)
+    assert run(schedule, [None, 1, 1, 1, 1]) == [
+            1000, 4000, 16000, 64000, 100000]
+    assert schedule.history == [1000, 4000, 16000, 64000, 100000]
+    assert schedule.at_maximum
+    assert run(schedule, [None], no_of_packets=500) == [500]
+
+
+def test_convergence():
+    schedule = ConvergencePacketSchedule(minimum=1000)
+    packets = run(schedule, [None, 1., 0.5, 0.1, 0.5, 0.04])
+    assert packets == [1000, 1000, 1000, 25000, 25000, 100000]
+    assert not ConvergencePacketSchedule(maximum=10).at_maximum
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from astropy import units as u
+
+from dalek.base.warmstart import WarmStartStore
+
+
+def state(t_inner):
+    return (t_inner * u.K, np.linspace(t_inner, 0.5 * t_inner, 10) * u.K,
+            np.linspace(0.5, 0.1, 10))
+
+
+def test_warm_start_store():
+    store = WarmStartStore(maxlen=3)
+    assert store.query({'a': 0.1, 'b': 1e4}) == (None, np.inf)
+    store.add({'a': 0.1, 'b': 1e4}, *state(10000), iterations=10)
+    store.add({'a': 0.2, 'b': 2e4}, *state(12000), iterations=8)
+    found, distance = store.query({'a': 0.12, 'b': 1.1e4})
+    assert found.t_inner == 10000
+    assert np.allclose(distance, np.hypot(0.2, 0.1))
+    assert found.t_rads[0] == 10000
+    assert store.mean_cold_iterations == 9
+
+    store.add({'a': 0.15, 'b': 1.5e4}, *state(11000), iterations=2,
+              warm=True)
+    store.add({'a': 0.3, 'b': 1.5e4}, *state(11000), iterations=5)
+    assert len(store) == 3
+    # the oldest state was dropped
+    assert store.query({'a': 0.1, 'b': 1e4})[0].t_inner == 11000
+    assert store.mean_cold_iterations == 23 / 3.
+
+    store.max_distance = 1e-3
+    assert store.query({'a': 0.2, 'b': 1e4})[0] is None
+    with pytest.raises(ValueError):
+        store.query({'a': 0.1})
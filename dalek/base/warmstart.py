@@ -0,0 +1,93 @@
+from collections import deque, namedtuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+PlasmaState = namedtuple('PlasmaState', ['t_inner', 't_rads', 'ws',
+                                         'iterations'])
+
+
+def _value(x):
+    return np.asarray(getattr(x, 'value', x), dtype=float)
+
+
+class WarmStartStore(object):
+    """
+    Converged plasma states of recent evaluations, searchable by the
+    parameters that produced them.
+
+    The parameter vectors are scaled by the range of the stored vectors
+    before the nearest neighbour search, so parameters with very different
+    magnitudes (abundances, velocities, temperatures) count alike.
+
+    Parameters
+    ----------
+    maxlen: ~int
+        number of states to keep, the oldest are dropped first
+    max_distance: ~float
+        do not warm start if the nearest state is further away than this
+        (in scaled parameter space)
+    """
+
+    def __init__(self, maxlen=1000, max_distance=np.inf):
+        self.max_distance = max_distance
+        self._names = None
+        self._vectors = deque(maxlen=maxlen)
+        self._states = deque(maxlen=maxlen)
+        self._tree = None
+        self._scale = None
+        self.cold_iterations = []
+
+    def _vector(self, parameters):
+        names = tuple(sorted(parameters))
+        if self._names is None:
+            self._names = names
+        elif names != self._names:
+            raise ValueError('expected the parameters {}, got {}'.format(
+                self._names, names))
+        return np.array([parameters[n] for n in names], dtype=float)
+
+    def add(self, parameters, t_inner, t_rads, ws, iterations, warm=False):
+        """
+        Store a converged state. Iterations of cold starts are kept to
+        estimate the savings of warm starts.
+        """
+        self._vectors.append(self._vector(parameters))
+        self._states.append(PlasmaState(
+            float(_value(t_inner)), _value(t_rads).copy(), _value(ws).copy(),
+            iterations))
+        self._tree = None
+        if not warm:
+            self.cold_iterations.append(iterations)
+
+    def query(self, parameters):
+        """
+        Find the stored state closest to the parameters.
+
+        Returns
+        -------
+            : PlasmaState or None, float
+            state and scaled distance, (None, inf) if there is no state
+            within max_distance
+        """
+        if len(self._states) == 0:
+            return None, np.inf
+        if self._tree is None:
+            vectors = np.array(self._vectors)
+            scale = vectors.max(axis=0) - vectors.min(axis=0)
+            scale[scale == 0] = 1.
+            self._scale = scale
+            self._tree = cKDTree(vectors / scale)
+        distance, i = self._tree.query(self._vector(parameters) / self._scale)
+        if distance > self.max_distance:
+            return None, distance
+        return self._states[i], distance
+
+    @property
+    def mean_cold_iterations(self):
+        if not self.cold_iterations:
+            return np.nan
+        return np.mean(self.cold_iterations)
+
+    def __len__(self):
+        return len(self._states)
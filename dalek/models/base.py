@@ -5,6 +5,10 @@ from tardis import run_tardis, model, simulation, atomic
 from astropy import units as u, constants as const
 
 from dalek.base.simulation import TinnerSimulation
+from dalek.wrapper.config import structural_copy, ConfigPath
+from dalek.wrapper.incremental import IncrementalConfigBuilder
+from dalek.wrapper.reuse import ReusableModel
+from dalek.wrapper.atom_data import load_shared_atom_data
 
 from scipy import ndimage, interpolate
 
@@ -17,24 +21,34 @@ class TARDISModelMixin(Model):
     outputs = ('packet_nu', 'packet_energy', 'virtual_nu', 'virtual_energy',
                'param_name', 'param_value')
 
-    def __init__(self, config_name_space, **kwargs):
+    def __init__(self, config_name_space, shared_atom_data=None,
+                 reuse_model=False, **kwargs):
         self.config_name_space = config_name_space
-        self.atom_data = atomic.AtomData.from_hdf5(config_name_space.atom_data)
+        self.model_factory = (ReusableModel() if reuse_model
+                              else model.Radial1DModel)
+        self._config_paths = [
+            ConfigPath(path, config_name_space)
+            for path in self.convert_param_dict.values()]
+        if shared_atom_data is None:
+            self.atom_data = atomic.AtomData.from_hdf5(
+                config_name_space.atom_data)
+        else:
+            self.atom_data = load_shared_atom_data(
+                config_name_space.atom_data, shared_atom_data)
+        self._config_builder = IncrementalConfigBuilder(
+            config_name_space, self.atom_data)
         super(TARDISModelMixin, self).__init__(**kwargs)
 
     def _get_config_from_args(self, args):
-        config_name_space = copy.deepcopy(self.config_name_space)
-        for i, param_value in enumerate(args):
-            param_value = np.squeeze(param_value)
-            config_name_space.set_config_item(
-                self.convert_param_dict.values()[i], param_value)
-        return Configuration.from_config_dict(config_name_space,
-                                                validate=False,
-                                                atom_data=self.atom_data)
+        config_name_space = structural_copy(self.config_name_space)
+        for config_path, param_value in zip(self._config_paths, args):
+            config_path.set(config_name_space, np.squeeze(param_value))
+        return self._config_builder.build(
+            config_name_space, [p.path for p in self._config_paths])
 
     def evaluate(self, *args, **kwargs):
         config = self._get_config_from_args(args)
-        radial1d_mdl = model.Radial1DModel(config)
+        radial1d_mdl = self.model_factory(config)
 
         simulation.run_radial1d(radial1d_mdl)
         runner = radial1d_mdl.runner
@@ -57,7 +71,7 @@ class TARDISTinnerModelMixin(TARDISModelMixin):
 
         t_inner = u.Quantity(args[-1], u.K)
 
-        radial1d_mdl = model.Radial1DModel(config)
+        radial1d_mdl = self.model_factory(config)
 
         simulation = TinnerSimulation(config)
 
@@ -135,7 +149,8 @@ def _generate_param_class_dict(fname, param_names):
 
     return class_dict, param_dict, config
 
-def assemble_tardis_model(fname, param_names):
+def assemble_tardis_model(fname, param_names, shared_atom_data=None,
+                          reuse_model=False):
     """
     Assemble a TARDIS model with given Parameter names
 
@@ -143,6 +158,12 @@ def assemble_tardis_model(fname, param_names):
     ----------
     fname
     param_names
+    shared_atom_data: ~str
+        directory of a memory-mapped copy of the atomic data shared by all
+        processes on a node (see dalek.wrapper.atom_data)
+    reuse_model: ~bool
+        reset one Radial1DModel in place for every evaluation (see
+        dalek.wrapper.reuse.ReusableModel)
 
     Returns
     -------
@@ -156,19 +177,27 @@ def assemble_tardis_model(fname, param_names):
 
     simple_model = type('SimpleTARDISModel', (TARDISModelMixin,), class_dict)
 
-    return simple_model(config, **param_dict)
+    return simple_model(config, shared_atom_data=shared_atom_data,
+                        reuse_model=reuse_model, **param_dict)
 
 
 
 
 
-def assemble_tardis_model_tinner(fname, param_names):
+def assemble_tardis_model_tinner(fname, param_names, shared_atom_data=None,
+                                 reuse_model=False):
     """
 
     Parameters
     ----------
     fname
     param_names
+    shared_atom_data: ~str
+        directory of a memory-mapped copy of the atomic data shared by all
+        processes on a node (see dalek.wrapper.atom_data)
+    reuse_model: ~bool
+        reset one Radial1DModel in place for every evaluation (see
+        dalek.wrapper.reuse.ReusableModel)
 
     Returns
     -------
@@ -187,4 +216,5 @@ def assemble_tardis_model_tinner(fname, param_names):
     simple_model = type('SimpleTARDISModel', (TARDISTinnerModelMixin,),
                         class_dict)
 
-    return simple_model(config, **param_dict)
+    return simple_model(config, shared_atom_data=shared_atom_data,
+                        reuse_model=reuse_model, **param_dict)
@@ -5,6 +5,9 @@ from astropy.modeling import Model
 
 from astropy import units as u, constants as const
 
+from dalek.tools.binning import WavelengthBinning
+from dalek.tools.likelihood import Gaussian, SquaredDifference
+
 def intensity_black_body_wavelength(wavelength, T):
     wavelength = u.Quantity(wavelength, u.angstrom)
     T = u.Quantity(T, u.K)
@@ -23,6 +26,8 @@ class SimpleTARDISUncertaintyModel(Model):
                  virtual_uncertainty_scaling=5.):
         self.observed_wavelength = observed_wavelength
         self.wavelength_bins = self._generate_bins(observed_wavelength)
+        self._bin_widths = np.diff(self.wavelength_bins)
+        self._binning = WavelengthBinning(self.wavelength_bins)
         self.mode = mode
         self.virtual_uncertainty_scaling = virtual_uncertainty_scaling
         super(SimpleTARDISUncertaintyModel, self).__init__()
@@ -36,24 +41,19 @@ class SimpleTARDISUncertaintyModel(Model):
 
     def evaluate(self, packet_nu, packet_energy, virtual_nu, virtual_energy,
                  param_names, param_values):
-        packet_lambda = packet_nu.to(u.angstrom, u.spectral())
-        bin_counts = np.histogram(packet_lambda, bins=self.wavelength_bins)[0]
+        luminosity, bin_counts = self._binning.histogram(
+                packet_nu, getattr(packet_energy, 'value', packet_energy))
 
         uncertainty = (np.sqrt(bin_counts) * np.mean(packet_energy)
-                       / np.diff(self.wavelength_bins))
-
-        if self.mode == 'normal':
-            luminosity = np.histogram(packet_lambda,
-                          weights=packet_energy,
-                          bins=self.wavelength_bins)[0]
-        elif self.mode == 'virtual':
-            virtual_packet_lambda = virtual_nu.to(u.angstrom, u.spectral())
-            luminosity = np.histogram(virtual_packet_lambda,
-                          weights=virtual_energy,
-                          bins=self.wavelength_bins)[0]
+                       / self._bin_widths)
+
+        if self.mode == 'virtual':
+            luminosity = self._binning.histogram(
+                    virtual_nu,
+                    getattr(virtual_energy, 'value', virtual_energy))[0]
             uncertainty /= self.virtual_uncertainty_scaling
 
-        luminosity_density = luminosity / np.diff(self.wavelength_bins)
+        luminosity_density = luminosity / self._bin_widths
 
         self.luminosity_density = luminosity_density
         self.uncertainty = uncertainty.value
@@ -124,6 +124,8 @@ class LogLikelihood(Model):
         self.wavelength_slice = slice(
             self.observed_wavelength.searchsorted(wavelength_start),
             self.observed_wavelength.searchsorted(wavelength_end))
+        self._likelihood = Gaussian(observed_flux, observed_uncertainty,
+                                    index=self.wavelength_slice)
         super(LogLikelihood, self).__init__()
 
     def save_current_spectrum(self, fname):
@@ -136,8 +138,7 @@ class LogLikelihood(Model):
         self.current_wavelength = wavelength
         self.current_flux = flux
         self.current_uncertainty = uncertainty
-        return (-0.5 * np.sum((self.observed_flux[self.wavelength_slice] - flux[self.wavelength_slice])**2 /
-                              (uncertainty[self.wavelength_slice]**2 + self.observed_uncertainty[self.wavelength_slice]**2)))
+        return self._likelihood(flux, uncertainty)
 
 
 
@@ -158,6 +159,8 @@ class SSum(Model):
         self.wavelength_slice = slice(
             self.observed_wavelength.searchsorted(wavelength_start),
             self.observed_wavelength.searchsorted(wavelength_end))
+        self._likelihood = SquaredDifference(observed_flux,
+                                             index=self.wavelength_slice)
         super(SSum, self).__init__()
 
     def save_current_spectrum(self, fname):
@@ -170,6 +173,4 @@ class SSum(Model):
         self.current_wavelength = wavelength
         self.current_flux = flux
         self.current_uncertainty = uncertainty
-        return -0.5 * np.sum(
-            (self.observed_flux[self.wavelength_slice] -
-             flux[self.wavelength_slice])**2)
+        return self._likelihood(flux)
@@ -2,17 +2,73 @@ from __future__ import print_function
 from copy import copy
 import sys
 
+import numpy as np
+from astropy import units as u
+
 def warning(*objs):
     print("WARNING: ", *objs, file=sys.stderr)
 
+def stack(values):
+    '''
+    Stack the per-item values of a batch into one array, keeping the unit of
+    the first item if the values are astropy Quantities.
+    '''
+    try:
+        unit = values[0].unit
+    except AttributeError:
+        return np.asarray(values)
+    return np.asarray([v.to(unit).value for v in values]) * unit
+
+
+def value_in(value, unit):
+    '''
+    The plain values of a Quantity in unit. Arrays without a unit are
+    assumed to be in unit already.
+    '''
+    if isinstance(value, u.Quantity):
+        return value.to(unit).value
+    return np.asarray(value)
+
+
+def _same_unit(a, b):
+    '''
+    Whether a and b are the same unit, None standing for a Quantity.
+    '''
+    if a is None or b is None:
+        return a is None and b is None
+    return u.Unit(a) == u.Unit(b)
+
+
+def _describe_unit(unit):
+    if unit is None:
+        return 'a Quantity'
+    return 'a plain array in {}'.format(u.Unit(unit))
+
+
 class BreakChainException(Exception):
     pass
 
 class Chainable(object):
     inputs = set()
     outputs = set()
+    # Set to True if _apply_batch handles a whole batch at once. Otherwise
+    # batches are evaluated item by item.
+    vectorized = False
+    # The active dalek.tools.profiling.Profiler, None if profiling is off
+    profiler = None
+
+    def __call__(self, data={}, outputs=None):
+        '''
+        Evaluate the input dictionary. If outputs is given, only these keys
+        are returned and, in chains, only the links needed for them run.
+        '''
+        if self.profiler is not None:
+            return self.profiler.measure(self, self._evaluate, data, outputs)
+        return self._evaluate(data, outputs)
 
-    def __call__(self, data={}):
+    def _evaluate(self, data, outputs):
+        if outputs is not None:
+            return self._select(self._pruned(outputs)(data), outputs)
         if self._isvalid(data):
             data = self._apply(copy(data))
         else:
@@ -22,6 +78,40 @@ class Chainable(object):
                 ))
         return data
 
+    def map(self, batch, outputs=None):
+        '''
+        Evaluate a batch of input dictionaries and return the list of output
+        dictionaries in the same order.
+        '''
+        if self.profiler is not None:
+            return self.profiler.measure(self, self._evaluate_batch, batch,
+                                         outputs)
+        return self._evaluate_batch(batch, outputs)
+
+    def _evaluate_batch(self, batch, outputs):
+        if outputs is not None:
+            return [self._select(data, outputs)
+                    for data in self._pruned(outputs).map(batch)]
+        batch = list(batch)
+        for data in batch:
+            if not self._isvalid(data):
+                raise ValueError(
+                        "Inputs required are: {}\n Data provides only: {}".format(
+                            str(self.inputs),
+                            str(data)
+                            ))
+        return self._apply_batch([copy(data) for data in batch])
+
+    def _pruned(self, outputs):
+        return self
+
+    @staticmethod
+    def _select(data, outputs):
+        return dict((k, data[k]) for k in outputs)
+
+    def _apply_batch(self, batch):
+        return [self._apply(data) for data in batch]
+
     def _isvalid(self, data):
         try:
             valid = self.inputs.issubset(data.keys())
@@ -31,15 +121,60 @@ class Chainable(object):
             return valid
 
 class Link(Chainable):
+    # The units of the inputs and outputs that the link passes as plain
+    # arrays instead of Quantities, like the links with fast=True. Keys that
+    # are missing are Quantities. None if the link does not declare its
+    # units, then Chain does not check them.
+    plain_units = None
+
+    def accepts(self, key, unit):
+        '''
+        Whether the link can read the input key from a link that writes it
+        as a plain array in unit (None: as a Quantity).
+        '''
+        return _same_unit(self.plain_units.get(key), unit)
 
     def _apply(self, input_dict):
         inputs = self._prepare_input(input_dict)
-        output = self.calculate(*inputs)
+        if self.profiler is None:
+            output = self.calculate(*inputs)
+        else:
+            output = self.profiler.calculate(self, self.calculate, *inputs)
         # output_dict = copy(input_dict)
         output = self._prepare_output(output)
         input_dict.update(output)
         return input_dict
 
+    def _apply_batch(self, batch):
+        '''
+        Vectorized links receive one list per input (one entry per item) in
+        calculate_batch and return one sequence per output.
+        '''
+        if not self.vectorized:
+            return super(Link, self)._apply_batch(batch)
+        inputs = [[data[i] for data in batch] for i in self.inputs]
+        if self.profiler is None:
+            output = self.calculate_batch(*inputs)
+        else:
+            output = self.profiler.calculate(self, self.calculate_batch,
+                                             *inputs)
+        for data, item_output in zip(
+                batch, self._split_batch_output(output, len(batch))):
+            data.update(item_output)
+        return batch
+
+    def _split_batch_output(self, output, size):
+        if len(self.outputs) == 0:
+            return [{}] * size
+        if len(self.outputs) == 1:
+            return [{self.outputs[0]: o} for o in output]
+        if len(output) == len(self.outputs):
+            return [dict(zip(self.outputs, o)) for o in zip(*output)]
+        else:
+            raise ValueError(
+                    "{} is expected to return {} but actual value was {}".format(
+                        self.__class__.__name__, (self.outputs), str(output)))
+
     def _prepare_input(self, input_dict):
         output = []
         for i in self.inputs:
@@ -65,7 +200,29 @@ class Link(Chainable):
                         self.__class__.__name__, (self.outputs), str(output)))
 
 
+def _flat_links(chainable):
+    if isinstance(chainable, Chain):
+        for link in chainable._links:
+            for child in _flat_links(link):
+                yield child
+    else:
+        yield chainable
+
+
+def _produced(chainable):
+    if isinstance(chainable, Chain):
+        produced = set()
+        for link in chainable._links:
+            produced.update(_produced(link))
+        return produced
+    return set(chainable.outputs)
+
+
 class Chain(Chainable):
+    vectorized = True
+    # keys to remove before the first and after each link, set by prune
+    _drop_before = ()
+    _drop_after = None
 
     def __init__(self, *args, **kwargs):
         try:
@@ -80,10 +237,100 @@ class Chain(Chainable):
             self.inputs.update(set(arg.inputs).difference(self.outputs))
             self.outputs.update(arg.outputs)
         self.outputs.update(self.inputs)
+        self._pruned_chains = {}
+        self._check_units()
         super(Chain, self).__init__()
 
+    def _check_units(self):
+        '''
+        Make sure that links which declare their plain_units read every key
+        in the form (plain array or Quantity, and unit) that the link
+        writing it declares, e.g. that a Flux(fast=False) does not follow a
+        Luminosity(fast=True).
+        '''
+        writers = {}
+        for link in _flat_links(self):
+            if getattr(link, 'plain_units', None) is not None:
+                for key in link.inputs:
+                    writer = writers.get(key)
+                    if writer is None or writer.plain_units is None:
+                        continue
+                    unit = writer.plain_units.get(key)
+                    if not link.accepts(key, unit):
+                        raise ValueError(
+                                "{} writes {} as {}, which {} can not "
+                                "read".format(
+                                    writer.__class__.__name__, key,
+                                    _describe_unit(unit),
+                                    link.__class__.__name__))
+            for key in link.outputs:
+                writers[key] = link
+
+    def prune(self, outputs, guarded=False):
+        '''
+        A Chain with only the links needed for outputs.
+
+        Links (and subchains) are kept if a later kept link or the caller
+        needs one of their outputs. Links without outputs, like CheckPrior,
+        are kept if any link after them is kept, since they may break the
+        chain. Keys are removed from the dictionary as soon as no later link
+        reads them, so large intermediates like the model are freed early.
+
+        Parameters
+        -----
+            outputs: sequence of strings
+            guarded: bool
+                keep links without outputs even if no link after them is
+                kept, because links after the chain are
+        '''
+        live = set(outputs)
+        unknown = live.difference(self.outputs)
+        if unknown:
+            raise ValueError("{} does not provide {}".format(
+                self.__class__.__name__, sorted(unknown)))
+        kept = []
+        live_after = []
+        for link in reversed(self._links):
+            produced = _produced(link)
+            if isinstance(link, Chain):
+                link = link.prune(live & link.outputs, guarded=(
+                    (bool(kept) or guarded) and not link.breakable))
+                if not link._links:
+                    continue
+                produced = _produced(link)
+            elif not (produced & live or (not produced and (kept or guarded))):
+                continue
+            kept.append(link)
+            live_after.append(set(live))
+            live = live.difference(produced).union(link.inputs)
+        kept.reverse()
+        live_after.reverse()
+        pruned = Chain(*kept, breakable=self.breakable)
+        pruned.outputs = set(outputs)
+        known = set(pruned.inputs)
+        for link in kept:
+            known.update(link.inputs, link.outputs)
+        pruned._drop_before = tuple(known.difference(live))
+        pruned._drop_after = [tuple(known.difference(after))
+                              for after in live_after]
+        return pruned
+
+    def _pruned(self, outputs):
+        key = frozenset(outputs)
+        try:
+            return self._pruned_chains[key]
+        except KeyError:
+            pruned = self._pruned_chains[key] = self.prune(outputs)
+            return pruned
+
+    @staticmethod
+    def _drop(data, keys):
+        for k in keys:
+            data.pop(k, None)
+
     def _apply(self, input_dict):
-        for link in self._links:
+        self._drop(input_dict, self._drop_before)
+        for i, link in enumerate(self._links):
             try:
                 input_dict = link(input_dict)
             except BreakChainException as e:
@@ -92,8 +339,99 @@ class Chain(Chainable):
                     break
                 else:
                     raise e
+            if self._drop_after is not None:
+                self._drop(input_dict, self._drop_after[i])
         return input_dict
 
+    def _apply_batch(self, batch):
+        '''
+        Run the batch through all links. Vectorized links see all items that
+        are still active at once, the others are called item by item. Items
+        that break a breakable chain are cleaned up and skip the remaining
+        links.
+        '''
+        results, broken = self._apply_batch_masked(batch)
+        if broken:
+            raise BreakChainException
+        return results
+
+    def _apply_batch_masked(self, batch):
+        '''
+        Like _apply_batch, but items that break this (non-breakable) chain
+        do not interrupt the others. Returns the results and the indices of
+        the broken items, whose results are not valid.
+        '''
+        results = list(batch)
+        for data in results:
+            self._drop(data, self._drop_before)
+        active = list(range(len(results)))
+        broken = []
+        for n, link in enumerate(self._links):
+            if isinstance(link, Chain):
+                # nested chains work on their own copies like in __call__
+                # and report the items that broke them, so no link runs
+                # twice for an item
+                output, link_broken = link._apply_batch_masked(
+                        [copy(results[i]) for i in active])
+                link_broken = set(link_broken)
+                remaining = []
+                for k, (i, data) in enumerate(zip(active, output)):
+                    if k not in link_broken:
+                        results[i] = data
+                        remaining.append(i)
+                    elif self.breakable:
+                        results[i] = self.cleanup(results[i])
+                    else:
+                        broken.append(i)
+                active = remaining
+                self._drop_dead(results, active, n)
+                continue
+            if link.vectorized:
+                # Links only update an item after a successful calculation,
+                # so a break of a vectorized link left the batch untouched
+                try:
+                    output = link._apply_batch(
+                            [results[i] for i in active])
+                except BreakChainException:
+                    # find out which items break by evaluating them one by one
+                    pass
+                else:
+                    for i, data in zip(active, output):
+                        results[i] = data
+                    self._drop_dead(results, active, n)
+                    continue
+            remaining = []
+            for i in active:
+                try:
+                    results[i] = link._apply_batch([results[i]])[0]
+                except BreakChainException:
+                    if self.breakable:
+                        results[i] = self.cleanup(results[i])
+                    else:
+                        broken.append(i)
+                else:
+                    remaining.append(i)
+            active = remaining
+            self._drop_dead(results, active, n)
+        return results, sorted(broken)
+
+    def _drop_dead(self, results, active, n):
+        if self._drop_after is not None:
+            for i in active:
+                self._drop(results[i], self._drop_after[n])
+
+    def compile(self, threads=None, outputs=None):
+        '''
+        Flatten the chain into a CompiledChain with the same results and
+        less overhead per evaluation, see dalek.tools.compiled. If outputs
+        is given, the chain is pruned to them first.
+        '''
+        from dalek.tools.compiled import CompiledChain
+        if outputs is None:
+            return CompiledChain(self, threads=threads)
+        return CompiledChain(self.prune(outputs), threads=threads,
+                             outputs=outputs)
+
     def cleanup(self, input_dict):
         output_dict = dict.fromkeys(self.outputs)
         output_dict.update(input_dict)
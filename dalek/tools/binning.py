@@ -0,0 +1,203 @@
+import numpy as np
+from astropy import units as u
+
+from dalek.tools.base import value_in
+
+
+class WavelengthBinning(object):
+    '''
+    Histogram packets given by their frequency into wavelength bins.
+
+    The wavelength edges are converted to frequency once, so the packets are
+    binned on their raw frequencies without a unit conversion per packet.
+    The bins follow the np.histogram convention in wavelength: all bins are
+    half-open except the last one, which includes its upper edge.
+
+    Parameters
+    -----
+        wavelength_edges: array or Quantity
+            monotonically increasing bin edges, Angstrom if no unit is given
+    '''
+
+    def __init__(self, wavelength_edges):
+        edges = u.Quantity(wavelength_edges, u.angstrom).value
+        if np.any(np.diff(edges) <= 0):
+            raise ValueError('the wavelength edges have to be increasing')
+        self.n_bins = len(edges) - 1
+        # increasing frequencies, _nu_edges[k] belongs to edges[n_bins - k]
+        self._nu_edges = u.Quantity(edges[::-1], u.angstrom).to(
+                u.Hz, u.spectral()).value
+
+    def bin_index(self, nu):
+        '''
+        Wavelength bin of every packet, -1 or n_bins if it is outside.
+
+        Parameters
+        -----
+            nu: array or Quantity
+                packet frequencies, Hz if no unit is given
+        '''
+        nu = value_in(nu, u.Hz)
+        # _nu_edges[j - 1] < nu <= _nu_edges[j] is wavelength bin n_bins - j
+        j = self._nu_edges.searchsorted(nu, side='left')
+        j[nu == self._nu_edges[0]] = 1
+        return self.n_bins - j
+
+    def histogram(self, nu, weights=None):
+        '''
+        Weighted sums and counts of the packets in every bin.
+
+        Returns
+        -----
+            sums, counts: arrays of length n_bins (sums is None without
+            weights)
+        '''
+        index = self.bin_index(nu)
+        mask = (index >= 0) & (index < self.n_bins)
+        index = index[mask]
+        counts = np.bincount(index, minlength=self.n_bins)
+        if weights is None:
+            return None, counts
+        sums = np.bincount(index, weights=np.asarray(weights)[mask],
+                           minlength=self.n_bins)
+        return sums, counts
+
+    def histogram_batch(self, nus, weights):
+        '''
+        Histogram the packets of several items in one pass.
+
+        The packets are concatenated and every packet is shifted into the bin
+        range of its item, so a single bincount yields the whole
+        (items x bins) array.
+
+        Returns
+        -----
+            sums, counts: arrays of shape (len(nus), n_bins)
+        '''
+        sizes = [len(nu) for nu in nus]
+        n_items = len(sizes)
+        index = self.bin_index(np.concatenate([value_in(nu, u.Hz)
+                                               for nu in nus]))
+        weights = np.concatenate([np.asarray(w) for w in weights])
+        item = np.repeat(np.arange(n_items), sizes)
+        mask = (index >= 0) & (index < self.n_bins)
+        index = item[mask] * self.n_bins + index[mask]
+        shape = (n_items, self.n_bins)
+        counts = np.bincount(index, minlength=n_items * self.n_bins)
+        sums = np.bincount(index, weights=weights[mask],
+                           minlength=n_items * self.n_bins)
+        return sums.reshape(shape), counts.reshape(shape)
+
+
+class SpectrumAccumulator(object):
+    '''
+    Fold chunks of packets into the sums and counts of a WavelengthBinning,
+    so that the packets never have to be held in memory at once.
+    '''
+
+    def __init__(self, binning):
+        self.binning = binning
+        self.reset()
+
+    def reset(self):
+        self.sums = np.zeros(self.binning.n_bins)
+        self.counts = np.zeros(self.binning.n_bins, dtype=np.int64)
+        self.no_of_packets = 0
+
+    def add(self, nu, energy):
+        sums, counts = self.binning.histogram(nu, energy)
+        self.sums += sums
+        self.counts += counts
+        self.no_of_packets += len(nu)
+
+    def add_chunks(self, chunks):
+        for nu, energy in chunks:
+            self.add(nu, energy)
+        return self
+
+
+def iter_packets(runner, virtual=True, chunksize=2**16):
+    '''
+    Iterate over the packets of a runner in chunks of plain arrays of
+    frequency (Hz) and luminosity (erg/s).
+
+    Runners that generate their packets on the fly provide
+    iter_virtual_packets / iter_packets(chunksize) themselves. For the
+    others the chunks are taken from the packet arrays, so only one chunk is
+    converted at a time.
+
+    Parameters
+    -----
+        runner: tardis.montecarlo.MontecarloRunner or compatible
+        virtual: bool
+            virtual packets (default) or the real emitted packets
+        chunksize: int
+    '''
+    method = 'iter_virtual_packets' if virtual else 'iter_packets'
+    if hasattr(runner, method):
+        for chunk in getattr(runner, method)(chunksize):
+            yield chunk
+        return
+    if virtual:
+        nu = runner.virt_packet_nus
+        energy = runner.virt_packet_energies
+        scale = 1. / value_in(runner.time_of_simulation, u.s)
+        energy_unit = None
+    else:
+        nu = runner.emitted_packet_nu
+        energy = runner.emitted_packet_luminosity
+        scale = 1.
+        energy_unit = u.erg / u.s
+    for start in range(0, len(nu), chunksize):
+        chunk_energy = energy[start:start + chunksize]
+        if energy_unit is not None:
+            chunk_energy = value_in(chunk_energy, energy_unit)
+        yield (value_in(nu[start:start + chunksize], u.Hz),
+               np.asarray(chunk_energy) * scale)
+
+
+class DummyRunner(object):
+    '''
+    Stands in for a MontecarloRunner with no_of_packets virtual packets of
+    random frequency and energy.
+
+    The packets are drawn from seeded generators, so iter_virtual_packets
+    can produce them chunk by chunk without ever holding all of them, and
+    virt_packet_nus / virt_packet_energies return the same packets as full
+    arrays.
+    '''
+
+    def __init__(self, nu_min, nu_max, time_of_simulation,
+                 no_of_packets=100000, seed=None):
+        self.nu_min = nu_min
+        self.nu_max = nu_max
+        self.time_of_simulation = time_of_simulation
+        self.no_of_packets = no_of_packets
+        if seed is None:
+            seed = np.random.randint(2**31 - 1)
+        self.seed = seed
+
+    def _random_states(self):
+        return (np.random.RandomState(self.seed),
+                np.random.RandomState(self.seed + 1))
+
+    def iter_virtual_packets(self, chunksize):
+        time_of_simulation = getattr(
+                self.time_of_simulation, 'value', self.time_of_simulation)
+        nu_state, energy_state = self._random_states()
+        for start in range(0, self.no_of_packets, chunksize):
+            size = min(chunksize, self.no_of_packets - start)
+            yield (self._nu(nu_state.random_sample(size)),
+                   energy_state.random_sample(size) / time_of_simulation)
+
+    def _nu(self, x):
+        return x * (self.nu_max - self.nu_min) + self.nu_min
+
+    @property
+    def virt_packet_nus(self):
+        return self._nu(
+                self._random_states()[0].random_sample(self.no_of_packets))
+
+    @property
+    def virt_packet_energies(self):
+        return self._random_states()[1].random_sample(self.no_of_packets)
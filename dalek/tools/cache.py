@@ -0,0 +1,199 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from astropy import units as u
+
+# The attributes of a TARDIS run that downstream links and
+# MetaInformation.from_wrapper read, by the model attribute holding them
+SNAPSHOT_ATTRIBUTES = {
+        'model': ('t_inner', 't_rads', 'ws'),
+        'runner': ('virt_packet_nus', 'virt_packet_energies',
+                   'time_of_simulation', 'emitted_packet_nu',
+                   'emitted_packet_luminosity'),
+        'spectrum': ('luminosity_density_lambda',),
+        'spectrum_virtual': ('luminosity_density_lambda',),
+        }
+
+
+def _canonical(value):
+    try:
+        return float(value).hex()
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+def parameter_hash(parameters, salt=''):
+    '''
+    A hash of a parameter dictionary that does not depend on the order of
+    the items or on the type of the numbers (float, numpy.float64, ...).
+    '''
+    h = hashlib.sha1(salt.encode('utf-8'))
+    for k in sorted(parameters):
+        h.update('{}={};'.format(k, _canonical(parameters[k])).encode('utf-8'))
+    return h.hexdigest()
+
+
+class _Namespace(object):
+    pass
+
+
+def _collect(model):
+    arrays = {}
+    units = {}
+    for group, attributes in SNAPSHOT_ATTRIBUTES.items():
+        source = model if group == 'model' else getattr(model, group, None)
+        for attribute in attributes:
+            try:
+                value = getattr(source, attribute)
+            except AttributeError:
+                continue
+            name = '{}.{}'.format(group, attribute)
+            try:
+                units[name] = value.unit.to_string()
+                value = value.value
+            except AttributeError:
+                units[name] = None
+            arrays[name] = np.asarray(value)
+    return arrays, units
+
+
+class ModelSnapshot(object):
+    '''
+    The parts of a Radial1DModel that downstream links use.
+
+    It has the same attributes as the model (t_inner, t_rads, ws,
+    runner.virt_packet_nus, spectrum.luminosity_density_lambda, ...) and
+    can be handed on instead of it.
+    '''
+
+    def __init__(self, arrays, units=None):
+        self.runner = _Namespace()
+        units = units or {}
+        for name, value in arrays.items():
+            unit = units.get(name)
+            if unit is not None:
+                value = u.Quantity(value, unit)
+            group, attribute = name.split('.')
+            if group == 'model':
+                target = self
+            else:
+                target = getattr(self, group, None)
+                if target is None:
+                    target = _Namespace()
+                    setattr(self, group, target)
+            setattr(target, attribute, value)
+
+    @classmethod
+    def from_model(cls, model):
+        return cls(*_collect(model))
+
+    @property
+    def arrays(self):
+        return _collect(self)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.arrays[0].values())
+
+
+class MemoryCache(object):
+    '''
+    Keep the maxsize most recently used snapshots in memory.
+    '''
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._store = OrderedDict()
+
+    def get(self, key):
+        try:
+            value = self._store.pop(key)
+        except KeyError:
+            return None
+        self._store[key] = value
+        return value
+
+    def set(self, key, snapshot):
+        self._store.pop(key, None)
+        self._store[key] = snapshot
+        while len(self._store) > self.maxsize:
+            self._store.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._store
+
+    def __len__(self):
+        return len(self._store)
+
+
+class DiskCache(object):
+    '''
+    Store snapshots as .npz files in a directory.
+
+    If the files take more than max_bytes the least recently used ones are
+    removed. The directory can be shared by several processes and survives
+    restarts.
+    '''
+
+    def __init__(self, directory, max_bytes=10 * 1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _fname(self, key):
+        return os.path.join(self.directory, '{}.npz'.format(key))
+
+    def get(self, key):
+        fname = self._fname(key)
+        try:
+            with np.load(fname) as data:
+                units = json.loads(str(data['__units__']))
+                arrays = dict((k, data[k]) for k in data.files
+                              if k != '__units__')
+        except (IOError, OSError):
+            return None
+        # the modification time marks the last use for the eviction
+        try:
+            os.utime(fname, None)
+        except OSError:
+            # removed by the eviction of another process in the meantime
+            return None
+        return ModelSnapshot(arrays, units)
+
+    def set(self, key, snapshot):
+        arrays, units = snapshot.arrays
+        arrays['__units__'] = np.array(json.dumps(units))
+        tmp_fname = os.path.join(
+                self.directory, '.{}.{}.tmp'.format(key, os.getpid()))
+        with open(tmp_fname, 'wb') as fh:
+            np.savez(fh, **arrays)
+        os.rename(tmp_fname, self._fname(key))
+        self._evict()
+
+    def _evict(self):
+        files = []
+        for fname in os.listdir(self.directory):
+            if not fname.endswith('.npz'):
+                continue
+            path = os.path.join(self.directory, fname)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def __contains__(self, key):
+        return os.path.exists(self._fname(key))
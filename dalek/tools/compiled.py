@@ -0,0 +1,283 @@
+from copy import copy
+from multiprocessing.pool import ThreadPool
+
+from dalek.tools.base import Chainable, Link, Chain, BreakChainException
+
+# marks slots that no link has written yet
+_MISSING = object()
+
+
+def _function(method):
+    # the function of an unbound method in Python 2, unchanged in Python 3
+    return getattr(method, '__func__', method)
+
+
+class _Step(object):
+    '''
+    One link of the flattened chain. On a BreakChainException the slots are
+    reset to their values before the step rollback (if it is not None),
+    execution continues at the stage break_to, after the slots in cleanup
+    that are still missing are set to None. break_to is None if the
+    exception is not caught.
+
+    The link is called through _apply only if its class overrides _apply
+    or a profiler was active when the chain was compiled. Otherwise its
+    calculate method is called with the input slots directly.
+    '''
+    __slots__ = ('link', 'inputs', 'outputs', 'break_to', 'cleanup',
+                 'release', 'rollback', 'run')
+
+    def __init__(self, link, inputs, outputs):
+        self.link = link
+        self.inputs = inputs
+        self.outputs = outputs
+        self.break_to = None
+        self.cleanup = ()
+        self.release = ()
+        self.rollback = None
+        if (Chainable.profiler is not None or
+                _function(type(link)._apply) is not _function(Link._apply)):
+            self.run = self._run_apply
+        else:
+            self.run = self._run_calculate
+
+    def _run_calculate(self, slots):
+        output = self.link.calculate(*[slots[i] for i in self.inputs])
+        if len(self.outputs) == 1:
+            return [output]
+        if len(self.outputs) == 0:
+            return ()
+        if len(output) != len(self.outputs):
+            raise ValueError(
+                    "{} is expected to return {} but actual value was {}".format(
+                        self.link.__class__.__name__, self.link.outputs,
+                        str(output)))
+        return output
+
+    def _run_apply(self, slots):
+        link = self.link
+        data = link._apply(dict(zip(link.inputs,
+                                    [slots[i] for i in self.inputs])))
+        return [data[k] for k in link.outputs]
+
+
+class CompiledChain(object):
+    '''
+    A Chain flattened into a list of links that read and write a list of
+    slots instead of dictionaries.
+
+    The graph is validated when the chain is compiled. An evaluation only
+    fills the slots from the input dictionary, calls the calculate method of every
+    link with its input slots and stores the results in its output slots.
+    Links that override _apply, and all links of a chain compiled while a
+    Profiler is active, are called through _apply with a dictionary of
+    their inputs instead.
+    A BreakChainException jumps to the end of the innermost breakable chain
+    and sets its missing outputs to None, like Chain.cleanup. As in Chain,
+    the outputs of an interrupted non-breakable subchain are discarded: the
+    slots are saved when such a subchain starts and restored on a break.
+
+    With threads > 1 consecutive links that do not depend on each other are
+    evaluated concurrently on a thread pool and their results are committed
+    in the order of the chain. Links without outputs (like CheckPrior) are
+    treated as guards and never run concurrently with the links after them,
+    so an expensive link is not started before the guard has passed. If a
+    link breaks, the results of the later links of its stage are discarded.
+
+    Parameters
+    -----
+        chain: Chain
+        threads: int
+            number of threads for independent links (default: sequential)
+        outputs: sequence of strings
+            only return these keys and release every other slot after the
+            last link that reads it
+    '''
+
+    def __init__(self, chain, threads=None, outputs=None):
+        self.inputs = set(chain.inputs)
+        self.outputs = set(chain.outputs if outputs is None else outputs)
+        self.slots = {}
+        self._steps = []
+        self._flatten(chain)
+        self._inputs = sorted(self.inputs)
+        self._keys = sorted(self.slots, key=self.slots.get)
+        self._saved_before = set(s.rollback for s in self._steps
+                                 if s.rollback is not None)
+        self._selected = outputs is not None
+        if self._selected:
+            self._plan_release()
+        concurrent = threads is not None and threads > 1
+        self._stages = self._plan(concurrent)
+        self._pool = ThreadPool(threads) if concurrent else None
+
+    def _slot(self, key):
+        try:
+            return self.slots[key]
+        except KeyError:
+            self.slots[key] = len(self.slots)
+            return self.slots[key]
+
+    def _flatten(self, chainable):
+        if isinstance(chainable, Chain):
+            start = len(self._steps)
+            subchains = []
+            for child in chainable._links:
+                child_start = len(self._steps)
+                self._flatten(child)
+                if isinstance(child, Chain):
+                    subchains.append((child_start, len(self._steps)))
+            if chainable.breakable:
+                # a break in a subchain discards all its outputs
+                for begin, end in subchains:
+                    for step in self._steps[begin:end]:
+                        if step.break_to is None:
+                            step.rollback = begin
+                cleanup = tuple(self._slot(k) for k in chainable.outputs)
+                for step in self._steps[start:]:
+                    if step.break_to is None:
+                        step.break_to = len(self._steps)
+                        step.cleanup = cleanup
+            return
+        if not isinstance(chainable, Link):
+            raise TypeError('Only Links and Chains can be compiled, not {}'
+                            .format(chainable.__class__.__name__))
+        self._steps.append(_Step(
+            chainable,
+            tuple(self._slot(k) for k in chainable.inputs),
+            tuple(self._slot(k) for k in chainable.outputs)))
+
+    def _plan_release(self):
+        last_read = {}
+        for n, step in enumerate(self._steps):
+            for i in step.inputs:
+                last_read[i] = n
+        keep = set(self.slots[k] for k in self.outputs)
+        for i, n in last_read.items():
+            if i not in keep:
+                self._steps[n].release += (i,)
+
+    def _plan(self, concurrent):
+        '''
+        Group the steps into stages. A stage ends before a step that reads
+        an output of the stage, after a guard, at the boundaries of
+        breakable chains so that breaks jump to a stage and before the
+        subchains whose slots are saved. Without concurrency every step is
+        a stage of its own.
+        '''
+        targets = set(s.break_to for s in self._steps)
+        targets.update(self._saved_before)
+        stages = []
+        stage = []
+        written = set()
+        for i, step in enumerate(self._steps):
+            if stage and (not concurrent or i in targets or
+                          step.break_to != stage[-1].break_to or
+                          written.intersection(step.inputs)):
+                stages.append(stage)
+                stage = []
+                written = set()
+            stage.append(step)
+            written.update(step.outputs)
+            if not step.outputs:
+                stages.append(stage)
+                stage = []
+                written = set()
+        if stage:
+            stages.append(stage)
+        # translate step indices of the break targets to stage indices
+        first_stage = {}
+        index = 0
+        for n, stage in enumerate(stages):
+            first_stage[index] = n
+            index += len(stage)
+        first_stage[index] = len(stages)
+        self._stage_starts = sorted(first_stage)
+        for step in self._steps:
+            if step.break_to is not None:
+                step.break_to = first_stage[step.break_to]
+        return stages
+
+    def __call__(self, data={}):
+        for key in self._inputs:
+            if key not in data:
+                raise ValueError(
+                        "Inputs required are: {}\n Data provides only: {}".format(
+                            str(self.inputs), str(data)))
+        slots = [data.get(key, _MISSING) for key in self._keys]
+        if self._pool is None:
+            self._run_steps(slots)
+        else:
+            self._run_stages(slots)
+        if self._selected:
+            return dict((k, slots[self.slots[k]]) for k in self.outputs)
+        result = copy(data)
+        for key, value in zip(self._keys, slots):
+            if value is not _MISSING:
+                result[key] = value
+        return result
+
+    @staticmethod
+    def _break(step, slots, saved, exception):
+        if step.break_to is None:
+            raise exception
+        if step.rollback is not None:
+            slots[:] = saved[step.rollback]
+        for i in step.cleanup:
+            if slots[i] is _MISSING:
+                slots[i] = None
+        return step.break_to
+
+    def _run_steps(self, slots):
+        # without concurrency every stage holds a single step
+        steps = self._steps
+        saved = {}
+        n = 0
+        while n < len(steps):
+            if n in self._saved_before:
+                saved[n] = list(slots)
+            step = steps[n]
+            n += 1
+            try:
+                output = step.run(slots)
+            except BreakChainException as e:
+                n = self._break(step, slots, saved, e)
+                continue
+            for i, value in zip(step.outputs, output):
+                slots[i] = value
+            for i in step.release:
+                slots[i] = _MISSING
+
+    def _run_stages(self, slots):
+        def run(step):
+            try:
+                return step.run(slots)
+            except BreakChainException as e:
+                return e
+        saved = {}
+        n = 0
+        while n < len(self._stages):
+            if self._stage_starts[n] in self._saved_before:
+                saved[self._stage_starts[n]] = list(slots)
+            stage = self._stages[n]
+            n += 1
+            if len(stage) == 1:
+                results = [run(stage[0])]
+            else:
+                results = self._pool.map(run, stage)
+            for step, output in zip(stage, results):
+                if isinstance(output, BreakChainException):
+                    n = self._break(step, slots, saved, output)
+                    break
+                for i, value in zip(step.outputs, output):
+                    slots[i] = value
+                for i in step.release:
+                    slots[i] = _MISSING
+
+    def map(self, batch):
+        return [self(data) for data in batch]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
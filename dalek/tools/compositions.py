@@ -7,28 +7,56 @@ from dalek.tools.posterior import Posterior
 from dalek.tools.providers import (
         VirtualPacketProvider,
         VirtualLuminosity,
+        BinnedPacketProvider,
         Flux,
         RunInfo
         )
 from dalek.tools.likelihood import SSum
+from dalek.wrapper.tardis_wrapper import TardisWrapper
 
 
 class SimpleTardis(Chain):
+    '''
+    Posterior of a TARDIS model given an observed spectrum.
 
-    def __init__(self, wrapper, observed_wl, observed_flux, distance=(1 * u.Mpc)):
+    With fast=True the virtual packets are passed on as plain arrays in CGS
+    units. The units of the observed spectrum and the distance are converted
+    once here. With streaming=True the virtual packets are binned in chunks
+    straight from the runner and only the binned spectrum is passed on.
+    '''
+
+    def __init__(self, wrapper, observed_wl, observed_flux, distance=(1 * u.Mpc),
+                 fast=False, streaming=False):
         # Make sure we are dealing with bin edges, not centers
         assert len(observed_wl) == len(observed_flux) + 1
+        links = [CheckPrior(), Tardis(wrapper)]
+        if streaming:
+            links.append(BinnedPacketProvider(observed_wl, fast=fast))
+        else:
+            links.extend([
+                VirtualPacketProvider(fast=fast),
+                VirtualLuminosity(observed_wl, fast=fast),
+                ])
+        links.extend([
+            Flux(distance, fast=fast),
+            SSum(observed_wl, observed_flux, fast=fast),
+            ])
         super(SimpleTardis, self).__init__(
                 RunInfo(),
                 Prior(),
-                Chain(
-                    CheckPrior(),
-                    Tardis(wrapper),
-                    VirtualPacketProvider(),
-                    VirtualLuminosity(observed_wl),
-                    Flux(distance),
-                    SSum(observed_wl, observed_flux),
-                    breakable=True
-                    ),
+                Chain(*links, breakable=True),
                 Posterior(),
                 )
+
+
+def build_simple_tardis(config_fname, observed_wl, observed_flux,
+                        distance=(1 * u.Mpc), log_dir='./logs/', fast=False,
+                        streaming=False):
+    '''
+    Build a TardisWrapper and a SimpleTardis chain around it. Meant as the
+    factory of a dalek.tools.parallel.ParallelChain, so that each worker
+    reads the configuration and the atomic data only once.
+    '''
+    wrapper = TardisWrapper(config_fname, log_dir=log_dir)
+    return SimpleTardis(wrapper, observed_wl, observed_flux, distance=distance,
+                        fast=fast, streaming=streaming)
@@ -1,6 +1,7 @@
 import numpy as np
+from scipy import linalg
 
-from dalek.tools.base import Link
+from dalek.tools.base import Link, stack, value_in, _same_unit
 
 
 # class BaseLikelihoodModel(object):
@@ -23,11 +24,231 @@ from dalek.tools.base import Link
 #         properties_dict = dict(transformed_params=transformed_params)
 #         return loglikelihood, properties_dict
 
+class BaseLikelihood(object):
+    '''
+    Log likelihood of model spectra given an observed spectrum.
+
+    The observed arrays are sliced to index, stripped of their units and
+    made contiguous once, and all terms that only depend on them are
+    precomputed. Calling the object evaluates one model flux, `batch` an
+    (items x bins) array or a list of model fluxes at once. The work buffers
+    are reused between calls, so an instance must not be shared between
+    threads.
+
+    Parameters
+    -----
+        observed_flux: array or Quantity
+        observed_uncertainty: array or Quantity
+        index: slice
+            part of the spectrum to compare
+        unit: astropy.units.Unit
+            unit of the plain arrays (default: the unit of observed_flux).
+            Model fluxes with units are converted to it, plain ones are
+            assumed to be in it.
+    '''
+
+    def __init__(self, observed_flux, observed_uncertainty=None,
+                 index=slice(None), unit=None):
+        if unit is None:
+            unit = getattr(observed_flux, 'unit', None)
+        self.unit = unit
+        self.index = index
+        self.observed_flux = self._prepare(observed_flux)
+        if observed_uncertainty is None:
+            self.observed_uncertainty = None
+        else:
+            self.observed_uncertainty = self._prepare(observed_uncertainty)
+        self._buffers = {}
+
+    def _values(self, values):
+        if self.unit is None:
+            return np.asarray(values, dtype=float)
+        return value_in(values, self.unit)
+
+    def _prepare(self, values):
+        return np.ascontiguousarray(self._values(values)[..., self.index],
+                                    dtype=float)
+
+    def _buffer(self, name, shape):
+        try:
+            buffer = self._buffers[name]
+        except KeyError:
+            buffer = None
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape)
+        return buffer
+
+    def _residual(self, flux):
+        residual = self._buffer('residual', flux.shape)
+        np.subtract(flux, self.observed_flux, out=residual)
+        return residual
+
+    def _model(self, values):
+        if isinstance(values, (list, tuple)):
+            values = stack(values)
+        return self._values(values)[..., self.index]
+
+    def __call__(self, flux, uncertainty=None):
+        flux = self._model(flux)[np.newaxis]
+        if uncertainty is not None:
+            uncertainty = self._model(uncertainty)[np.newaxis]
+        return self._evaluate(flux, uncertainty)[0]
+
+    def batch(self, flux, uncertainty=None):
+        flux = self._model(flux)
+        if uncertainty is not None:
+            uncertainty = self._model(uncertainty)
+        return self._evaluate(flux, uncertainty)
+
+    def _evaluate(self, flux, uncertainty):
+        raise NotImplementedError
+
+
+class SquaredDifference(BaseLikelihood):
+    '''
+    -0.5 * sum((observed - model)**2), ignoring all uncertainties.
+    '''
+
+    def _evaluate(self, flux, uncertainty):
+        residual = self._residual(flux)
+        np.multiply(residual, residual, out=residual)
+        return -0.5 * residual.sum(axis=1)
+
+
+class Gaussian(BaseLikelihood):
+    '''
+    Independent Gaussian uncertainties. The variance is the observed one
+    plus, if given, the squared model uncertainty.
+    '''
+
+    def __init__(self, observed_flux, observed_uncertainty, index=slice(None),
+                 unit=None):
+        super(Gaussian, self).__init__(
+                observed_flux, observed_uncertainty, index=index, unit=unit)
+        self._variance = self.observed_uncertainty**2
+        self._inverse_variance = 1. / self._variance
+
+    def _evaluate(self, flux, uncertainty):
+        residual = self._residual(flux)
+        np.multiply(residual, residual, out=residual)
+        if uncertainty is None:
+            return -0.5 * residual.dot(self._inverse_variance)
+        variance = self._buffer('variance', flux.shape)
+        np.multiply(uncertainty, uncertainty, out=variance)
+        variance += self._variance
+        residual /= variance
+        return -0.5 * residual.sum(axis=1)
+
+
+class GaussianCovariance(BaseLikelihood):
+    '''
+    Correlated Gaussian uncertainties with the covariance matrix of the
+    observed spectrum (in unit**2). The residuals are whitened with the
+    inverse Cholesky factor, which is computed once.
+    '''
+
+    def __init__(self, observed_flux, covariance, index=slice(None),
+                 unit=None):
+        super(GaussianCovariance, self).__init__(
+                observed_flux, index=index, unit=unit)
+        covariance = np.asarray(getattr(covariance, 'value', covariance),
+                                dtype=float)[index, index]
+        cholesky = linalg.cholesky(covariance, lower=True)
+        self._whitening = np.ascontiguousarray(linalg.solve_triangular(
+            cholesky, np.eye(len(cholesky)), lower=True).T)
+
+    def _evaluate(self, flux, uncertainty):
+        whitened = self._residual(flux).dot(self._whitening)
+        np.multiply(whitened, whitened, out=whitened)
+        return -0.5 * whitened.sum(axis=1)
+
+
+class StudentT(BaseLikelihood):
+    '''
+    Student-t distributed residuals with dof degrees of freedom, scaled by
+    the observed uncertainty. Less sensitive to single bad bins than the
+    Gaussian.
+    '''
+
+    def __init__(self, observed_flux, observed_uncertainty, dof=4.,
+                 index=slice(None), unit=None):
+        super(StudentT, self).__init__(
+                observed_flux, observed_uncertainty, index=index, unit=unit)
+        self.dof = dof
+        self._scale = 1. / (dof * self.observed_uncertainty**2)
+
+    def _evaluate(self, flux, uncertainty):
+        residual = self._residual(flux)
+        np.multiply(residual, residual, out=residual)
+        residual *= self._scale
+        np.log1p(residual, out=residual)
+        return -0.5 * (self.dof + 1) * residual.sum(axis=1)
+
+
+class NormalizedShape(BaseLikelihood):
+    '''
+    Gaussian likelihood of the shape of the spectrum only: every model flux
+    is scaled by the amplitude that fits the observed spectrum best, so the
+    absolute flux calibration (and distance) do not matter.
+    '''
+
+    def __init__(self, observed_flux, observed_uncertainty, index=slice(None),
+                 unit=None):
+        super(NormalizedShape, self).__init__(
+                observed_flux, observed_uncertainty, index=index, unit=unit)
+        self._inverse_variance = 1. / self.observed_uncertainty**2
+        self._weighted_observed = self.observed_flux * self._inverse_variance
+        self._observed_chi2 = self.observed_flux.dot(self._weighted_observed)
+
+    def _evaluate(self, flux, uncertainty):
+        # chi2 of the best amplitude a = sum(f o w) / sum(f f w)
+        cross = flux.dot(self._weighted_observed)
+        square = self._buffer('square', flux.shape)
+        np.multiply(flux, flux, out=square)
+        norm = square.dot(self._inverse_variance)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            explained = np.where(norm > 0, cross**2 / norm, 0.)
+        return -0.5 * (self._observed_chi2 - explained)
+
+
+class Likelihood(Link):
+    '''
+    Link evaluating a BaseLikelihood on the model flux.
+    '''
+    inputs = ('flux',)
+    outputs = ('loglikelihood',)
+    vectorized = True
+
+    plain_units = {}
+
+    def __init__(self, likelihood):
+        self.likelihood = likelihood
+
+    def accepts(self, key, unit):
+        # Quantities are converted, plain arrays have to be in the unit of
+        # the likelihood
+        return (unit is None or self.likelihood.unit is None or
+                _same_unit(unit, self.likelihood.unit))
+
+    def calculate(self, flux):
+        return self.likelihood(flux)
+
+    def calculate_batch(self, flux):
+        return self.likelihood.batch(flux)
+
+
 class SSum(Link):
+    '''
+    Sum of squared differences to the observed flux.
+
+    With fast=True the flux is a plain array in erg / (s Angstrom cm2) and
+    the log likelihood a float.
+    '''
     inputs = ('flux',)
     outputs = ('loglikelihood',)
+    vectorized = True
 
-    def __init__(self, wl, flux, start=0, end=np.inf):
+    def __init__(self, wl, flux, start=0, end=np.inf, fast=False):
         if len(wl) == len(flux) + 1:
             # convert bin edges to bin centers
             wl = (wl[1:] + wl[:-1]) / 2
@@ -36,9 +257,25 @@ class SSum(Link):
                 wl.searchsorted(end) + 1
                 )
         self._observed_flux = flux.to('erg / ( Angstrom cm2 s )')
+        self.fast = fast
+        self._kernel = SquaredDifference(self._observed_flux, index=self._slice)
+        self._unit = self._observed_flux.unit**2
+
+    @property
+    def plain_units(self):
+        return {'flux': self._kernel.unit} if self.fast else {}
+
+    def accepts(self, key, unit):
+        # Quantities are converted in both modes
+        return unit is None or _same_unit(unit, self._kernel.unit)
 
     def calculate(self, flux):
-        return -0.5 * np.sum(
-                (self._observed_flux[self._slice] -
-                flux[self._slice])**2)
+        if self.fast:
+            return self._kernel(flux)
+        return self._kernel(flux) * self._unit
+
+    def calculate_batch(self, flux):
+        if self.fast:
+            return self._kernel.batch(flux)
+        return self._kernel.batch(flux) * self._unit
 
@@ -1,9 +1,14 @@
+import logging
 import numpy as np
 
 from dalek.tools.base import Link
+from dalek.tools.binning import DummyRunner
+from dalek.tools.cache import ModelSnapshot, MemoryCache, parameter_hash
 from dalek.wrapper.tardis_wrapper import TardisWrapper
 from astropy import units as u
 
+logger = logging.getLogger(__name__)
+
 class DummyException(Exception):
     pass
 
@@ -23,11 +28,50 @@ class Tardis(Link):
     def calculate(self, parameters, uuid):
 
         def apply_config(config):
-            for k, v in parameters.items():
-                config.set_config_item(k, v)
-            return config
+            return self._wrapper.config_paths.apply(config, parameters)
+
+        mdl = self._wrapper(apply_config, log_name=uuid,
+                            parameters=parameters,
+                            changed_paths=list(parameters))
+        return mdl
+
+
+class CachedTardis(Tardis):
+    '''
+    A Tardis link that looks up the outputs of previous evaluations before
+    running the simulation.
 
-        mdl = self._wrapper(apply_config, log_name=uuid)
+    The key is a hash of the parameters and the configuration file, so
+    results of a different setup are never reused. On a hit a ModelSnapshot
+    with the quantities needed by the downstream links is returned and the
+    Monte Carlo run is skipped entirely. The snapshot also becomes the model
+    of the wrapper, so MetaInformation.from_wrapper records the cached
+    results.
+
+    Parameters
+    -----
+        wrapper: TardisWrapper
+        cache: dalek.tools.cache.MemoryCache or DiskCache
+            (default: MemoryCache())
+    '''
+
+    def __init__(self, wrapper, cache=None):
+        super(CachedTardis, self).__init__(wrapper)
+        self.cache = cache if cache is not None else MemoryCache()
+        self.hits = 0
+        self.misses = 0
+
+    def calculate(self, parameters, uuid):
+        key = parameter_hash(parameters, self._wrapper.config_hash)
+        snapshot = self.cache.get(key)
+        if snapshot is not None:
+            self.hits += 1
+            logger.debug('Cache hit for %s', key)
+            self._wrapper.model = snapshot
+            return snapshot
+        self.misses += 1
+        mdl = super(CachedTardis, self).calculate(parameters, uuid)
+        self.cache.set(key, ModelSnapshot.from_model(mdl))
         return mdl
 
 
@@ -35,13 +79,15 @@ class DummyTardis(Link):
     inputs = ('parameters', 'uuid',)
     outputs = ('model',)
 
-    def __init__(self, wrapper):
+    def __init__(self, wrapper, no_of_packets=100000, seed=None):
         if not isinstance(wrapper, TardisWrapper):
             raise ValueError(
                     "expected an instance of TardisWrapper, got: {}".format(
                         str(type(wrapper)))
                     )
         self._wrapper = wrapper
+        self.no_of_packets = no_of_packets
+        self._random_state = np.random.RandomState(seed)
 
     def calculate(self, parameters, uuid):
 
@@ -55,18 +101,15 @@ class DummyTardis(Link):
             return config
 
         try:
-            mdl = self._wrapper(apply_config, log_name=uuid)
+            self._wrapper(apply_config, log_name=uuid)
         except DummyException:
-            class DummyObject(object):
-                pass
-            mdl = DummyObject()
-            mdl.runner = lambda: DummyObject()
-        setattr(
-                mdl.runner, 'virt_packet_nus',
-                np.random.random(100000) *
-                (values['nu_max'] - values['nu_min']) + values['nu_min'])
-        setattr(
-                mdl.runner, 'virt_packet_energies',
-                np.random.random(100000))
-        setattr(mdl.runner, 'time_of_simulation', values['tos'])
+            pass
+
+        class DummyObject(object):
+            pass
+        mdl = DummyObject()
+        mdl.runner = DummyRunner(
+                values['nu_min'], values['nu_max'], values['tos'],
+                no_of_packets=self.no_of_packets,
+                seed=self._random_state.randint(2**31 - 2))
         return mdl
@@ -0,0 +1,358 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import namedtuple
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+try:
+    from multiprocessing import SimpleQueue
+except ImportError:
+    from multiprocessing.queues import SimpleQueue
+
+logger = logging.getLogger(__name__)
+
+# The chain of the current worker process, built once by _initialize_worker
+_worker_chain = None
+# Queue of the AsyncScheduler for the (index, pid) of every started task
+_worker_started = None
+
+
+def _initialize_worker(factory, args, kwargs, started=None):
+    global _worker_chain, _worker_started
+    _worker_chain = factory(*args, **kwargs)
+    _worker_started = started
+
+
+def _evaluate(task):
+    index, data, outputs = task
+    result = _worker_chain(data)
+    if outputs is not None:
+        result = dict((k, result.get(k)) for k in outputs)
+    return index, result
+
+
+Evaluation = namedtuple('Evaluation', ['index', 'uuid', 'iteration', 'output',
+                                       'error', 'wall_time', 'worker'])
+
+
+def _evaluate_async(task):
+    index, data, outputs = task
+    if _worker_started is not None:
+        _worker_started.put((index, os.getpid()))
+    start = time.time()
+    uuid = iteration = output = error = None
+    try:
+        output = _worker_chain(data)
+    except Exception as e:
+        error = e
+    else:
+        uuid = output.get('uuid')
+        iteration = output.get('iteration')
+        if outputs is not None:
+            output = dict((k, output.get(k)) for k in outputs)
+    return Evaluation(index, uuid, iteration, output, error,
+                      time.time() - start, os.getpid())
+
+
+class ParallelChain(object):
+    '''
+    Evaluate a Chain for a batch of inputs on a pool of worker processes.
+
+    Every worker calls factory(*args, **kwargs) once when it starts and keeps
+    the returned chain for its whole life. Expensive state like the
+    TardisWrapper with its configuration and AtomData is therefore only set
+    up once per worker and not once per evaluation.
+
+    Parameters
+    -----
+        factory: callable
+            Returns the Chain to evaluate, e.g. a function building a
+            TardisWrapper and a SimpleTardis chain around it.
+        processes: int
+            Number of worker processes (default: number of cores)
+        outputs: sequence of strings
+            Only send these keys of the output dictionary back. Large objects
+            like the Radial1DModel are expensive or impossible to pickle and
+            should not be sent back to the calling process.
+    '''
+
+    def __init__(self, factory, args=(), kwargs=None, processes=None,
+                 outputs=None):
+        self.outputs = outputs
+        self._pool = multiprocessing.Pool(
+                processes,
+                initializer=_initialize_worker,
+                initargs=self._initargs(factory, args, kwargs or {}))
+
+    def _initargs(self, factory, args, kwargs):
+        return factory, args, kwargs
+
+    def imap_unordered(self, batch):
+        '''
+        Evaluate the batch and yield (index, output) tuples in the order the
+        evaluations finish.
+        '''
+        tasks = ((i, data, self.outputs) for i, data in enumerate(batch))
+        return self._pool.imap_unordered(_evaluate, tasks)
+
+    def map(self, batch):
+        '''
+        Evaluate the batch and return the outputs in the order of the inputs.
+        '''
+        batch = list(batch)
+        results = [None] * len(batch)
+        for i, result in self.imap_unordered(batch):
+            results[i] = result
+        return results
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self._pool.terminate()
+            self._pool.join()
+
+
+class AsyncScheduler(ParallelChain):
+    '''
+    Evaluate single inputs on a pool of worker processes and collect the
+    results in the order they finish.
+
+    Unlike map, which waits for the slowest evaluation of a batch, every
+    evaluation is handed to the pool as soon as it is submitted and every
+    result is available as soon as its worker is done, so samplers that do
+    not need synchronous batches can keep all workers busy (see stream).
+    Results are Evaluation tuples with the index of the submission, the uuid
+    and iteration from RunInfo (None if the chain has no RunInfo), the
+    output dictionary, the exception if the evaluation failed, the wall time
+    and the pid of the worker.
+
+    With asyncio, future(data) returns an asyncio future of the Evaluation.
+
+    Evaluations that fail outside of the chain are delivered as well, with
+    the exception as error: a result that can not be pickled (send only
+    picklable outputs back) or a worker that died during the evaluation.
+    A thread checks for them every poll_interval seconds.
+
+    Parameters
+    -----
+        See ParallelChain
+        poll_interval: float
+            seconds
+    '''
+
+    def __init__(self, factory, args=(), kwargs=None, processes=None,
+                 outputs=None, poll_interval=0.1):
+        self._started = SimpleQueue()
+        super(AsyncScheduler, self).__init__(factory, args, kwargs, processes,
+                                             outputs)
+        self.processes = processes or multiprocessing.cpu_count()
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._results = Queue()
+        self._callbacks = {}
+        self._async_results = {}
+        self._workers = {}
+        self._uncollected = 0
+        self.submitted = 0
+        self.finished = 0
+        self._busy_time = 0.
+        self._start = time.time()
+        self._lost = False
+        self._closed = threading.Event()
+        self._watcher = threading.Thread(target=self._watch)
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def _initargs(self, factory, args, kwargs):
+        return factory, args, kwargs, self._started
+
+    def submit(self, data, callback=None):
+        '''
+        Queue an evaluation and return its index. Without a callback the
+        result is delivered by get / results, otherwise callback(evaluation)
+        is called from the result thread of the pool.
+        '''
+        with self._lock:
+            index = self.submitted
+            self.submitted += 1
+            if callback is None:
+                self._uncollected += 1
+            else:
+                self._callbacks[index] = callback
+            # under the lock, so the watcher never sees the index before
+            # its result
+            self._async_results[index] = self._pool.apply_async(
+                    _evaluate_async, ((index, data, self.outputs),),
+                    callback=self._finish)
+        return index
+
+    def _finish(self, evaluation):
+        with self._lock:
+            if self._async_results.pop(evaluation.index, None) is None:
+                # already delivered as failed
+                return
+            self._workers.pop(evaluation.index, None)
+            self.finished += 1
+            if evaluation.wall_time is not None:
+                self._busy_time += evaluation.wall_time
+            callback = self._callbacks.pop(evaluation.index, None)
+        if callback is None:
+            self._results.put(evaluation)
+            return
+        try:
+            callback(evaluation)
+        except Exception:
+            # the result thread of the pool must not die
+            logger.exception('Callback of evaluation %d failed',
+                             evaluation.index)
+
+    def _watch(self):
+        '''
+        Deliver the evaluations that failed in the pool instead of the chain.
+        '''
+        suspects = set()
+        while not self._closed.wait(self.poll_interval):
+            while not self._started.empty():
+                index, pid = self._started.get()
+                with self._lock:
+                    if index in self._async_results:
+                        self._workers[index] = pid
+            alive = set(p.pid for p in self._pool._pool
+                        if p.exitcode is None)
+            failed = []
+            dead = set()
+            with self._lock:
+                for index, result in self._async_results.items():
+                    worker = self._workers.get(index)
+                    if result.ready():
+                        if not result.successful():
+                            try:
+                                result.get(0)
+                            except Exception as e:
+                                failed.append((index, e))
+                        continue
+                    if worker is None or worker in alive:
+                        continue
+                    # the result of a worker that finished and exited may
+                    # still be on its way, so wait for one more poll
+                    if index in suspects:
+                        self._lost = True
+                        failed.append((index, RuntimeError(
+                            'worker {} died'.format(worker))))
+                    else:
+                        dead.add(index)
+            suspects = dead
+            for index, error in failed:
+                logger.error('Evaluation %d failed in the pool: %s', index,
+                             error)
+                self._finish(Evaluation(index, None, None, None, error,
+                                        None, self._workers.get(index)))
+
+    @property
+    def pending(self):
+        '''
+        Evaluations submitted and not finished yet.
+        '''
+        return self.submitted - self.finished
+
+    @property
+    def queue_depth(self):
+        '''
+        Evaluations waiting for a free worker.
+        '''
+        return max(self.pending - self.processes, 0)
+
+    @property
+    def utilization(self):
+        '''
+        Fraction of the worker time since the start spent on evaluations.
+        '''
+        elapsed = time.time() - self._start
+        return self._busy_time / (self.processes * elapsed) if elapsed else 0.
+
+    def stats(self):
+        return {'submitted': self.submitted, 'finished': self.finished,
+                'pending': self.pending, 'queue_depth': self.queue_depth,
+                'utilization': self.utilization}
+
+    def get(self, timeout=None):
+        '''
+        Next finished evaluation submitted without a callback. Raises
+        queue.Empty after timeout seconds.
+        '''
+        # a timeout keeps the wait interruptible on Python 2
+        evaluation = self._results.get(
+                timeout=timeout if timeout is not None else 1e9)
+        with self._lock:
+            self._uncollected -= 1
+        return evaluation
+
+    def results(self):
+        '''
+        Yield the evaluations submitted without a callback until all of
+        them are collected.
+        '''
+        while self._uncollected:
+            yield self.get()
+
+    def stream(self, propose, n_evaluations, in_flight=None):
+        '''
+        Keep in_flight evaluations (default: one per worker) running and
+        yield them as they finish. propose(evaluation) returns the next
+        input after evaluation has finished, propose(None) is used for the
+        initial inputs.
+        '''
+        in_flight = in_flight or self.processes
+        submitted = 0
+        for _ in range(min(in_flight, n_evaluations)):
+            self.submit(propose(None))
+            submitted += 1
+        for _ in range(n_evaluations):
+            evaluation = self.get()
+            if submitted < n_evaluations:
+                self.submit(propose(evaluation))
+                submitted += 1
+            yield evaluation
+
+    def close(self):
+        if self._lost:
+            # the pool would wait for the results of the dead workers
+            self._pool.terminate()
+            self._pool.join()
+        else:
+            super(AsyncScheduler, self).close()
+        self._closed.set()
+
+    def __exit__(self, type, value, traceback):
+        super(AsyncScheduler, self).__exit__(type, value, traceback)
+        self._closed.set()
+
+    def future(self, data, loop=None):
+        '''
+        Submit an evaluation and return an asyncio future of its Evaluation.
+        '''
+        import asyncio
+        loop = loop or asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def resolve(evaluation):
+            if not future.cancelled():
+                future.set_result(evaluation)
+
+        self.submit(data, lambda evaluation: loop.call_soon_threadsafe(
+            resolve, evaluation))
+        return future
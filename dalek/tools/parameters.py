@@ -1,6 +1,10 @@
 import numpy as np
 
 
+def _linear(x, a, b):
+    return a + x * (b-a)
+
+
 class Parameter(object):
     """
     A static Parameter whose value can't be changed.
@@ -41,7 +45,7 @@ class DynamicParameter(Parameter):
     """
 
     def __init__(self, *args, **kwargs):
-        self._ftransform = kwargs.pop('transformation', lambda x, a, b : a + x * (b-a))
+        self._ftransform = kwargs.pop('transformation', _linear)
         self._bounds = kwargs.pop('bounds', (0,1))
         super(DynamicParameter, self).__init__(*args, **kwargs)
 
@@ -111,6 +115,18 @@ class OverFlowParameter(DependentParameter):
 
 
 class ParameterContainer(object):
+    """
+    Parameters in a fixed order with their values held in a NumPy array.
+
+    The bounds and transformations of the DynamicParameters and the members
+    of every OverFlowParameter group are collected once, so a whole batch of
+    inputs can be transformed at once with `transform` and parameters are
+    looked up by path in a dictionary.
+
+    OverFlowParameters subtract the dynamic and static parameters with
+    their match string as base path. Other DependentParameters are updated
+    one row at a time with their update method.
+    """
     n_pars=0
 
     def __init__(self, *args, **kwargs):
@@ -126,27 +142,115 @@ class ParameterContainer(object):
                     self._input_pars.append(arg)
                 elif isinstance(arg, DependentParameter):
                     self._dep_pars.append(arg)
+        self._index = dict(
+                (p.path, i) for i, p in enumerate(self._parameters))
+        self._values = np.array([p._value for p in self._parameters],
+                                dtype=float)
+        self._input_index = np.array(
+                [self._index[p.path] for p in self._input_pars], dtype=int)
+        self._lower = np.array([p._bounds[0] for p in self._input_pars],
+                               dtype=float)
+        self._upper = np.array([p._bounds[1] for p in self._input_pars],
+                               dtype=float)
+        # columns with their own transformation, the rest are linear
+        self._custom = [(n, p._ftransform)
+                        for n, p in enumerate(self._input_pars)
+                        if p._ftransform is not _linear]
+        self._groups = []
+        for p in self._dep_pars:
+            if isinstance(p, OverFlowParameter):
+                members = [i for i, q in enumerate(self._parameters)
+                           if q is not p and q.base_path == p._match_string and
+                           not isinstance(q, DependentParameter)]
+                self._groups.append((self._index[p.path], p._bounds,
+                                     np.array(members, dtype=int)))
+
+    @property
+    def paths(self):
+        return [p.path for p in self._parameters]
+
+    @property
+    def input_paths(self):
+        return [p.path for p in self._input_pars]
+
+    def transform(self, inputs):
+        """
+        Values of all parameters for a batch of inputs.
+
+        Parameters
+        ----------
+        inputs: array of shape (n, number of DynamicParameters)
+            values in [0, 1], rows with inputs outside of it get NaN for the
+            affected and dependent parameters
+
+        Returns
+        -------
+        array of shape (n, number of parameters)
+        """
+        inputs = np.atleast_2d(np.asarray(inputs, dtype=float))
+        if inputs.shape[1] != len(self._input_pars):
+            raise ValueError('expected {} inputs, got {}'.format(
+                len(self._input_pars), inputs.shape[1]))
+        with np.errstate(invalid='ignore'):
+            physical = _linear(inputs, self._lower, self._upper)
+            for n, function in self._custom:
+                physical[:, n] = function(inputs[:, n], self._lower[n],
+                                          self._upper[n])
+            physical[(inputs < 0) | (inputs > 1)] = np.nan
+        values = np.repeat(self._values[np.newaxis], len(inputs), axis=0)
+        values[:, self._input_index] = physical
+        for i, bounds, members in self._groups:
+            value = np.full(len(values), bounds[1], dtype=float)
+            for j in members:
+                value = value - values[:, j]
+            with np.errstate(invalid='ignore'):
+                value[~((value > bounds[0]) & (value < bounds[1]))] = np.nan
+            values[:, i] = value
+        if len(self._groups) < len(self._dep_pars):
+            self._update_dependent(values)
+        return values
+
+    def _update_dependent(self, values):
+        groups = set(i for i, _, _ in self._groups)
+        dependent = [p for p in self._dep_pars
+                     if self._index[p.path] not in groups]
+        current = self._values.copy()
+        for row in values:
+            self._store(row)
+            for p in dependent:
+                p.value = self
+                row[self._index[p.path]] = p._value
+        self._store(current)
+
+    def _store(self, values):
+        self._values = values
+        for p, v in zip(self._parameters, values):
+            p._value = v
+
+    def dicts(self, values):
+        """
+        One {path: value} dictionary per row of values.
+        """
+        paths = self.paths
+        return [dict(zip(paths, row)) for row in np.asarray(values).tolist()]
 
     @property
     def values(self):
-        return [ p.value for p in self._parameters]
+        return self._values.tolist()
 
     @values.setter
     def values(self, new):
         assert len(new) == len(self._input_pars)
-        for p, v in zip(self._input_pars, new):
-            p.value = v
-        for p in self._dep_pars:
-            p.value = self
+        self._store(self.transform([new])[0])
 
     def __iter__(self):
         for p in self._parameters:
             yield p.path, p.value
 
     def __getitem__(self, name):
-        for p in self._parameters:
-            if p.path == name:
-                return p.value
+        i = self._index.get(name)
+        if i is not None:
+            return self._parameters[i].value
 
     def items(self):
         for p in self._parameters:
@@ -1,15 +1,26 @@
+import numpy as np
+
 from dalek.tools.base import Link
 
 
 class Posterior(Link):
     inputs = ('logprior', 'loglikelihood',)
     outputs = ('posterior',)
+    vectorized = True
 
     def calculate(self, prior, likelihood):
         try:
-            return prior + likelihood.value
-        except (TypeError, AttributeError) as e:
+            return prior + getattr(likelihood, 'value', likelihood)
+        except TypeError as e:
             if likelihood is None:
                 return prior
             else:
                 raise e
+
+    def calculate_batch(self, prior, likelihood):
+        # likelihood is None for items that broke out of their chain
+        likelihood = np.array(
+                [0. if l is None else getattr(l, 'value', l)
+                    for l in likelihood],
+                dtype=float)
+        return np.asarray(prior, dtype=float) + likelihood
@@ -5,33 +5,221 @@ from dalek.tools.base import Link, BreakChainException
 INVALID = -np.inf
 DEFAULT = 0.0
 
-class Prior(Link):
+class Distribution(object):
     '''
-    A very basic prior with the ability to break execution of a subchain.
+    Prior distribution of a single parameter. Values outside of [lower,
+    upper] (or (lower, upper) if strict) are invalid.
+
+    Subclasses list the attributes their kernel needs in `parameters`. The
+    kernel receives the values of all parameters with the same kind of
+    distribution as an (n, k) array and their attributes as arrays of length
+    k and returns the summed log density of every row. Without a kernel the
+    density is flat.
+    '''
+    parameters = ()
+    kernel = None
+
+    def __init__(self, lower=-np.inf, upper=np.inf, strict=False):
+        self.lower = lower
+        self.upper = upper
+        self.strict = strict
+
+
+class Bounds(Distribution):
+    '''
+    Flat (improper) prior within the bounds.
+    '''
+
+
+class Uniform(Distribution):
+    parameters = ('lower', 'upper',)
+
+    def __init__(self, lower, upper):
+        super(Uniform, self).__init__(lower, upper)
+
+    @staticmethod
+    def kernel(x, lower, upper):
+        return np.full(len(x), -np.sum(np.log(upper - lower)))
+
+
+class LogUniform(Distribution):
+    parameters = ('lower', 'upper',)
+
+    def __init__(self, lower, upper):
+        super(LogUniform, self).__init__(lower, upper)
+
+    @staticmethod
+    def kernel(x, lower, upper):
+        return -np.sum(np.log(x), axis=1) - np.sum(np.log(np.log(
+            upper / lower)))
+
+
+class Normal(Distribution):
+    '''
+    Normal distribution, optionally truncated (not renormalized).
+    '''
+    parameters = ('mean', 'sigma',)
+
+    def __init__(self, mean, sigma, lower=-np.inf, upper=np.inf):
+        super(Normal, self).__init__(lower, upper)
+        self.mean = mean
+        self.sigma = sigma
+
+    @staticmethod
+    def kernel(x, mean, sigma):
+        return (-0.5 * np.sum(((x - mean) / sigma)**2, axis=1) -
+                np.sum(np.log(sigma * np.sqrt(2 * np.pi))))
+
+
+class Inequality(object):
+    '''
+    Constraint smaller <= larger (smaller < larger if strict) between two
+    parameters.
+    '''
+
+    def __init__(self, smaller, larger, strict=False):
+        self.smaller = smaller
+        self.larger = larger
+        self.strict = strict
+
+
+class _CompiledPrior(object):
+    '''
+    The declarations of a ParameterPrior for a fixed order of parameter
+    names, as index arrays, bound arrays and one kernel call per kind of
+    distribution. Declarations of parameters that are not in names are
+    left out.
+    '''
+
+    def __init__(self, names, distributions, constraints):
+        index = dict((name, i) for i, name in enumerate(names))
+        declared = [(index[name], d) for name, d in sorted(
+            distributions.items()) if name in index]
+        self.columns = np.array([i for i, _ in declared], dtype=int)
+        self.lower = np.array([d.lower for _, d in declared], dtype=float)
+        self.upper = np.array([d.upper for _, d in declared], dtype=float)
+        self.strict = np.array([d.strict for _, d in declared], dtype=bool)
+        kinds = {}
+        for i, d in declared:
+            if d.kernel is not None:
+                kinds.setdefault(type(d), []).append((i, d))
+        self.kernels = []
+        for kind, group in kinds.items():
+            attributes = dict(
+                    (name, np.array([getattr(d, name) for _, d in group],
+                                    dtype=float))
+                    for name in kind.parameters)
+            self.kernels.append((kind.kernel,
+                                 np.array([i for i, _ in group], dtype=int),
+                                 attributes))
+        self.constraints = [(index[c.smaller], index[c.larger], c.strict)
+                            for c in constraints
+                            if c.smaller in index and c.larger in index]
+
+    def mask(self, values):
+        valid = ~np.isnan(values).any(axis=1)
+        x = values[:, self.columns]
+        with np.errstate(invalid='ignore'):
+            valid &= np.all(np.where(self.strict, x > self.lower,
+                                     x >= self.lower), axis=1)
+            valid &= np.all(np.where(self.strict, x < self.upper,
+                                     x <= self.upper), axis=1)
+            for i, j, strict in self.constraints:
+                if strict:
+                    valid &= values[:, i] < values[:, j]
+                else:
+                    valid &= values[:, i] <= values[:, j]
+        return valid
+
+    def score(self, values):
+        valid = self.mask(values)
+        logprior = np.zeros(len(values))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for kernel, columns, attributes in self.kernels:
+                logprior += kernel(values[:, columns], **attributes)
+        return np.where(valid, DEFAULT + logprior, INVALID)
+
+
+class ParameterPrior(Link):
+    '''
+    Prior declared by the distributions of single parameters and
+    inequality constraints between them.
+
+    The declarations are compiled once per set of parameter names into
+    bound masks and one vectorized kernel per kind of distribution, so a
+    whole batch of proposals is scored in one call (see score). Proposals
+    with NaN parameters, values outside of the bounds or a violated
+    constraint get INVALID. Declarations of parameters that are not
+    proposed are ignored.
+
+        ParameterPrior({'model.abundances.o': Uniform(0., 0.5),
+                        'model.v_inner': Normal(1e9, 1e8, lower=0.)},
+                       [Inequality('model.abundances.s',
+                                   'model.abundances.si')])
+
+    Parameters
+    -----
+        distributions: dict
+            parameter path -> Distribution
+        constraints: sequence of Inequality
     '''
     inputs = ('parameters',)
     outputs = ('logprior',)
+    vectorized = True
 
-    def calculate(self, parameters):
-        for p,v in parameters.items():
-            if np.isnan(v):
-                return INVALID
+    def __init__(self, distributions=None, constraints=()):
+        self.distributions = dict(distributions or {})
+        self.constraints = list(constraints)
+        self._compiled = {}
+
+    def compile(self, names):
+        names = tuple(names)
         try:
-            o = parameters['model.abundances.o']
+            return self._compiled[names]
         except KeyError:
-            pass
-        else:
-            if o <= 0.:
-                return INVALID
+            compiled = self._compiled[names] = _CompiledPrior(
+                    names, self.distributions, self.constraints)
+            return compiled
+
+    def score(self, values, names):
+        '''
+        Log prior of every row of values, an (n, len(names)) array.
+        '''
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        return self.compile(names).score(values)
+
+    def mask(self, values, names):
+        '''
+        True for the rows of values that are within the prior support.
+        '''
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        return self.compile(names).mask(values)
+
+    def calculate(self, parameters):
+        names = sorted(parameters)
+        return float(self.score([[parameters[n] for n in names]], names)[0])
+
+    def calculate_batch(self, parameters):
+        names = sorted(parameters[0])
+        if any(len(p) != len(names) for p in parameters):
+            return [self.calculate(p) for p in parameters]
         try:
-            s = parameters['model.abundances.s']
-            si = parameters['model.abundances.si']
+            values = [[p[n] for n in names] for p in parameters]
         except KeyError:
-            pass
-        else:
-            if s > si:
-                return INVALID
-        return DEFAULT
+            return [self.calculate(p) for p in parameters]
+        return self.score(values, names)
+
+
+class Prior(ParameterPrior):
+    '''
+    A very basic prior with the ability to break execution of a subchain:
+    oxygen has to be present and there can't be more sulfur than silicon.
+    '''
+
+    def __init__(self):
+        super(Prior, self).__init__(
+                {'model.abundances.o': Bounds(lower=0., strict=True)},
+                [Inequality('model.abundances.s', 'model.abundances.si')])
 
 
 class CheckPrior(Link):
@@ -0,0 +1,200 @@
+"""
+Timing of the links of a chain. While a Profiler is active, every call of a
+Chainable and every calculate of a Link is measured; without an active
+profiler the only cost is a check of Chainable.profiler per call.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from dalek.tools.base import Chainable, Chain
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    _cpu_time = time.process_time
+except AttributeError:
+    _cpu_time = time.clock
+
+COLUMNS = ['evaluation', 'uuid', 'path', 'name', 'depth', 'wall_time',
+           'cpu_time', 'calculate_time', 'overhead', 'peak_memory']
+
+
+class _Frame(object):
+    __slots__ = ('chainable', 'path', 'children', 'calculate', 'peak')
+
+    def __init__(self, chainable, path):
+        self.chainable = chainable
+        self.path = path
+        self.children = 0.
+        self.calculate = 0.
+        self.peak = 0
+
+
+class Profiler(object):
+    '''
+    Record wall time, CPU time and peak memory of every link per evaluation.
+
+        with Profiler() as profiler:
+            chain(data)
+        profiler.summary()
+
+    For links, calculate_time is the time spent in calculate and overhead
+    the rest of the call (copying and checking the dictionary). For chains,
+    overhead is the time not spent in their links. Links evaluated by
+    Chain.map appear with their calculate time only. Every call that is not
+    nested in another one starts a new evaluation; its uuid is taken from
+    the output of RunInfo if there is one.
+
+    Parameters
+    -----
+        memory: bool
+            trace the peak allocation of every call with tracemalloc
+            (Python 3 only, slows the evaluation down)
+    '''
+
+    def __init__(self, memory=False):
+        self.memory = memory and tracemalloc is not None
+        self.evaluation = 0
+        self._records = []
+        self._uuids = {}
+        self._stack = []
+        self._started_tracing = False
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        Chainable.profiler = self
+        return self
+
+    def stop(self):
+        Chainable.profiler = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def _enter(self, chainable):
+        if not self._stack:
+            self.evaluation += 1
+        parent = self._stack[-1].path + '/' if self._stack else ''
+        frame = _Frame(chainable, parent + chainable.__class__.__name__)
+        self._stack.append(frame)
+        if self.memory:
+            frame.peak = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            start_memory = frame.peak
+        else:
+            start_memory = None
+        return frame, time.time(), _cpu_time(), start_memory
+
+    def _exit(self, frame, wall_start, cpu_start, start_memory, calculate):
+        wall_time = time.time() - wall_start
+        cpu_time = _cpu_time() - cpu_start
+        self._stack.pop()
+        peak_memory = np.nan
+        if self.memory:
+            peak = max(tracemalloc.get_traced_memory()[1], frame.peak)
+            peak_memory = peak - start_memory
+        if self._stack:
+            parent = self._stack[-1]
+            parent.children += wall_time
+            if self.memory:
+                parent.peak = max(parent.peak, peak)
+        if calculate:
+            frame.calculate = wall_time
+            overhead = 0.
+        elif isinstance(frame.chainable, Chain):
+            overhead = wall_time - frame.children
+        else:
+            overhead = wall_time - frame.calculate
+        self._records.append((
+            self.evaluation, frame.path, frame.chainable.__class__.__name__,
+            len(self._stack), wall_time, cpu_time, frame.calculate, overhead,
+            peak_memory))
+
+    def measure(self, chainable, function, *args):
+        '''
+        Call function(*args) as a call of chainable.
+        '''
+        state = self._enter(chainable)
+        try:
+            result = function(*args)
+        finally:
+            self._exit(*state, calculate=False)
+        if not self._stack and isinstance(result, dict) and 'uuid' in result:
+            self._uuids[self.evaluation] = str(result['uuid'])
+        return result
+
+    def calculate(self, link, function, *args):
+        '''
+        Call the calculate method of link. Inside a measured call of the same
+        link only its duration is noted, otherwise it is recorded on its own.
+        '''
+        if self._stack and self._stack[-1].chainable is link:
+            frame = self._stack[-1]
+            start = time.time()
+            try:
+                return function(*args)
+            finally:
+                frame.calculate += time.time() - start
+        state = self._enter(link)
+        try:
+            return function(*args)
+        finally:
+            self._exit(*state, calculate=True)
+
+    def table(self):
+        '''
+        One row per measured call.
+        '''
+        table = pd.DataFrame(self._records, columns=[
+            c for c in COLUMNS if c != 'uuid'])
+        table.insert(1, 'uuid', [self._uuids.get(e, '')
+                                 for e in table['evaluation']])
+        return table
+
+    def summary(self):
+        '''
+        Totals and means per link path, sorted by the total wall time.
+        '''
+        table = self.table()
+        grouped = table.groupby('path')
+        summary = pd.DataFrame({
+            'calls': grouped.size(),
+            'wall_time': grouped['wall_time'].sum(),
+            'mean_wall_time': grouped['wall_time'].mean(),
+            'cpu_time': grouped['cpu_time'].sum(),
+            'overhead': grouped['overhead'].sum(),
+            'peak_memory': grouped['peak_memory'].max(),
+            })
+        total = table.loc[table['depth'] == 0, 'wall_time'].sum()
+        summary['fraction'] = summary['wall_time'] / total if total else np.nan
+        return summary.sort_values('wall_time', ascending=False)[
+            ['calls', 'wall_time', 'mean_wall_time', 'cpu_time', 'overhead',
+             'fraction', 'peak_memory']]
+
+    def reset(self):
+        self._records = []
+        self._uuids = {}
+
+    def save(self, container, key='profile'):
+        '''
+        Append the recorded calls to the table key of a MetaContainer, next
+        to the run_table, and forget them.
+        '''
+        with container as store:
+            store.append(key, self.table(), index=False,
+                         min_itemsize={'uuid': 36, 'path': 256, 'name': 64})
+        self.reset()
@@ -2,7 +2,15 @@ import numpy as np
 from uuid import uuid4
 from astropy import units as u
 
-from dalek.tools.base import Link
+from dalek.tools.base import Link, stack, value_in
+from dalek.tools.binning import (
+        WavelengthBinning, SpectrumAccumulator, iter_packets)
+
+# Units of the plain arrays in the fast mode
+PACKET_NU_UNIT = u.Hz
+PACKET_ENERGY_UNIT = u.erg / u.s
+LUMINOSITY_UNIT = u.erg / (u.s * u.angstrom)
+FLUX_UNIT = u.erg / (u.s * u.angstrom * u.cm**2)
 
 
 class PacketProvider(Link):
@@ -17,10 +25,32 @@ class PacketProvider(Link):
 
 
 class VirtualPacketProvider(Link):
+    '''
+    Frequencies and luminosities of the virtual packets.
+
+    With fast=True they are plain arrays in Hz and erg/s instead of
+    Quantities, for the fast mode of the following links.
+    '''
     inputs = ('model',)
     outputs = ('virtual_packet_nu', 'virtual_packet_energy',)
 
+    def __init__(self, fast=False):
+        self.fast = fast
+
+    @property
+    def plain_units(self):
+        if not self.fast:
+            return {}
+        return {self.outputs[0]: PACKET_NU_UNIT,
+                self.outputs[1]: PACKET_ENERGY_UNIT}
+
     def calculate(self, model):
+        if self.fast:
+            return (
+                    np.asarray(model.runner.virt_packet_nus, dtype=float),
+                    model.runner.virt_packet_energies /
+                    value_in(model.runner.time_of_simulation, u.s),
+                    )
         return (
                 model.runner.virt_packet_nus * u.Hz,
                 model.runner.virt_packet_energies /
@@ -29,34 +59,123 @@ class VirtualPacketProvider(Link):
 
 
 class Luminosity(Link):
+    '''
+    Luminosity density of the packets in the wavelength bins wl.
+
+    With fast=True the packets are plain arrays in Hz and erg/s and the
+    result is a plain array in erg / (s Angstrom).
+    '''
     inputs = ('packet_nu', 'packet_energy',)
     outputs = ('luminosity',)
+    vectorized = True
 
-    def __init__(self, wl):
+    def __init__(self, wl, fast=False):
         self._wl_bins = wl
+        self._bin_widths = np.diff(wl)
+        self._binning = WavelengthBinning(wl)
+        self.fast = fast
+        self._inverse_bin_widths = 1. / value_in(self._bin_widths, u.angstrom)
+
+    @property
+    def plain_units(self):
+        if not self.fast:
+            return {}
+        return {self.inputs[0]: PACKET_NU_UNIT,
+                self.inputs[1]: PACKET_ENERGY_UNIT,
+                'luminosity': LUMINOSITY_UNIT}
 
     def calculate(self, nu, energy):
-        return (np.histogram(
-            nu.to(u.angstrom, u.spectral()),
-            weights=energy,
-            bins=self._wl_bins)[0] * energy.unit  / np.diff(self._wl_bins)
-            )
+        if self.fast:
+            return (self._binning.histogram(nu, energy)[0] *
+                    self._inverse_bin_widths)
+        luminosity = self._binning.histogram(nu, energy.value)[0]
+        return luminosity * energy.unit / self._bin_widths
+
+    def calculate_batch(self, nu, energy):
+        if self.fast:
+            return (self._binning.histogram_batch(nu, energy)[0] *
+                    self._inverse_bin_widths)
+        unit = energy[0].unit
+        luminosity = self._binning.histogram_batch(
+                nu, [e.to(unit).value for e in energy])[0]
+        return luminosity * unit / self._bin_widths
 
 
 class VirtualLuminosity(Luminosity):
     inputs = ('virtual_packet_nu', 'virtual_packet_energy',)
 
 
+class BinnedPacketProvider(Link):
+    '''
+    Luminosity density of the packets of a model in the wavelength bins wl.
+
+    The packets are read from the runner in chunks and folded into the
+    histogram one chunk at a time, so only the binned spectrum is passed on
+    and the packet arrays are never converted as a whole. The output is the
+    same as that of (Virtual)PacketProvider followed by (Virtual)Luminosity.
+
+    Parameters
+    -----
+        wl: array or Quantity
+            bin edges, Angstrom if no unit is given
+        virtual: bool
+            bin the virtual packets (default) or the real ones
+        chunksize: int
+            packets per chunk
+        fast: bool
+            return a plain array in erg / (s Angstrom)
+    '''
+    inputs = ('model',)
+    outputs = ('luminosity',)
+
+    def __init__(self, wl, virtual=True, chunksize=2**16, fast=False):
+        self._bin_widths = np.diff(wl)
+        self._inverse_bin_widths = 1. / value_in(self._bin_widths, u.angstrom)
+        self._binning = WavelengthBinning(wl)
+        self.virtual = virtual
+        self.chunksize = chunksize
+        self.fast = fast
+
+    @property
+    def plain_units(self):
+        return {'luminosity': LUMINOSITY_UNIT} if self.fast else {}
+
+    def calculate(self, model):
+        accumulator = SpectrumAccumulator(self._binning).add_chunks(
+                iter_packets(model.runner, self.virtual, self.chunksize))
+        if self.fast:
+            return accumulator.sums * self._inverse_bin_widths
+        return accumulator.sums * (u.erg / u.s) / self._bin_widths
+
+
 class Flux(Link):
+    '''
+    Flux at distance. With fast=True the luminosity is a plain array in
+    erg / (s Angstrom) and the flux one in erg / (s Angstrom cm2).
+    '''
     inputs = ('luminosity',)
     outputs = ('flux',)
+    vectorized = True
 
-    def __init__(self, distance=(1 * u.Mpc)):
+    def __init__(self, distance=(1 * u.Mpc), fast=False):
         self._distance = distance.to('cm')
+        self.fast = fast
+        self._inverse_area = 1. / (4 * np.pi * self._distance.value**2)
+
+    @property
+    def plain_units(self):
+        if not self.fast:
+            return {}
+        return {'luminosity': LUMINOSITY_UNIT, 'flux': FLUX_UNIT}
 
     def calculate(self, lum):
+        if self.fast:
+            return lum * self._inverse_area
         return lum / (4 * np.pi * self._distance**2)
 
+    def calculate_batch(self, lum):
+        return self.calculate(stack(lum))
+
 
 class RunInfo(Link):
     inputs = tuple()
@@ -0,0 +1,298 @@
+"""
+Affine-invariant ensemble and parallel tempering samplers that evaluate their
+proposals in batches through the map method of a Chain, CompiledChain or
+ParallelChain and checkpoint their state to a MetaContainer.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from dalek.tools.prior import INVALID
+
+logger = logging.getLogger(__name__)
+
+
+class ParallelTemperingSampler(object):
+    '''
+    Ensembles of walkers at the inverse temperatures betas, moved with the
+    stretch move of Goodman & Weare (2010) and swapped between neighbouring
+    temperatures.
+
+    Every step moves one half of the walkers of all temperatures with a
+    single call of evaluator.map, so a ParallelChain keeps all its workers
+    busy, then the other half. The evaluator gets {'parameters': {name:
+    value}} and has to return logprior and loglikelihood (None counts as 0,
+    like in Posterior). The walkers at temperature t sample
+    logprior + betas[t] * loglikelihood.
+
+    With a container, the state of the walkers and of the random number
+    generator is saved every checkpoint_every steps together with the
+    history since the last checkpoint. A new sampler with the same container
+    and name continues from there and produces exactly the steps the
+    original one would have produced.
+
+    Parameters
+    -----
+        evaluator: object with map(batch)
+        names: sequence of strings
+            parameter names
+        n_walkers: int
+            walkers per temperature, even
+        betas: sequence of floats
+            inverse temperatures, the first one should be 1
+        a: float
+            scale of the stretch move
+        seed: int
+        container: dalek.base.meta.MetaContainer
+        name: string
+            group of the checkpoint in the container
+        checkpoint_every: int
+        swap_every: int
+            steps between temperature swaps
+        prior: dalek.tools.prior.ParameterPrior
+            proposals outside of its support are rejected without sending
+            them to the evaluator
+    '''
+
+    def __init__(self, evaluator, names, n_walkers, betas=(1.,), a=2.,
+                 seed=None, container=None, name='sampler',
+                 checkpoint_every=1, swap_every=1, prior=None):
+        if n_walkers % 2:
+            raise ValueError('n_walkers has to be even')
+        self.evaluator = evaluator
+        self.names = list(names)
+        self.n_walkers = n_walkers
+        self.betas = np.asarray(betas, dtype=float)
+        self.a = a
+        self.random_state = np.random.RandomState(seed)
+        self.container = container
+        self.name = name
+        self.checkpoint_every = checkpoint_every
+        self.swap_every = swap_every
+        self.prior = prior
+        self.step = 0
+        self.positions = None
+        self.logprior = None
+        self.loglikelihood = None
+        self.accepted = np.zeros(len(self.betas))
+        self.swaps_accepted = np.zeros(max(len(self.betas) - 1, 0))
+        self.chain = []
+        self._history = []
+
+    @property
+    def shape(self):
+        return len(self.betas), self.n_walkers, len(self.names)
+
+    def _evaluate(self, positions):
+        flat = positions.reshape(-1, len(self.names))
+        logprior = np.full(len(flat), INVALID)
+        loglikelihood = np.zeros(len(flat))
+        if self.prior is None:
+            valid = np.arange(len(flat))
+        else:
+            valid = np.flatnonzero(self.prior.mask(flat, self.names))
+        if len(valid):
+            results = self.evaluator.map(
+                    [{'parameters': dict(zip(self.names, flat[i]))}
+                     for i in valid])
+            logprior[valid] = [r['logprior'] for r in results]
+            loglikelihood[valid] = [
+                    0. if r['loglikelihood'] is None
+                    else getattr(r['loglikelihood'], 'value',
+                                 r['loglikelihood'])
+                    for r in results]
+        return (logprior.reshape(positions.shape[:-1]),
+                loglikelihood.reshape(positions.shape[:-1]))
+
+    def _log_probability(self, logprior, loglikelihood):
+        with np.errstate(invalid='ignore'):
+            log_probability = (logprior +
+                               self.betas[:, np.newaxis] * loglikelihood)
+        log_probability[np.isnan(log_probability)] = -np.inf
+        return log_probability
+
+    def initialize(self, positions):
+        '''
+        Start from positions of shape (n_walkers, parameters), used for all
+        temperatures, or (temperatures, n_walkers, parameters).
+        '''
+        positions = np.array(positions, dtype=float)
+        if positions.ndim == 2:
+            positions = np.repeat(positions[np.newaxis], len(self.betas),
+                                  axis=0)
+        if positions.shape != self.shape:
+            raise ValueError('expected positions of shape {}, got {}'.format(
+                self.shape, positions.shape))
+        self.positions = positions
+        self.logprior, self.loglikelihood = self._evaluate(positions)
+        self.step = 0
+        self._record()
+        self._checkpoint()
+
+    def run(self, n_steps, initial_positions=None):
+        '''
+        Sample until n_steps steps are done in total. Without
+        initial_positions the sampler continues from its checkpoint. The
+        final state is always checkpointed.
+        '''
+        if self.positions is None:
+            if not self.restore():
+                if initial_positions is None:
+                    raise ValueError('no checkpoint found, initial_positions '
+                                     'are required')
+                self.initialize(initial_positions)
+        while self.step < n_steps:
+            self._step()
+        if self._history:
+            self._checkpoint()
+        return self
+
+    def _step(self):
+        n_temperatures, n_walkers, n_dim = self.shape
+        half = n_walkers // 2
+        temperatures = np.arange(n_temperatures)[:, np.newaxis]
+        for active, partner in ((slice(0, half), slice(half, None)),
+                                (slice(half, None), slice(0, half))):
+            walkers = self.positions[:, active]
+            partners = self.positions[:, partner]
+            z = ((self.a - 1.) * self.random_state.uniform(
+                size=(n_temperatures, half)) + 1)**2 / self.a
+            chosen = partners[temperatures,
+                              self.random_state.randint(
+                                  half, size=(n_temperatures, half))]
+            proposal = chosen + z[..., np.newaxis] * (walkers - chosen)
+            logprior, loglikelihood = self._evaluate(proposal)
+            log_ratio = ((n_dim - 1) * np.log(z) +
+                         self._log_probability(logprior, loglikelihood) -
+                         self._log_probability(self.logprior[:, active],
+                                               self.loglikelihood[:, active]))
+            accept = (np.log(self.random_state.uniform(
+                size=(n_temperatures, half))) < log_ratio)
+            self.positions[:, active][accept] = proposal[accept]
+            self.logprior[:, active][accept] = logprior[accept]
+            self.loglikelihood[:, active][accept] = loglikelihood[accept]
+            self.accepted += accept.sum(axis=1)
+        self.step += 1
+        if n_temperatures > 1 and self.step % self.swap_every == 0:
+            self._swap()
+        self._record()
+        if self.step % self.checkpoint_every == 0:
+            self._checkpoint()
+
+    def _swap(self):
+        for t in range(len(self.betas) - 1, 0, -1):
+            hot = self.random_state.permutation(self.n_walkers)
+            cold = self.random_state.permutation(self.n_walkers)
+            with np.errstate(invalid='ignore'):
+                log_ratio = ((self.betas[t - 1] - self.betas[t]) *
+                             (self.loglikelihood[t, hot] -
+                              self.loglikelihood[t - 1, cold]))
+            accept = (np.log(self.random_state.uniform(size=self.n_walkers)) <
+                      log_ratio)
+            hot, cold = hot[accept], cold[accept]
+            for array in (self.positions, self.logprior, self.loglikelihood):
+                array[t, hot], array[t - 1, cold] = (
+                        array[t - 1, cold].copy(), array[t, hot].copy())
+            self.swaps_accepted[t - 1] += accept.sum()
+
+    @property
+    def acceptance_fraction(self):
+        return self.accepted / max(self.step * self.n_walkers, 1)
+
+    def _state_frame(self):
+        n_temperatures, n_walkers, n_dim = self.shape
+        frame = pd.DataFrame(self.positions.reshape(-1, n_dim),
+                             columns=self.names)
+        frame['logprior'] = self.logprior.ravel()
+        frame['loglikelihood'] = self.loglikelihood.ravel()
+        frame['temperature'] = np.repeat(np.arange(n_temperatures), n_walkers)
+        frame['walker'] = np.tile(np.arange(n_walkers), n_temperatures)
+        frame['step'] = self.step
+        return frame
+
+    def _record(self):
+        self.chain.append(self.positions[0].copy())
+        if self.container is not None:
+            self._history.append(self._state_frame())
+
+    def _key(self, name):
+        return '{}/{}'.format(self.name, name)
+
+    def _checkpoint(self):
+        if self.container is None:
+            return
+        _, key, position, has_gauss, cached_gaussian = \
+            self.random_state.get_state()
+        state = pd.Series({
+            'step': self.step,
+            'random_position': position,
+            'random_has_gauss': has_gauss,
+            'random_cached_gaussian': cached_gaussian,
+            })
+        with self.container as store:
+            store.put(self._key('positions'), self._state_frame())
+            store.put(self._key('random_key'), pd.Series(key))
+            store.put(self._key('state'), state)
+            store.put(self._key('betas'), pd.Series(self.betas))
+            store.put(self._key('accepted'), pd.Series(
+                np.concatenate((self.accepted, self.swaps_accepted))))
+            if self._history:
+                store.append(self._key('history'),
+                             pd.concat(self._history, ignore_index=True),
+                             index=False)
+        self._history = []
+        logger.debug('Checkpoint of %s at step %d', self.name, self.step)
+
+    def restore(self):
+        '''
+        Load the last checkpoint. Returns False if there is none.
+        '''
+        if self.container is None:
+            return False
+        with self.container as store:
+            if '/' + self._key('state') not in store.keys():
+                return False
+            frame = store[self._key('positions')]
+            key = store[self._key('random_key')].values
+            state = store[self._key('state')]
+            betas = store[self._key('betas')].values
+            accepted = store[self._key('accepted')].values
+        if not np.array_equal(betas, self.betas):
+            raise ValueError('the checkpoint has the betas {}'.format(betas))
+        frame = frame.sort_values(['temperature', 'walker'])
+        self.positions = frame[self.names].values.reshape(self.shape)
+        self.logprior = frame['logprior'].values.reshape(self.shape[:2])
+        self.loglikelihood = frame['loglikelihood'].values.reshape(
+                self.shape[:2])
+        self.step = int(state['step'])
+        self.random_state.set_state((
+            'MT19937', key.astype(np.uint32), int(state['random_position']),
+            int(state['random_has_gauss']),
+            float(state['random_cached_gaussian'])))
+        self.accepted = accepted[:len(self.betas)].copy()
+        self.swaps_accepted = accepted[len(self.betas):].copy()
+        logger.info('Resuming %s at step %d', self.name, self.step)
+        return True
+
+    def history(self):
+        '''
+        All checkpointed steps as a DataFrame.
+        '''
+        with self.container as store:
+            return store[self._key('history')]
+
+
+class EnsembleSampler(ParallelTemperingSampler):
+    '''
+    Affine-invariant ensemble sampler: a ParallelTemperingSampler with the
+    single inverse temperature 1.
+    '''
+
+    def __init__(self, evaluator, names, n_walkers, a=2., seed=None,
+                 container=None, name='sampler', checkpoint_every=1,
+                 prior=None):
+        super(EnsembleSampler, self).__init__(
+                evaluator, names, n_walkers, betas=(1.,), a=a, seed=seed,
+                container=container, name=name,
+                checkpoint_every=checkpoint_every, prior=prior)
@@ -0,0 +1,376 @@
+"""
+Emulators of the binned spectrum as a function of the parameters, trained on
+previous TARDIS runs, and links that use them to skip the simulation for
+proposals that are clearly bad.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy import linalg
+from scipy.spatial import cKDTree
+
+from dalek.base.meta import MetaInformation
+from dalek.tools.base import Link, value_in
+from dalek.tools.prior import INVALID
+
+logger = logging.getLogger(__name__)
+
+# data item of the binned fluxes that SurrogateUpdate stores in a container
+FLUX_DATA = 'surrogate_flux'
+
+
+class NearestNeighbourEmulator(object):
+    '''
+    Inverse-distance weighted mean of the spectra of the k nearest training
+    points. The parameters are scaled by their range. The uncertainty is the
+    spread of the neighbouring spectra.
+    '''
+
+    def __init__(self, k=5):
+        self.k = k
+
+    def fit(self, parameters, spectra):
+        self._scale = parameters.max(axis=0) - parameters.min(axis=0)
+        self._scale[self._scale == 0] = 1.
+        self._tree = cKDTree(parameters / self._scale)
+        self._spectra = spectra
+        return self
+
+    def predict(self, parameters):
+        '''
+        Returns
+        -----
+            mean, standard deviation: arrays of shape (len(parameters), bins)
+        '''
+        k = min(self.k, len(self._spectra))
+        distance, index = self._tree.query(
+                np.atleast_2d(parameters) / self._scale, k=k)
+        distance = distance.reshape(-1, k)
+        index = index.reshape(-1, k)
+        weights = 1. / np.maximum(distance, 1e-12)
+        weights /= weights.sum(axis=1)[:, np.newaxis]
+        neighbours = self._spectra[index]
+        mean = np.einsum('ij,ijk->ik', weights, neighbours)
+        deviation = neighbours - mean[:, np.newaxis]
+        std = np.sqrt(np.einsum('ij,ijk->ik', weights, deviation**2))
+        return mean, std
+
+
+class PCAGaussianProcessEmulator(object):
+    '''
+    Project the spectra on their first n_components principal components and
+    interpolate every coefficient with a Gaussian process with a squared
+    exponential kernel on the range-scaled parameters.
+
+    Parameters
+    -----
+        n_components: int
+        length_scale: float
+            in units of the parameter ranges (default: median distance
+            between the training points)
+        noise: float
+            relative noise added to the kernel diagonal
+    '''
+
+    def __init__(self, n_components=10, length_scale=None, noise=1e-6):
+        self.n_components = n_components
+        self.length_scale = length_scale
+        self.noise = noise
+
+    def _kernel(self, a, b):
+        d2 = ((a[:, np.newaxis, :] - b[np.newaxis, :, :])**2).sum(axis=2)
+        return np.exp(-0.5 * d2 / self._length_scale**2)
+
+    def fit(self, parameters, spectra):
+        self._offset = parameters.min(axis=0)
+        self._scale = parameters.max(axis=0) - self._offset
+        self._scale[self._scale == 0] = 1.
+        x = (parameters - self._offset) / self._scale
+        self._mean = spectra.mean(axis=0)
+        _, s, vt = linalg.svd(spectra - self._mean, full_matrices=False)
+        n = min(self.n_components, len(s))
+        self._components = vt[:n]
+        coefficients = (spectra - self._mean).dot(self._components.T)
+        if self.length_scale is None:
+            d = np.sqrt(((x[:, np.newaxis] - x[np.newaxis])**2).sum(axis=2))
+            self._length_scale = np.median(d[d > 0]) if np.any(d > 0) else 1.
+        else:
+            self._length_scale = self.length_scale
+        self._coefficient_scale = coefficients.std(axis=0)
+        self._coefficient_scale[self._coefficient_scale == 0] = 1.
+        k = self._kernel(x, x) + self.noise * np.eye(len(x))
+        self._cholesky = linalg.cho_factor(k, lower=True)
+        self._alpha = linalg.cho_solve(
+                self._cholesky, coefficients / self._coefficient_scale)
+        self._x = x
+        return self
+
+    def predict(self, parameters):
+        '''
+        Returns
+        -----
+            mean, standard deviation: arrays of shape (len(parameters), bins)
+        '''
+        x = (np.atleast_2d(parameters) - self._offset) / self._scale
+        k = self._kernel(x, self._x)
+        coefficients = k.dot(self._alpha) * self._coefficient_scale
+        variance = np.maximum(
+                1. - np.sum(k * linalg.cho_solve(self._cholesky, k.T).T,
+                            axis=1), 0.)
+        mean = self._mean + coefficients.dot(self._components)
+        std = np.sqrt(variance[:, np.newaxis] *
+                      (self._coefficient_scale**2).dot(
+                          self._components**2))
+        return mean, std
+
+
+def training_data_from_container(container, names, data_name=FLUX_DATA):
+    '''
+    Read the parameters and spectra of the runs stored in a MetaContainer.
+
+    Parameters
+    -----
+        container: dalek.base.meta.MetaContainer
+        names: sequence of strings
+            parameter columns of the run_table
+        data_name: string
+            data item holding the spectrum. The default is the binned flux
+            stored by SurrogateUpdate, the quantity the surrogate is trained
+            on. The 'spec' of MetaInformation.from_wrapper is a luminosity
+            density on the TARDIS wavelength grid and can not be mixed with
+            it.
+
+    Returns
+    -----
+        parameters, spectra: arrays of shape (runs, len(names)) and
+        (runs, bins)
+    '''
+    with container as store:
+        run_table = store['run_table']
+        # the run_table also lists runs stored without the data item, e.g.
+        # by MetaInformation.from_wrapper
+        if container.storage == 'columnar':
+            stored = store.select('column_index', where="name == '{}'".format(
+                data_name))['uuid']
+            run_table = run_table[run_table['uuid'].isin(stored)]
+        else:
+            run_table = run_table[[
+                'data/{}/{}'.format(uuid, data_name) in store
+                for uuid in run_table['uuid']]]
+    run_table = run_table.drop_duplicates('uuid')
+    uuids = list(run_table['uuid'])
+    parameters = run_table[list(names)].values.astype(float)
+    if container.storage == 'columnar':
+        spectra = container.read_column(data_name, uuids).values
+    else:
+        with container as store:
+            spectra = np.array([
+                store['data/{}/{}'.format(uuid, data_name)].values
+                for uuid in uuids])
+    return parameters, spectra
+
+
+class Surrogate(object):
+    '''
+    Training set and emulator of (parameters -> binned spectrum).
+
+    New runs are added with `add`. The emulator is retrained once
+    retrain_every new runs have arrived. Before a new run is added, its
+    spectrum is predicted, so the errors of the emulator on unseen points are
+    tracked (see `error_summary`).
+
+    Parameters
+    -----
+        emulator: NearestNeighbourEmulator or PCAGaussianProcessEmulator
+        retrain_every: int
+        min_training: int
+            the emulator is not used before it has seen this many runs
+        unit: astropy.units.Unit
+            unit the spectra are stored in
+    '''
+
+    def __init__(self, emulator=None, retrain_every=10, min_training=20,
+                 unit=None):
+        self.emulator = (emulator if emulator is not None
+                         else NearestNeighbourEmulator())
+        self.retrain_every = retrain_every
+        self.min_training = min_training
+        self.unit = unit
+        self.names = None
+        self._parameters = []
+        self._spectra = []
+        self._untrained = 0
+        self.trained = False
+        self.errors = []
+
+    @classmethod
+    def from_container(cls, container, names, data_name=FLUX_DATA, **kwargs):
+        '''
+        A Surrogate trained on the fluxes that a SurrogateUpdate with the
+        same unit stored in container in an earlier campaign.
+        '''
+        surrogate = cls(**kwargs)
+        surrogate.names = tuple(names)
+        parameters, spectra = training_data_from_container(
+                container, surrogate.names, data_name)
+        surrogate._parameters.extend(parameters)
+        surrogate._spectra.extend(spectra)
+        surrogate.train()
+        return surrogate
+
+    def _vector(self, parameters):
+        if self.names is None:
+            self.names = tuple(sorted(parameters))
+        return np.array([parameters[n] for n in self.names], dtype=float)
+
+    def _values(self, spectrum):
+        if self.unit is None:
+            return np.asarray(getattr(spectrum, 'value', spectrum), dtype=float)
+        return value_in(spectrum, self.unit)
+
+    def __len__(self):
+        return len(self._spectra)
+
+    def train(self):
+        if len(self) >= self.min_training:
+            self.emulator.fit(np.array(self._parameters),
+                              np.array(self._spectra))
+            self.trained = True
+        self._untrained = 0
+
+    def add(self, parameters, spectrum):
+        '''
+        Add a run. Returns the spectrum as stored, a plain array in unit.
+        '''
+        vector = self._vector(parameters)
+        spectrum = self._values(spectrum)
+        if self.trained:
+            predicted = self.emulator.predict(vector)[0][0]
+            self.errors.append(
+                    np.sqrt(np.mean((predicted - spectrum)**2)) /
+                    np.sqrt(np.mean(spectrum**2)))
+        self._parameters.append(vector)
+        self._spectra.append(spectrum)
+        self._untrained += 1
+        if self._untrained >= self.retrain_every:
+            self.train()
+        return spectrum
+
+    def predict(self, parameters):
+        '''
+        Predicted spectrum and its uncertainty for a parameter dictionary,
+        (None, None) if the emulator is not trained yet.
+        '''
+        if not self.trained:
+            return None, None
+        mean, std = self.emulator.predict(self._vector(parameters))
+        return mean[0], std[0]
+
+    def error_summary(self, last=None):
+        '''
+        Mean and maximum relative rms error of the predictions for the last
+        runs before they were added.
+        '''
+        errors = np.array(self.errors[-last:] if last else self.errors)
+        if len(errors) == 0:
+            return {'n': 0, 'mean': np.nan, 'max': np.nan}
+        return {'n': len(errors), 'mean': errors.mean(), 'max': errors.max()}
+
+
+class SurrogateScreen(Link):
+    '''
+    Reject proposals whose emulated spectrum is clearly worse than the best
+    runs so far, before TARDIS runs.
+
+    The log likelihood of the predicted spectrum is compared with the best
+    log likelihood of the training runs. If it is more than threshold below,
+    logprior is set to INVALID, so the CheckPrior of the following breakable
+    chain skips the simulation. Proposals are never rejected while the
+    emulator is untrained or if its relative uncertainty is above
+    max_uncertainty.
+
+        Chain(RunInfo(), Prior(), SurrogateScreen(surrogate, likelihood),
+              Chain(CheckPrior(), Tardis(wrapper), ..., Flux(),
+                    SurrogateUpdate(surrogate), SSum(...), breakable=True),
+              Posterior())
+
+    Parameters
+    -----
+        surrogate: Surrogate
+        likelihood: dalek.tools.likelihood.BaseLikelihood
+            evaluated on the predicted spectra
+        threshold: float
+        max_uncertainty: float
+    '''
+    inputs = ('parameters', 'logprior',)
+    outputs = ('logprior', 'surrogate_loglikelihood',)
+
+    def __init__(self, surrogate, likelihood, threshold=100.,
+                 max_uncertainty=0.1):
+        self.surrogate = surrogate
+        self.likelihood = likelihood
+        self.threshold = threshold
+        self.max_uncertainty = max_uncertainty
+        self.rejected = 0
+        self.passed = 0
+        self._reference_size = 0
+        self._reference = -np.inf
+
+    @property
+    def reference(self):
+        '''
+        Best log likelihood of the training runs. Only the runs added since
+        the last call are evaluated.
+        '''
+        if self._reference_size < len(self.surrogate):
+            spectra = np.array(self.surrogate._spectra[self._reference_size:])
+            self._reference = max(self._reference,
+                                  np.max(self.likelihood.batch(spectra)))
+            self._reference_size = len(self.surrogate)
+        return self._reference
+
+    def calculate(self, parameters, logprior):
+        if logprior == INVALID:
+            return logprior, None
+        mean, std = self.surrogate.predict(parameters)
+        if mean is None:
+            return logprior, None
+        loglikelihood = self.likelihood(mean)
+        uncertainty = np.sqrt(np.mean(std**2) / np.mean(mean**2))
+        if (uncertainty <= self.max_uncertainty and
+                loglikelihood < self.reference - self.threshold):
+            self.rejected += 1
+            logger.debug('Rejected by the surrogate: %s', loglikelihood)
+            return INVALID, loglikelihood
+        self.passed += 1
+        return logprior, loglikelihood
+
+
+class SurrogateUpdate(Link):
+    '''
+    Add the flux of every finished run to the training set of a Surrogate.
+
+    With a container the flux is also stored there, as the plain array in
+    the unit of the surrogate under data_name, together with the run in the
+    run_table. Surrogate.from_container trains on these fluxes in a later
+    campaign. The link then also needs uuid, iteration and rank (RunInfo).
+    '''
+    inputs = ('parameters', 'flux',)
+    outputs = ()
+
+    def __init__(self, surrogate, container=None, data_name=FLUX_DATA):
+        self.surrogate = surrogate
+        self.container = container
+        self.data_name = data_name
+        if container is not None:
+            self.inputs = ('parameters', 'flux', 'uuid', 'iteration', 'rank')
+
+    def calculate(self, parameters, flux, *run_info):
+        values = self.surrogate.add(parameters, flux)
+        if self.container is not None:
+            uuid, iteration, rank = run_info
+            record = MetaInformation(uuid, rank, iteration, np.nan,
+                                     dict(parameters))
+            record.add_data(self.data_name, pd.Series(values))
+            record.save(self.container)
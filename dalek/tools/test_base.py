@@ -45,6 +45,14 @@ class AppleBreak(Link):
         else:
             return False
 
+class AppleGuard(Link):
+    inputs = ['apple']
+    outputs = []
+    def calculate(self, apple):
+        if apple:
+            raise BreakChainException
+
+
 class ApplePie(Link):
     outputs = ['apple', 'pie']
 
@@ -164,3 +172,129 @@ def test_applepie():
 def test_numpy():
     nparray = NumpyReturn()
     assert np.all(nparray()['array'] == np.arange(10))
+
+class Double(Link):
+    inputs = ('array',)
+    outputs = ('double',)
+    vectorized = True
+
+    def calculate(self, array):
+        return 2 * array
+
+    def calculate_batch(self, array):
+        return 2 * np.vstack(array)
+
+
+def test_map(apple, apple_t, banana, cherry_a):
+    chain = Chain(apple_t, cherry_a)
+    batch = [
+            {'apple': False, 'banana': True},
+            {'apple': True, 'banana': True},
+            {'apple': False, 'banana': False},
+            ]
+    assert chain.map(batch) == [chain(data) for data in batch]
+    # inputs are not modified
+    assert batch[0] == {'apple': False, 'banana': True}
+    with pytest.raises(ValueError):
+        chain.map([{'apple': False}])
+
+
+def test_map_vectorized():
+    chain = Chain(NumpyReturn(), Double())
+    result = chain.map([{}, {}])
+    assert len(result) == 2
+    for r in result:
+        assert np.all(r['double'] == 2 * np.arange(10))
+
+
+def test_map_breakable(apple, apple_t, banana):
+    cond = AppleBreak()
+    chain = Chain(Chain(cond, banana, breakable=True), apple_t)
+    batch = [{'apple': True}, {'apple': False}]
+    assert chain.map(batch) == [chain(data) for data in batch]
+    assert chain.map(batch) == [
+            {'apple': False, 'banana': None},
+            {'apple': True, 'banana': True},
+            ]
+    with pytest.raises(BreakChainException):
+        Chain(cond, banana).map(batch)
+    # a non-breakable inner chain breaks the outer breakable one
+    chain = Chain(apple_t, Chain(cond, banana), breakable=True)
+    assert chain.map(batch) == [chain(data) for data in batch]
+
+
+class Record(Link):
+    '''
+    Records the keys of the dictionary it is called with.
+    '''
+    inputs = ('double',)
+    outputs = ('total',)
+
+    def __init__(self):
+        self.seen = []
+
+    def _apply(self, input_dict):
+        self.seen.append(set(input_dict))
+        return super(Record, self)._apply(input_dict)
+
+    def calculate(self, double):
+        return double.sum()
+
+
+def test_prune(apple, apple_t, banana, banana_t, cherry_a):
+    guard = AppleGuard()
+    chain = Chain(apple, banana, apple_t, guard, banana_t, cherry_a)
+    pruned = chain.prune(['banana'])
+    # the guard may break the chain, so it is kept with its inputs
+    assert pruned._links == [apple, banana, apple_t, guard, banana_t]
+    assert chain.prune(['apple'])._links == [apple, apple_t]
+    assert chain(outputs=['cherry']) == {'cherry': False}
+    with pytest.raises(ValueError):
+        chain.prune(['pie'])
+
+    cond = AppleBreak()
+    chain = Chain(apple, Chain(cond, banana, breakable=True), cherry_a)
+    assert chain(outputs=['cherry']) == {'cherry': None}
+    assert chain.prune(['cherry'])._links[1]._links == [cond, banana]
+    assert chain(outputs=['apple']) == {'apple': True}
+    # a guard at the end of a subchain guards the links after it
+    chain = Chain(apple, Chain(banana, guard), apple_t)
+    assert chain.prune(['apple'])._links[1]._links == [guard]
+
+
+def test_prune_drops_dead_keys():
+    record = Record()
+    chain = Chain(NumpyReturn(), Double(), record, ApplePie())
+    assert chain(outputs=['total']) == {'total': 90}
+    # array is not read after Double and was removed before Record
+    assert record.seen == [set(['double'])]
+    assert chain.map([{}, {}], outputs=['total', 'pie']) == [
+            {'total': 90, 'pie': False}] * 2
+    assert record.seen[1:] == [set(['double'])] * 2
+    assert chain.compile(outputs=['total'])() == {'total': 90}
+
+
+class Count(Link):
+    inputs = ('apple',)
+    outputs = ('count',)
+
+    def __init__(self):
+        self.calls = 0
+
+    def calculate(self, apple):
+        self.calls += 1
+        return self.calls
+
+
+def test_map_breaks_without_rerun():
+    count = Count()
+    cond = AppleBreak()
+    chain = Chain(Chain(count, cond), BananaTrue(), breakable=True)
+    batch = [{'apple': False}, {'apple': True}, {'apple': False}]
+    # links before the break run once per item
+    assert chain.map(batch) == [
+            {'apple': False, 'banana': True, 'count': 1},
+            {'apple': True, 'banana': None, 'count': None},
+            {'apple': False, 'banana': True, 'count': 3},
+            ]
+    assert count.calls == 3
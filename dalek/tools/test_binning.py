@@ -0,0 +1,97 @@
+import pytest
+import numpy as np
+from astropy import units as u
+
+from dalek.tools.binning import (
+        WavelengthBinning, SpectrumAccumulator, iter_packets)
+
+
+@pytest.fixture
+def edges():
+    return np.hstack((3000, np.sort(np.random.uniform(3000, 9000, 40)), 9000))
+
+
+def reference(nu, weights, edges):
+    wl = nu.to(u.angstrom, u.spectral()).value
+    return (np.histogram(wl, weights=weights, bins=edges)[0],
+            np.histogram(wl, bins=edges)[0])
+
+
+def test_histogram(edges):
+    wl = np.hstack((np.random.uniform(2500, 9500, 10000), edges[[0, -1]]))
+    nu = (wl * u.angstrom).to(u.Hz, u.spectral())
+    weights = np.random.random(len(wl))
+    binning = WavelengthBinning(edges * u.angstrom)
+    sums, counts = binning.histogram(nu, weights)
+    expected_sums, expected_counts = reference(nu, weights, edges)
+    np.testing.assert_allclose(sums, expected_sums)
+    np.testing.assert_array_equal(counts, expected_counts)
+    assert binning.histogram(nu.value)[0] is None
+
+
+def test_histogram_batch(edges):
+    binning = WavelengthBinning(edges)
+    nus = []
+    weights = []
+    for size in (100, 0, 3000):
+        wl = np.random.uniform(2500, 9500, size)
+        nus.append((wl * u.angstrom).to(u.Hz, u.spectral()))
+        weights.append(np.random.random(size))
+    sums, counts = binning.histogram_batch(nus, weights)
+    assert sums.shape == counts.shape == (3, len(edges) - 1)
+    for i, (nu, w) in enumerate(zip(nus, weights)):
+        expected_sums, expected_counts = reference(nu, w, edges)
+        np.testing.assert_allclose(sums[i], expected_sums)
+        np.testing.assert_array_equal(counts[i], expected_counts)
+
+
+def test_decreasing_edges():
+    with pytest.raises(ValueError):
+        WavelengthBinning([9000, 3000])
+
+
+def test_accumulator(edges):
+    wl = np.random.uniform(2500, 9500, 10000)
+    nu = (wl * u.angstrom).to(u.Hz, u.spectral()).value
+    weights = np.random.random(len(wl))
+    binning = WavelengthBinning(edges)
+    accumulator = SpectrumAccumulator(binning).add_chunks(
+            (nu[i:i + 999], weights[i:i + 999]) for i in range(0, 10000, 999))
+    sums, counts = binning.histogram(nu, weights)
+    np.testing.assert_allclose(accumulator.sums, sums)
+    np.testing.assert_array_equal(accumulator.counts, counts)
+    assert accumulator.no_of_packets == 10000
+    accumulator.reset()
+    assert accumulator.sums.sum() == 0
+
+
+class Runner(object):
+
+    def __init__(self, size):
+        wl = np.random.uniform(2500, 9500, size)
+        self.virt_packet_nus = (wl * u.angstrom).to(u.Hz, u.spectral()).value
+        self.virt_packet_energies = np.random.random(size)
+        self.time_of_simulation = 2. * u.s
+        self.emitted_packet_nu = self.virt_packet_nus[::-1] * u.Hz
+        self.emitted_packet_luminosity = (self.virt_packet_energies *
+                                          u.erg / u.s)
+
+
+def test_iter_packets():
+    runner = Runner(1000)
+    chunks = list(iter_packets(runner, chunksize=300))
+    assert [len(nu) for nu, _ in chunks] == [300, 300, 300, 100]
+    np.testing.assert_array_equal(
+            np.concatenate([nu for nu, _ in chunks]), runner.virt_packet_nus)
+    np.testing.assert_allclose(
+            np.concatenate([e for _, e in chunks]),
+            runner.virt_packet_energies / 2.)
+    chunks = list(iter_packets(runner, virtual=False, chunksize=300))
+    np.testing.assert_array_equal(
+            np.concatenate([nu for nu, _ in chunks]),
+            runner.emitted_packet_nu.value)
+
+    class LazyRunner(object):
+        def iter_virtual_packets(self, chunksize):
+            yield np.ones(chunksize), np.ones(chunksize)
+    assert len(list(iter_packets(LazyRunner(), chunksize=5))) == 1
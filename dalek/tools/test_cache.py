@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import pytest
+import numpy as np
+from astropy import units as u
+
+from dalek.tools.cache import (
+        parameter_hash, ModelSnapshot, MemoryCache, DiskCache)
+
+
+class DummyObject(object):
+    pass
+
+
+def dummy_model(seed=0):
+    state = np.random.RandomState(seed)
+    mdl = DummyObject()
+    mdl.t_inner = 10000 * u.K
+    mdl.t_rads = np.linspace(10000, 5000, 20) * u.K
+    mdl.ws = state.random_sample(20)
+    mdl.runner = DummyObject()
+    mdl.runner.virt_packet_nus = state.random_sample(1000) * 1e15
+    mdl.runner.virt_packet_energies = state.random_sample(1000)
+    mdl.runner.time_of_simulation = 12.3 * u.s
+    mdl.spectrum = DummyObject()
+    mdl.spectrum.luminosity_density_lambda = (
+            state.random_sample(50) * u.erg / u.s / u.angstrom)
+    return mdl
+
+
+@pytest.fixture
+def cache_dir(request):
+    directory = tempfile.mkdtemp()
+    request.addfinalizer(lambda: shutil.rmtree(directory))
+    return directory
+
+
+def test_parameter_hash():
+    a = parameter_hash({'a': 0.1, 'b': 2})
+    assert a == parameter_hash({'b': 2., 'a': np.float64(0.1)})
+    assert a != parameter_hash({'a': 0.1, 'b': 2.0000001})
+    assert a != parameter_hash({'a': 0.1, 'b': 2}, salt='config')
+
+
+def test_snapshot():
+    mdl = dummy_model()
+    snapshot = ModelSnapshot.from_model(mdl)
+    assert snapshot.t_inner == mdl.t_inner
+    assert np.all(snapshot.t_rads == mdl.t_rads)
+    assert np.all(snapshot.ws == mdl.ws)
+    assert np.all(snapshot.runner.virt_packet_nus == mdl.runner.virt_packet_nus)
+    assert snapshot.runner.time_of_simulation == mdl.runner.time_of_simulation
+    assert not hasattr(snapshot.runner, 'emitted_packet_nu')
+    assert np.all(snapshot.spectrum.luminosity_density_lambda ==
+                  mdl.spectrum.luminosity_density_lambda)
+    assert not hasattr(snapshot, 'spectrum_virtual')
+
+
+def test_memory_cache():
+    cache = MemoryCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert len(cache) == 2
+
+
+def test_disk_cache(cache_dir):
+    mdl = dummy_model()
+    snapshot = ModelSnapshot.from_model(mdl)
+    cache = DiskCache(cache_dir, max_bytes=2.5 * snapshot.nbytes)
+    assert cache.get('a') is None
+    cache.set('a', snapshot)
+    loaded = DiskCache(cache_dir).get('a')
+    assert loaded.runner.time_of_simulation == 12.3 * u.s
+    assert np.all(loaded.t_rads == mdl.t_rads)
+    assert np.all(loaded.runner.virt_packet_energies ==
+                  mdl.runner.virt_packet_energies)
+    assert np.all(loaded.spectrum.luminosity_density_lambda ==
+                  mdl.spectrum.luminosity_density_lambda)
+    cache.set('b', ModelSnapshot.from_model(dummy_model(1)))
+    cache.set('c', ModelSnapshot.from_model(dummy_model(2)))
+    assert 'c' in cache
+    assert 'a' not in cache
+
+
+def test_disk_cache_evicted_while_reading(cache_dir, monkeypatch):
+    cache = DiskCache(cache_dir)
+    cache.set('a', ModelSnapshot.from_model(dummy_model()))
+
+    def evicted(fname, times):
+        os.remove(fname)
+        raise OSError('No such file or directory')
+    monkeypatch.setattr(os, 'utime', evicted)
+    assert cache.get('a') is None
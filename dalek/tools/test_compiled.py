@@ -0,0 +1,105 @@
+import time
+import threading
+
+import pytest
+
+from dalek.tools.base import Chainable, Link, Chain, BreakChainException
+from dalek.tools.test_base import (
+        AppleTrue, AppleToggle, BananaTrue, BananaToggle, CherryAnd,
+        AppleBreak, AppleGuard, ApplePie)
+
+
+def chains():
+    apple, apple_t = AppleTrue(), AppleToggle()
+    banana, banana_t = BananaTrue(), BananaToggle()
+    cherry_a, cond = CherryAnd(), AppleBreak()
+    inner = Chain(apple_t, cherry_a, banana_t)
+    return [
+            Chain(apple, banana),
+            Chain(ApplePie(), banana, cherry_a),
+            inner,
+            Chain(inner, cherry_a),
+            Chain(apple, banana, cond, banana_t, breakable=True),
+            Chain(apple, banana, apple_t, cond, banana_t, breakable=True),
+            Chain(apple, cond, banana, breakable=True),
+            Chain(apple, Chain(cond, banana, breakable=True), cherry_a),
+            Chain(banana, Chain(apple, Chain(cond, banana_t), apple_t,
+                                breakable=True), banana_t),
+            # the outputs of the interrupted subchain are discarded
+            Chain(Chain(banana_t, apple_t, cond, cherry_a), breakable=True),
+            ]
+
+
+@pytest.mark.parametrize('threads', [None, 2])
+def test_compiled_matches_chain(threads):
+    for chain in chains():
+        for data in ({}, {'apple': False, 'banana': True}):
+            if not chain._isvalid(data):
+                continue
+            compiled = chain.compile(threads=threads)
+            assert compiled(data) == chain(data)
+            compiled.close()
+
+
+def test_compiled_raises():
+    chain = Chain(AppleTrue(), BananaTrue(), AppleBreak())
+    with pytest.raises(BreakChainException):
+        chain.compile()()
+    with pytest.raises(ValueError):
+        Chain(AppleToggle()).compile()({})
+    with pytest.raises(TypeError):
+        Chain(AppleTrue(), Chainable()).compile()
+
+
+class Sleep(Link):
+    outputs = ('thread',)
+
+    def __init__(self, name):
+        self.outputs = (name,)
+
+    def calculate(self):
+        time.sleep(0.2)
+        return threading.current_thread().name
+
+
+def test_concurrent_stages():
+    chain = Chain(AppleTrue(), AppleToggle(), AppleGuard(), Sleep('a'),
+                  Sleep('b'), breakable=True)
+    compiled = chain.compile(threads=2)
+    assert [len(s) for s in compiled._stages] == [1, 1, 1, 2]
+    start = time.time()
+    result = compiled()
+    assert time.time() - start < 0.35
+    assert result['a'] != result['b']
+    compiled.close()
+
+    chain = Chain(AppleTrue(), AppleGuard(), Sleep('a'), breakable=True)
+    compiled = chain.compile(threads=2)
+    assert compiled() == {'apple': True, 'a': None}
+    compiled.close()
+
+
+def test_compiled_uses_apply():
+    from dalek.tools.profiling import Profiler
+    from dalek.tools.test_base import NumpyReturn, Double, Record
+    record = Record()
+    # links that override _apply are called through it
+    compiled = Chain(NumpyReturn(), Double(), record).compile()
+    assert compiled()['total'] == 90
+    assert record.seen == [set(['double'])]
+    # the profiler sees the links of a chain compiled while it is active
+    with Profiler() as profiler:
+        compiled = Chain(NumpyReturn(), Double(), record).compile()
+        assert compiled()['total'] == 90
+    assert set(profiler.table()['name']) == set(
+        ['NumpyReturn', 'Double', 'Record'])
+
+
+def test_compiled_skips_apply(monkeypatch):
+    from dalek.tools.test_base import NumpyReturn, Double
+
+    def fail(self, input_dict):
+        raise AssertionError('_apply called')
+    compiled = Chain(NumpyReturn(), Chain(Double(), breakable=True)).compile()
+    monkeypatch.setattr(Link, '_apply', fail)
+    assert compiled()['double'].sum() == 90
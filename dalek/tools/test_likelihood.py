@@ -0,0 +1,115 @@
+import pytest
+import numpy as np
+from astropy import units as u
+
+from dalek.tools.likelihood import (
+        SquaredDifference, Gaussian, GaussianCovariance, StudentT,
+        NormalizedShape, Likelihood, SSum)
+
+FLUX_UNIT = u.erg / (u.s * u.angstrom * u.cm**2)
+
+
+@pytest.fixture
+def observed():
+    flux = np.random.random(50) + 1.
+    uncertainty = np.random.random(50) * 0.1 + 0.05
+    return flux, uncertainty
+
+
+@pytest.fixture
+def models():
+    return np.random.random((4, 50)) + 1.
+
+
+def test_gaussian(observed, models):
+    flux, uncertainty = observed
+    index = slice(5, 40)
+    likelihood = Gaussian(flux, uncertainty, index=index)
+    model_uncertainty = np.random.random(50) * 0.1
+    for model in models:
+        residual = (flux - model)[index]
+        np.testing.assert_allclose(
+                likelihood(model),
+                -0.5 * np.sum(residual**2 / uncertainty[index]**2))
+        np.testing.assert_allclose(
+                likelihood(model, model_uncertainty),
+                -0.5 * np.sum(residual**2 / (uncertainty[index]**2 +
+                                             model_uncertainty[index]**2)))
+    np.testing.assert_allclose(likelihood.batch(models),
+                               [likelihood(m) for m in models])
+    np.testing.assert_allclose(likelihood.batch(list(models)),
+                               [likelihood(m) for m in models])
+
+
+def test_squared_difference_units(observed, models):
+    flux = observed[0] * FLUX_UNIT
+    likelihood = SquaredDifference(flux)
+    model = models[0] * FLUX_UNIT
+    expected = -0.5 * np.sum((flux - model).value**2)
+    np.testing.assert_allclose(likelihood(model), expected)
+    np.testing.assert_allclose(likelihood(model.value), expected)
+    np.testing.assert_allclose(likelihood(model.to(FLUX_UNIT * 1e3)),
+                               expected)
+
+
+def test_covariance(observed, models):
+    flux, uncertainty = observed
+    diagonal = GaussianCovariance(flux, np.diag(uncertainty**2))
+    np.testing.assert_allclose(diagonal.batch(models),
+                               Gaussian(flux, uncertainty).batch(models))
+    a = np.random.random((50, 50)) * 0.01
+    covariance = np.diag(uncertainty**2) + a.dot(a.T)
+    likelihood = GaussianCovariance(flux, covariance, index=slice(10, 30))
+    residual = (flux - models[1])[10:30]
+    np.testing.assert_allclose(
+            likelihood(models[1]),
+            -0.5 * residual.dot(np.linalg.solve(
+                covariance[10:30, 10:30], residual)))
+
+
+def test_student_t(observed, models):
+    flux, uncertainty = observed
+    likelihood = StudentT(flux, uncertainty, dof=3.)
+    residual = flux - models[2]
+    np.testing.assert_allclose(
+            likelihood(models[2]),
+            -2. * np.sum(np.log(1 + residual**2 / (3. * uncertainty**2))))
+    np.testing.assert_allclose(likelihood.batch(models),
+                               [likelihood(m) for m in models])
+
+
+def test_normalized_shape(observed, models):
+    flux, uncertainty = observed
+    likelihood = NormalizedShape(flux, uncertainty)
+    np.testing.assert_allclose(likelihood(3.5 * flux), 0., atol=1e-10)
+    np.testing.assert_allclose(likelihood.batch(models),
+                               likelihood.batch(7. * models))
+    amplitude = (np.sum(models[0] * flux / uncertainty**2) /
+                 np.sum(models[0]**2 / uncertainty**2))
+    np.testing.assert_allclose(
+            likelihood(models[0]),
+            Gaussian(flux, uncertainty)(amplitude * models[0]))
+    np.testing.assert_allclose(likelihood(np.zeros(50)),
+                               -0.5 * np.sum(flux**2 / uncertainty**2))
+
+
+def test_likelihood_link(observed, models):
+    flux, uncertainty = observed
+    link = Likelihood(Gaussian(flux, uncertainty))
+    batch = [{'flux': m} for m in models]
+    np.testing.assert_allclose([r['loglikelihood'] for r in link.map(batch)],
+                               [link(d)['loglikelihood'] for d in batch])
+
+
+def test_ssum(observed, models):
+    wl = np.linspace(3000, 9000, 51) * u.angstrom
+    flux = observed[0] * FLUX_UNIT
+    ssum = SSum(wl, flux, start=4000 * u.angstrom, end=8000 * u.angstrom)
+    model = models[0] * FLUX_UNIT
+    centers = (wl[1:] + wl[:-1]) / 2
+    index = slice(centers.value.searchsorted(4000),
+                  centers.value.searchsorted(8000) + 1)
+    expected = -0.5 * np.sum((flux[index] - model[index])**2)
+    obtained = ssum(dict(flux=model))['loglikelihood']
+    assert obtained.unit == expected.unit
+    np.testing.assert_allclose(obtained.value, expected.value)
@@ -19,3 +19,119 @@ def test_tardis(config_path, log_path):
             )
     print(output.keys())
 
+
+
+def test_incremental_config(config_path):
+    import numpy as np
+    from tardis.atomic import AtomData
+    from tardis.io.config_reader import (Configuration,
+                                         ConfigurationNameSpace)
+    from dalek.wrapper.config import structural_copy, ConfigPaths
+    from dalek.wrapper.incremental import (IncrementalConfigBuilder,
+                                           path_dependencies)
+    assert path_dependencies(['model.abundances.o']) == set(['abundances'])
+    assert path_dependencies(['model.abundances.o',
+                              'model.structure.velocity.item0']) is None
+
+    namespace = ConfigurationNameSpace.from_yaml(config_path)
+    atom_data = AtomData.from_hdf5(namespace.atom_data)
+    builder = IncrementalConfigBuilder(namespace, atom_data)
+    paths = ConfigPaths(namespace)
+    parameters = {'model.abundances.o': 0.3, 'model.abundances.si': 0.2}
+    new = paths.apply(structural_copy(namespace), parameters)
+    incremental = builder.build(new, list(parameters))
+    full = Configuration.from_config_dict(
+            paths.apply(structural_copy(namespace), parameters),
+            validate=False, atom_data=atom_data)
+    assert builder.incremental_builds == 1
+    assert builder.full_builds == 0
+    assert np.allclose(incremental.abundances.values, full.abundances.values)
+    assert list(incremental.abundances.index) == list(full.abundances.index)
+    assert np.allclose(incremental.number_densities.values,
+                       full.number_densities.values)
+    assert incremental.structure is incremental.model.structure
+    assert np.all(incremental.structure.v_inner == full.structure.v_inner)
+
+
+def test_incremental_base_unchanged(config_path, log_path):
+    import numpy as np
+    wrapper = TardisWrapper(config_path, log_dir=log_path)
+    chain = Chain(RunInfo(), Tardis(wrapper))
+    base = wrapper.config_builder.base
+    t_rads = base.plasma.t_rads.copy()
+    t_inner = base.plasma.t_inner.copy()
+    first = chain({'parameters': {'model.abundances.o': 0.2}})['model']
+    second = chain({'parameters': {'model.abundances.o': 0.3}})['model']
+    assert wrapper.config_builder.incremental_builds == 2
+    assert first.t_rads is not base.plasma.t_rads
+    assert second.tardis_config.plasma.t_rads is not base.plasma.t_rads
+    assert np.all(base.plasma.t_rads == t_rads)
+    assert np.all(base.plasma.t_rads == base.plasma.initial_t_rad)
+    assert base.plasma.t_inner == t_inner
+    assert np.all(second.tardis_config.plasma.t_rads == t_rads)
+
+
+def test_changed_paths_not_inferred(config_path, log_path):
+    import numpy as np
+    wrapper = TardisWrapper(config_path, log_dir=log_path)
+    parameters = {'model.abundances.o': 0.2}
+
+    def apply_config(config):
+        config = wrapper.config_paths.apply(config, parameters)
+        supernova = config['supernova']
+        supernova['time_explosion'] = 2 * supernova['time_explosion']
+        return config
+    # parameters is only a warm-start hint, the structure change is kept
+    wrapper(apply_config, parameters=parameters)
+    assert wrapper.config_builder.incremental_builds == 0
+    time_explosion = wrapper.model.tardis_config.supernova.time_explosion
+    assert np.isclose(time_explosion.to('s').value,
+                      2 * wrapper.config.supernova.time_explosion.to('s').value)
+
+
+def test_reuse_model(config_path, log_path):
+    wrapper = TardisWrapper(config_path, log_dir=log_path, reuse_model=True)
+    chain = Chain(RunInfo(), Tardis(wrapper))
+    first = chain({'parameters': {'model.abundances.o': 0.2}})['model']
+    second = chain({'parameters': {'model.abundances.o': 0.3}})['model']
+    assert second is first
+    assert wrapper.model_factory.created == 1
+    assert wrapper.model_factory.reused == 1
+    assert second.tardis_config.model.abundances.o == 0.3
+
+
+def test_cached_tardis_hit(config_path, log_path):
+    import numpy as np
+    from dalek.tools.model import CachedTardis
+    wrapper = TardisWrapper(config_path, log_dir=log_path)
+    chain = Chain(RunInfo(), CachedTardis(wrapper))
+    parameters = {'model.abundances.o': 0.2}
+    first = chain({'parameters': parameters})['model']
+    chain({'parameters': {'model.abundances.o': 0.3}})
+    snapshot = chain({'parameters': parameters})['model']
+    # the wrapper reports the cached run, not the last simulated one
+    assert wrapper.model is snapshot
+    np.testing.assert_allclose(
+            wrapper.model.spectrum.luminosity_density_lambda.value,
+            first.spectrum.luminosity_density_lambda.value)
+
+
+def test_reused_run_matches_new_model(config_path, log_path):
+    import numpy as np
+    reusing = TardisWrapper(config_path, log_dir=log_path, reuse_model=True)
+    fresh = TardisWrapper(config_path, log_dir=log_path)
+    chain = Chain(RunInfo(), Tardis(reusing))
+    chain({'parameters': {'model.abundances.o': 0.2}})
+    reused = chain({'parameters': {'model.abundances.o': 0.3}})['model']
+    assert reusing.model_factory.reused == 1
+    new = Chain(RunInfo(), Tardis(fresh))(
+            {'parameters': {'model.abundances.o': 0.3}})['model']
+    assert reused.iterations_executed == new.iterations_executed
+    assert reused.iterations_remaining == new.iterations_remaining
+    assert reused.current_no_of_packets == new.current_no_of_packets
+    assert reused.t_inner == new.t_inner
+    np.testing.assert_allclose(reused.t_rads.value, new.t_rads.value)
+    np.testing.assert_allclose(reused.ws, new.ws)
+    np.testing.assert_allclose(
+            reused.spectrum_virtual.luminosity_density_lambda.value,
+            new.spectrum_virtual.luminosity_density_lambda.value)
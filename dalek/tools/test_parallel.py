@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+import pytest
+
+from dalek.tools.base import Link, Chain
+from dalek.tools.parallel import ParallelChain, AsyncScheduler
+from dalek.tools.providers import RunInfo
+
+
+class Square(Link):
+    inputs = ('x',)
+    outputs = ('y',)
+
+    def calculate(self, x):
+        return x**2
+
+
+class Pid(Link):
+    outputs = ('pid',)
+
+    def calculate(self):
+        return os.getpid()
+
+
+def build_chain(offset=0):
+    class Offset(Link):
+        inputs = ('y',)
+        outputs = ('z',)
+
+        def calculate(self, y):
+            return y + offset
+    return Chain(Square(), Offset(), Pid())
+
+
+def test_parallel_map():
+    batch = [{'x': x} for x in range(20)]
+    with ParallelChain(build_chain, args=(1,), processes=2) as pchain:
+        result = pchain.map(batch)
+    assert [r['z'] for r in result] == [x**2 + 1 for x in range(20)]
+    assert len(set(r['pid'] for r in result)) <= 2
+    assert os.getpid() not in [r['pid'] for r in result]
+
+
+def test_parallel_unordered():
+    batch = [{'x': x} for x in range(10)]
+    with ParallelChain(build_chain, processes=2, outputs=('y',)) as pchain:
+        result = dict(pchain.imap_unordered(batch))
+    assert sorted(result) == list(range(10))
+    assert result[3] == {'y': 9}
+
+
+class Sleep(Link):
+    inputs = ('x',)
+    outputs = ('y',)
+
+    def calculate(self, x):
+        if x < 0:
+            raise ValueError('negative')
+        time.sleep(x)
+        return x
+
+
+def build_sleep_chain():
+    return Chain(RunInfo(), Sleep(), Pid())
+
+
+def test_async_scheduler_out_of_order():
+    with AsyncScheduler(build_sleep_chain, processes=2,
+                        outputs=('y', 'pid')) as scheduler:
+        for x in [0.3, 0.01, 0.01, 0.01]:
+            scheduler.submit({'x': x})
+        assert scheduler.pending == 4
+        result = list(scheduler.results())
+        assert scheduler.pending == 0
+        assert scheduler.queue_depth == 0
+        assert 0 < scheduler.utilization <= 1
+    # the slow first evaluation does not hold back the others
+    assert result[-1].index == 0
+    assert sorted(r.index for r in result) == [0, 1, 2, 3]
+    assert len(set(r.uuid for r in result)) == 4
+    for r in result:
+        assert r.error is None
+        assert r.output['pid'] == r.worker
+        assert sorted(r.output) == ['pid', 'y']
+    # iterations count per worker
+    iterations = {}
+    for r in sorted(result, key=lambda r: r.index):
+        iterations.setdefault(r.worker, []).append(r.iteration)
+    for worker_iterations in iterations.values():
+        assert sorted(worker_iterations) == list(
+                range(1, len(worker_iterations) + 1))
+
+
+def test_async_scheduler_stream():
+    def propose(evaluation):
+        if evaluation is None:
+            return {'x': 0.01}
+        if evaluation.index == 2:
+            return {'x': -1}
+        return {'x': evaluation.output['y']}
+
+    with AsyncScheduler(build_sleep_chain, processes=2,
+                        outputs=('y',)) as scheduler:
+        result = list(scheduler.stream(propose, 6))
+        assert scheduler.stats()['finished'] == 6
+    assert len(result) == 6
+    failed = [r for r in result if r.error is not None]
+    assert len(failed) == 1
+    assert isinstance(failed[0].error, ValueError)
+    assert failed[0].output is None
+
+
+class Unpicklable(Link):
+    inputs = ('x',)
+    outputs = ('lock',)
+
+    def calculate(self, x):
+        if x < 0:
+            # the worker dies
+            os._exit(1)
+        if x > 0:
+            return threading.Lock()
+        return None
+
+
+def build_unpicklable_chain():
+    return Chain(Unpicklable())
+
+
+def test_async_scheduler_pool_failures():
+    callback_errors = []
+
+    def failing_callback(evaluation):
+        callback_errors.append(evaluation)
+        raise ValueError('callback')
+
+    with AsyncScheduler(build_unpicklable_chain, processes=2,
+                        poll_interval=0.05) as scheduler:
+        # the whole output, including an unpicklable object, is sent back
+        scheduler.submit({'x': 1})
+        scheduler.submit({'x': 0}, callback=failing_callback)
+        scheduler.submit({'x': 0})
+        result = sorted(scheduler.results(), key=lambda r: r.index)
+        assert [r.index for r in result] == [0, 2]
+        assert result[0].error is not None
+        assert result[0].output is None
+        assert result[1].error is None
+        # a failing callback does not stop the delivery of later results
+        scheduler.submit({'x': 0})
+        assert scheduler.get(timeout=10).error is None
+        assert len(callback_errors) == 1
+
+        scheduler.submit({'x': -1})
+        died = scheduler.get(timeout=10)
+        assert isinstance(died.error, RuntimeError)
+        assert scheduler.pending == 0
+
+
+def test_async_scheduler_future():
+    asyncio = pytest.importorskip('asyncio')
+    loop = asyncio.new_event_loop()
+    try:
+        with AsyncScheduler(build_sleep_chain, processes=2,
+                            outputs=('y',)) as scheduler:
+            futures = [scheduler.future({'x': x}, loop)
+                       for x in [0.1, 0.01]]
+            result = loop.run_until_complete(asyncio.gather(*futures))
+    finally:
+        loop.close()
+    assert [r.output['y'] for r in result] == [0.1, 0.01]
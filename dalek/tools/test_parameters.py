@@ -71,3 +71,40 @@ def test_container():
     assert cont.values == [0.9, 0.1, 0.24]
     with pytest.raises(AssertionError):
         cont.values = [1]
+
+
+def test_container_transform():
+    cont = ParameterContainer(
+            DynamicParameter('a.b.c', bounds=(0, 0.4)),
+            Parameter('a.b.static', default=0.1),
+            DynamicParameter('a.b.d', bounds=(0, 0.8)),
+            DynamicParameter(
+                'c.b.a', bounds=(1, 2),
+                transformation=lambda x, a, b: a * (b / a)**x),
+            OverFlowParameter('a.b.overflow'),
+            )
+    assert cont.paths == ['a.b.c', 'a.b.static', 'a.b.d', 'c.b.a',
+                          'a.b.overflow']
+    assert cont.input_paths == ['a.b.c', 'a.b.d', 'c.b.a']
+    inputs = np.array([[0.5, 0.5, 0.],
+                       [0.25, 1., 1.],
+                       [0.5, 1.2, 0.5],
+                       [1., 1., 0.5]])
+    values = cont.transform(inputs)
+    assert values.shape == (4, 5)
+    np.testing.assert_allclose(values[0], [0.2, 0.1, 0.4, 1., 0.3])
+    np.testing.assert_allclose(values[1], [0.1, 0.1, 0.8, 2., np.nan])
+    assert np.isnan(values[2, 2]) and np.isnan(values[2, 4])
+    np.testing.assert_allclose(values[2, 3], np.sqrt(2))
+    assert np.all(np.isnan(values[3, 4]))
+    # the batch agrees with setting the values one by one
+    for row, expected in zip(inputs, values):
+        cont.values = list(row)
+        np.testing.assert_array_equal(cont.values, expected)
+        assert cont['c.b.a'] == cont.c_b_a.value == expected[3]
+    assert cont['missing'] is None
+
+    dicts = cont.dicts(values[:1])
+    assert dicts == [dict(zip(cont.paths, values[0]))]
+    with pytest.raises(ValueError):
+        cont.transform(np.zeros((2, 2)))
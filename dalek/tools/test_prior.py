@@ -1,5 +1,9 @@
 import pytest
-from dalek.tools.prior import Prior, CheckPrior, INVALID
+import numpy as np
+
+from dalek.tools.prior import (
+        Prior, CheckPrior, INVALID, ParameterPrior, Bounds, Uniform,
+        LogUniform, Normal, Inequality)
 from dalek.tools.base import Chain, Link
 
 
@@ -41,3 +45,47 @@ def test_checkprior(o, expected):
     obtained = prior(idict)['dummy']
     expected = True if expected == 0 else None
     assert obtained == expected
+
+
+def test_prior_batch():
+    parameters = [
+            {'model.abundances.o': o, 'model.abundances.s': s,
+                'model.abundances.si': 0.2}
+            for o, s in [(0.1, 0.1), (0., 0.1), (0.1, 0.3), (float('nan'), 0.)]
+            ]
+    prior = Prior()
+    obtained = [d['logprior'] for d in prior.map(
+        [{'parameters': p} for p in parameters])]
+    expected = [prior.calculate(p) for p in parameters]
+    assert obtained == expected
+    assert obtained == [0, INVALID, INVALID, INVALID]
+
+
+def test_parameter_prior():
+    prior = ParameterPrior(
+            {'a': Uniform(0., 2.), 'b': Normal(1., 2., lower=0.),
+             'c': LogUniform(1., np.e), 'd': Bounds(upper=1., strict=True),
+             'unused': Uniform(0., 1.)},
+            [Inequality('a', 'b'), Inequality('c', 'unused')])
+    names = ['d', 'c', 'b', 'a']
+    values = np.array([
+        [0., 2., 1., 0.5],
+        [0., 2., 1., 1.5],     # a > b
+        [1., 2., 1., 0.5],     # d at its strict upper bound
+        [0., 2., -1., -2.],    # b below its lower bound
+        [0., 3., 1., 0.5],     # c outside
+        [0., np.nan, 1., 0.5],
+        ])
+    expected = np.full(len(values), INVALID)
+    expected[0] = (-np.log(2.) - np.log(2.) -
+                   np.log(2. * np.sqrt(2 * np.pi)))
+    np.testing.assert_allclose(prior.score(values, names), expected)
+    assert list(prior.mask(values, names)) == [True] + [False] * 5
+    parameters = [dict(zip(names, v)) for v in values]
+    obtained = [d['logprior'] for d in prior.map(
+        [{'parameters': p} for p in parameters])]
+    np.testing.assert_allclose(obtained, expected)
+    np.testing.assert_allclose([prior.calculate(p) for p in parameters],
+                               expected)
+    # compiled once per order of the names
+    assert sorted(prior._compiled) == [('a', 'b', 'c', 'd'), tuple(names)]
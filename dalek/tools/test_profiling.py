@@ -0,0 +1,109 @@
+import os
+import tempfile
+import time
+
+import pytest
+import numpy as np
+
+from dalek.base.meta import MetaContainer
+from dalek.tools.base import Link, Chain, Chainable
+from dalek.tools.profiling import Profiler
+from dalek.tools.providers import RunInfo
+
+
+class Slow(Link):
+    inputs = ('x',)
+    outputs = ('y',)
+
+    def calculate(self, x):
+        time.sleep(0.02)
+        return x + 1
+
+
+class Fast(Link):
+    inputs = ('y',)
+    outputs = ('z',)
+
+    def calculate(self, y):
+        return y * 2
+
+
+class VectorFast(Fast):
+    vectorized = True
+
+    def calculate_batch(self, y):
+        return [v * 2 for v in y]
+
+
+def test_profiler():
+    chain = Chain(RunInfo(), Slow(), Chain(Fast()))
+    with Profiler() as profiler:
+        assert Chainable.profiler is profiler
+        results = [chain({'x': x}) for x in range(3)]
+    assert Chainable.profiler is None
+    assert [r['z'] for r in results] == [2, 4, 6]
+
+    table = profiler.table()
+    assert len(table) == 3 * 5
+    assert list(table['evaluation'].unique()) == [1, 2, 3]
+    assert set(table['uuid']) == set(str(r['uuid']) for r in results)
+    slow = table[table['path'] == 'Chain/Slow']
+    assert np.all(slow['wall_time'] >= 0.02)
+    assert np.all(slow['calculate_time'] >= 0.02)
+    np.testing.assert_allclose(slow['overhead'],
+                               slow['wall_time'] - slow['calculate_time'])
+    top = table[table['depth'] == 0]
+    children = table[table['depth'] == 1].groupby('evaluation')[
+        'wall_time'].sum()
+    np.testing.assert_allclose(top['overhead'].values,
+                               top['wall_time'].values - children.values)
+
+    summary = profiler.summary()
+    assert summary.index[0] == 'Chain'
+    assert summary.loc['Chain/Slow', 'calls'] == 3
+    assert summary.loc['Chain/Chain/Fast', 'calls'] == 3
+    assert summary.loc['Chain/Slow', 'fraction'] > 0.5
+
+
+def test_profiler_map():
+    chain = Chain(Slow(), VectorFast())
+    with Profiler() as profiler:
+        chain.map([{'x': x} for x in range(2)])
+    summary = profiler.summary()
+    assert summary.loc['Chain', 'calls'] == 1
+    assert summary.loc['Chain/Slow', 'calls'] == 2
+    assert summary.loc['Chain/VectorFast', 'calls'] == 1
+
+
+def test_profiler_memory():
+    pytest.importorskip('tracemalloc')
+
+    class Allocate(Link):
+        inputs = ()
+        outputs = ('a',)
+
+        def calculate(self):
+            return np.ones(10**6)
+
+    with Profiler(memory=True) as profiler:
+        Chain(Allocate())()
+    table = profiler.table().set_index('path')
+    assert table.loc['Chain/Allocate', 'peak_memory'] >= 8 * 10**6
+    assert table.loc['Chain', 'peak_memory'] >= 8 * 10**6
+
+
+def test_profiler_save():
+    fname = tempfile.mktemp(suffix='.h5')
+    container = MetaContainer(fname)
+    try:
+        with Profiler() as profiler:
+            Chain(RunInfo(), Slow())({'x': 1})
+        profiler.save(container)
+        assert len(profiler.table()) == 0
+        with container as store:
+            assert len(store['profile']) == 3
+            assert len(store['profile']['uuid'][0]) == 36
+    finally:
+        for f in (fname, fname + '.lock', fname + '.flock'):
+            if os.path.exists(f):
+                os.remove(f)
@@ -89,3 +89,125 @@ def test_flux(model, bins):
     flux_chain = Chain(PacketProvider(), Luminosity(bins * u.angstrom), Flux())
     obtained = flux_chain({'model': model})['flux']
     assert obtained.unit.is_equivalent('erg / (s Angstrom cm2)')
+
+
+def test_batch_matches_single():
+    from dalek.tools.likelihood import SSum
+    bins = np.linspace(3000, 9000, 61) * u.angstrom
+    observed = np.ones(60) * u.erg / (u.s * u.angstrom * u.cm**2)
+    chain = Chain(Luminosity(bins), Flux(), SSum(bins, observed))
+    batch = []
+    for size in (1000, 10, 2500):
+        wl = np.random.uniform(2500, 9500, size)
+        wl[0] = 9000
+        batch.append({
+            'packet_nu': (wl * u.angstrom).to(u.Hz, u.spectral()),
+            'packet_energy': np.random.random(size) * u.erg / u.s,
+            })
+    for obtained, data in zip(chain.map(batch), batch):
+        expected = chain(data)
+        np.testing.assert_allclose(
+                obtained['flux'].value, expected['flux'].value)
+        assert obtained['flux'].unit == expected['flux'].unit
+        np.testing.assert_allclose(
+                obtained['loglikelihood'].value,
+                expected['loglikelihood'].value)
+
+
+class _Runner(object):
+
+    def __init__(self, size):
+        wl = np.random.uniform(2500, 9500, size)
+        self.virt_packet_nus = (wl * u.angstrom).to(u.Hz, u.spectral()).value
+        self.virt_packet_energies = np.random.random(size) * 1e38
+        self.time_of_simulation = 2.5 * u.s
+
+
+class _Model(object):
+
+    def __init__(self, size):
+        self.runner = _Runner(size)
+
+
+def test_fast_matches_units():
+    from dalek.tools.likelihood import SSum
+    bins = np.linspace(3000, 9000, 61) * u.angstrom
+    observed = (np.random.random(60) * 1e-15 *
+                u.erg / (u.s * u.angstrom * u.cm**2))
+    distance = 10 * u.Mpc
+
+    def chain(fast):
+        return Chain(
+                VirtualPacketProvider(fast=fast),
+                VirtualLuminosity(bins, fast=fast),
+                Flux(distance, fast=fast),
+                SSum(bins, observed, fast=fast))
+
+    batch = [{'model': _Model(size)} for size in (2000, 50)]
+    slow = chain(False)
+    fast = chain(True)
+    for data, mapped in zip(batch, fast.map(batch)):
+        expected = slow(data)
+        obtained = fast(data)
+        assert not hasattr(obtained['flux'], 'unit')
+        np.testing.assert_allclose(
+                obtained['flux'],
+                expected['flux'].to(
+                    u.erg / (u.s * u.angstrom * u.cm**2)).value)
+        np.testing.assert_allclose(
+                obtained['loglikelihood'], expected['loglikelihood'].value)
+        np.testing.assert_allclose(mapped['flux'], obtained['flux'])
+        np.testing.assert_allclose(
+                mapped['loglikelihood'], obtained['loglikelihood'])
+
+
+def test_fast_units_checked():
+    from dalek.tools.likelihood import SSum, Likelihood, SquaredDifference
+    from dalek.tools.base import value_in
+    bins = np.linspace(3000, 9000, 61) * u.angstrom
+    observed = np.ones(60) * u.erg / (u.s * u.angstrom * u.cm**2)
+    with pytest.raises(ValueError):
+        Chain(VirtualPacketProvider(fast=True), VirtualLuminosity(bins))
+    # also across nested chains
+    with pytest.raises(ValueError):
+        Chain(Chain(VirtualPacketProvider(),
+                    VirtualLuminosity(bins, fast=True)), Flux())
+    with pytest.raises(ValueError):
+        Chain(VirtualLuminosity(bins), Flux(fast=True))
+    # the likelihoods take Quantities and plain arrays in their unit
+    Chain(Flux(fast=True), SSum(bins, observed))
+    Chain(Flux(), SSum(bins, observed, fast=True))
+    Chain(Flux(fast=True), Likelihood(SquaredDifference(observed)))
+    si_observed = observed.to(u.W / (u.m**2 * u.angstrom))
+    with pytest.raises(ValueError):
+        Chain(Flux(fast=True), Likelihood(SquaredDifference(si_observed)))
+
+    assert value_in(2 * u.km, u.m) == 2000
+    np.testing.assert_array_equal(value_in([1., 2.], u.m), [1., 2.])
+
+
+def test_dummy_runner():
+    from dalek.tools.binning import iter_packets, DummyRunner
+    runner = DummyRunner(1e14, 1e15, 10 * u.s, no_of_packets=1000, seed=1)
+    chunks = list(iter_packets(runner, chunksize=300))
+    np.testing.assert_array_equal(
+            np.concatenate([nu for nu, _ in chunks]), runner.virt_packet_nus)
+    np.testing.assert_allclose(
+            np.concatenate([e for _, e in chunks]),
+            runner.virt_packet_energies / 10.)
+
+
+@pytest.mark.parametrize('fast', [False, True])
+def test_binned_packet_provider(fast):
+    from dalek.tools.providers import BinnedPacketProvider
+    bins = np.linspace(3000, 9000, 61) * u.angstrom
+    data = {'model': _Model(5000)}
+    expected = Chain(VirtualPacketProvider(fast=fast),
+                     VirtualLuminosity(bins, fast=fast))(data)['luminosity']
+    obtained = BinnedPacketProvider(bins, chunksize=777, fast=fast)(
+            data)['luminosity']
+    if fast:
+        np.testing.assert_allclose(obtained, expected)
+    else:
+        assert obtained.unit == expected.unit
+        np.testing.assert_allclose(obtained.value, expected.value)
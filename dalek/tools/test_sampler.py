@@ -0,0 +1,143 @@
+import os
+import tempfile
+
+import pytest
+import numpy as np
+
+from dalek.base.meta import MetaContainer
+from dalek.tools.base import Link, Chain
+from dalek.tools.prior import ParameterPrior, Uniform
+from dalek.tools.sampler import EnsembleSampler, ParallelTemperingSampler
+
+NAMES = ['a', 'b']
+MEAN = np.array([1., -2.])
+SIGMA = np.array([0.5, 2.])
+
+
+class BoxPrior(Link):
+    inputs = ('parameters',)
+    outputs = ('logprior',)
+
+    def calculate(self, parameters):
+        if all(-10 < parameters[n] < 10 for n in NAMES):
+            return 0.
+        return -np.inf
+
+
+class GaussianLikelihood(Link):
+    inputs = ('parameters',)
+    outputs = ('loglikelihood',)
+
+    def calculate(self, parameters):
+        x = np.array([parameters[n] for n in NAMES])
+        return -0.5 * np.sum(((x - MEAN) / SIGMA)**2)
+
+
+class Crash(Link):
+    inputs = ('parameters',)
+    outputs = ()
+
+    def __init__(self, after):
+        self.after = after
+
+    def calculate(self, parameters):
+        self.after -= 1
+        if self.after < 0:
+            raise RuntimeError('crash')
+
+
+class CountingChain(Chain):
+
+    def __init__(self, *args, **kwargs):
+        super(CountingChain, self).__init__(*args, **kwargs)
+        self.batches = []
+
+    def map(self, batch, outputs=None):
+        self.batches.append(len(batch))
+        return super(CountingChain, self).map(batch, outputs)
+
+
+def initial(n_walkers, seed=1):
+    return np.random.RandomState(seed).normal(size=(n_walkers, len(NAMES)))
+
+
+@pytest.fixture
+def fname():
+    fname = tempfile.mktemp(suffix='.h5')
+    yield fname
+    for f in (fname, fname + '.lock', fname + '.flock'):
+        if os.path.exists(f):
+            os.remove(f)
+
+
+def test_ensemble_sampler():
+    chain = CountingChain(BoxPrior(), GaussianLikelihood())
+    sampler = EnsembleSampler(chain, NAMES, 32, seed=0)
+    sampler.run(400, initial(32))
+    assert set(chain.batches) == set([32, 16])
+    samples = np.concatenate(sampler.chain[100:])
+    np.testing.assert_allclose(samples.mean(axis=0), MEAN, atol=0.3)
+    np.testing.assert_allclose(samples.std(axis=0), SIGMA, rtol=0.2)
+    assert 0.2 < sampler.acceptance_fraction[0] < 0.9
+
+
+def test_parallel_tempering_sampler():
+    chain = CountingChain(BoxPrior(), GaussianLikelihood())
+    sampler = ParallelTemperingSampler(chain, NAMES, 16,
+                                       betas=[1., 0.5, 0.25], seed=0)
+    sampler.run(300, initial(16))
+    # one batch holds a half-ensemble of every temperature
+    assert chain.batches[1:] == [24] * 600
+    samples = np.concatenate(sampler.chain[100:])
+    np.testing.assert_allclose(samples.mean(axis=0), MEAN, atol=0.4)
+    np.testing.assert_allclose(samples.std(axis=0), SIGMA, rtol=0.25)
+    assert np.all(sampler.swaps_accepted > 0)
+
+
+def test_resume(fname):
+    betas = [1., 0.5]
+    reference = ParallelTemperingSampler(
+            Chain(BoxPrior(), GaussianLikelihood()), NAMES, 8, betas=betas,
+            seed=3)
+    reference.run(20, initial(8))
+
+    # crash in step 14, the last checkpoint is at step 12
+    sampler = ParallelTemperingSampler(
+            Chain(BoxPrior(), GaussianLikelihood(), Crash(16 * 14)), NAMES, 8,
+            betas=betas, seed=3, container=MetaContainer(fname),
+            checkpoint_every=3)
+    with pytest.raises(RuntimeError):
+        sampler.run(20, initial(8))
+    assert sampler.step == 13
+    resumed = ParallelTemperingSampler(
+            Chain(BoxPrior(), GaussianLikelihood()), NAMES, 8, betas=betas,
+            seed=42, container=MetaContainer(fname), checkpoint_every=3)
+    resumed.run(20)
+    assert resumed.step == 20
+    np.testing.assert_array_equal(resumed.positions, reference.positions)
+    np.testing.assert_array_equal(resumed.loglikelihood,
+                                  reference.loglikelihood)
+    np.testing.assert_array_equal(resumed.accepted, reference.accepted)
+
+    history = resumed.history()
+    assert sorted(set(history['step'])) == list(range(21))
+    last = history[(history['step'] == 20) & (history['temperature'] == 0)]
+    np.testing.assert_array_equal(last[NAMES].values, reference.chain[20])
+
+
+def test_resume_requires_positions(fname):
+    sampler = EnsembleSampler(Chain(BoxPrior(), GaussianLikelihood()), NAMES,
+                              8, container=MetaContainer(fname))
+    with pytest.raises(ValueError):
+        sampler.run(10)
+
+
+def test_prior_screening():
+    chain = CountingChain(BoxPrior(), GaussianLikelihood())
+    prior = ParameterPrior({'a': Uniform(0., 2.), 'b': Uniform(-10., 10.)})
+    sampler = EnsembleSampler(chain, NAMES, 16, seed=0, prior=prior)
+    sampler.run(50, np.abs(initial(16)) % 2)
+    # rejected proposals never reach the chain
+    assert sum(chain.batches) < 16 * 51
+    samples = np.concatenate(sampler.chain)
+    assert np.all((samples[:, 0] >= 0) & (samples[:, 0] <= 2))
@@ -0,0 +1,139 @@
+import os
+import tempfile
+from uuid import uuid4
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from dalek.base.meta import MetaContainer, MetaInformation
+from dalek.tools.base import Chain
+from dalek.tools.likelihood import Gaussian
+from dalek.tools.prior import Prior, INVALID
+from dalek.tools.surrogate import (
+        NearestNeighbourEmulator, PCAGaussianProcessEmulator, Surrogate,
+        SurrogateScreen, SurrogateUpdate, training_data_from_container)
+
+X = np.linspace(0, 1, 100)
+
+
+def spectrum(center, amplitude):
+    return 1. + amplitude * np.exp(-0.5 * (X - center)**2 / 0.05**2)
+
+
+def training_set(n=200, seed=0):
+    random = np.random.RandomState(seed)
+    parameters = random.uniform([0.3, 0.5], [0.7, 1.5], size=(n, 2))
+    return parameters, np.array([spectrum(*p) for p in parameters])
+
+
+@pytest.mark.parametrize('emulator', [
+    NearestNeighbourEmulator(k=4),
+    PCAGaussianProcessEmulator(n_components=8),
+    ])
+def test_emulators(emulator):
+    parameters, spectra = training_set()
+    emulator.fit(parameters, spectra)
+    test_parameters, test_spectra = training_set(20, seed=1)
+    mean, std = emulator.predict(test_parameters)
+    assert mean.shape == std.shape == test_spectra.shape
+    error = np.sqrt(np.mean((mean - test_spectra)**2, axis=1))
+    assert np.median(error) < 0.1
+    # the uncertainty is larger far away from the training points
+    far = emulator.predict(np.array([[0.5, 5.]]))[1]
+    assert far.mean() > np.median(std.mean(axis=1))
+
+
+def test_surrogate_incremental():
+    surrogate = Surrogate(retrain_every=10, min_training=20)
+    parameters, spectra = training_set(60)
+    assert surrogate.predict({'center': 0.5, 'amplitude': 1.}) == (None, None)
+    for (center, amplitude), s in zip(parameters, spectra):
+        surrogate.add({'center': center, 'amplitude': amplitude}, s)
+    assert surrogate.names == ('amplitude', 'center')
+    assert surrogate.trained
+    assert len(surrogate) == 60
+    # predictions are recorded from the 20th run on
+    assert surrogate.error_summary()['n'] == 40
+    assert surrogate.error_summary(last=5)['n'] == 5
+    mean, std = surrogate.predict({'center': 0.5, 'amplitude': 1.})
+    assert np.sqrt(np.mean((mean - spectrum(0.5, 1.))**2)) < 0.2
+
+
+def test_screen():
+    parameters, spectra = training_set(100)
+    surrogate = Surrogate(NearestNeighbourEmulator(k=3), min_training=10,
+                          retrain_every=1)
+    for (center, amplitude), s in zip(parameters, spectra):
+        surrogate.add({'center': center, 'amplitude': amplitude}, s)
+    observed = spectrum(0.5, 1.)
+    likelihood = Gaussian(observed, np.ones_like(observed) * 0.01)
+    screen = SurrogateScreen(surrogate, likelihood, threshold=100.,
+                             max_uncertainty=1.)
+    chain = Chain(Prior(), screen)
+    good = chain({'parameters': {'center': 0.5, 'amplitude': 1.}})
+    assert good['logprior'] == 0
+    bad = chain({'parameters': {'center': 0.3, 'amplitude': 0.5}})
+    assert bad['logprior'] == INVALID
+    assert bad['surrogate_loglikelihood'] < good['surrogate_loglikelihood']
+    assert screen.rejected == 1 and screen.passed == 1
+
+    strict = SurrogateScreen(surrogate, likelihood, max_uncertainty=0.)
+    assert strict.calculate(
+            {'center': 0.3, 'amplitude': 0.5}, 0.)[0] == 0
+
+    update = SurrogateUpdate(surrogate)
+    update({'parameters': {'center': 0.5, 'amplitude': 1.},
+            'flux': observed})
+    assert len(surrogate) == 101
+    assert screen.reference == likelihood(observed)
+
+
+@pytest.mark.parametrize('storage', ['nodes', 'columnar'])
+def test_training_data_from_container(storage):
+    fname = tempfile.mktemp(suffix='.h5')
+    container = MetaContainer(fname, storage=storage)
+    parameters, spectra = training_set(5)
+    update = SurrogateUpdate(Surrogate(), container=container)
+    try:
+        for i, ((center, amplitude), s) in enumerate(zip(parameters, spectra)):
+            update({'parameters': {'center': center, 'amplitude': amplitude},
+                    'flux': s, 'uuid': uuid4(), 'iteration': i, 'rank': 0})
+        # runs stored without the binned flux are skipped
+        record = MetaInformation(uuid4(), 0, 5, 0.,
+                                 {'center': 0.5, 'amplitude': 1.})
+        record.add_data('spec', pd.Series(np.ones(1000)))
+        record.save(container)
+        obtained_parameters, obtained_spectra = training_data_from_container(
+                container, ['center', 'amplitude'])
+        np.testing.assert_allclose(obtained_parameters, parameters)
+        np.testing.assert_allclose(obtained_spectra, spectra)
+        surrogate = Surrogate.from_container(
+                container, ['center', 'amplitude'], min_training=5)
+        assert surrogate.trained
+        assert len(surrogate) == 5
+    finally:
+        for f in (fname, fname + '.lock', fname + '.flock'):
+            if os.path.exists(f):
+                os.remove(f)
+
+
+def test_reference_is_incremental():
+    parameters, spectra = training_set(30)
+    surrogate = Surrogate(min_training=10)
+    observed = spectrum(0.5, 1.)
+    likelihood = Gaussian(observed, np.ones_like(observed) * 0.01)
+    screen = SurrogateScreen(surrogate, likelihood)
+    evaluated = []
+    batch = likelihood.batch
+
+    def counting_batch(values):
+        evaluated.append(len(values))
+        return batch(values)
+    likelihood.batch = counting_batch
+    for n, ((center, amplitude), s) in enumerate(zip(parameters, spectra)):
+        surrogate.add({'center': center, 'amplitude': amplitude}, s)
+        if n % 10 == 9:
+            screen.reference
+    assert evaluated == [10, 10, 10]
+    assert screen.reference == np.max(batch(spectra))
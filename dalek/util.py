@@ -1,4 +1,5 @@
 import os
+import hashlib
 import numpy as np
 from astropy import units as u, constants as const
 # Some helper functions
@@ -19,6 +20,10 @@ def bin_center_to_edge(bin_center):
 def bin_edge_to_center(bin_edge):
     return 0.5 * (bin_edge[:-1] + bin_edge[1:] )
 
+def file_hash(fname):
+    with open(fname, 'rb') as fh:
+        return hashlib.sha1(fh.read()).hexdigest()
+
 def set_engines_cpu_affinity():
     import sys
     if sys.platform.startswith('linux'):
@@ -0,0 +1,174 @@
+"""
+Share the atomic data between processes through memory-mapped files.
+
+The numerical blocks of every table of an AtomData are written once as .npy
+files. Processes attach to them with numpy.memmap, so all workers on a node
+read the same pages of the page cache instead of holding their own copy of
+the line, level and ionization tables.
+"""
+import os
+import shutil
+import logging
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import numpy as np
+import pandas as pd
+
+try:
+    from pandas.core.internals import BlockManager, make_block
+except ImportError:
+    BlockManager = make_block = None
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'atom_data.pickle'
+
+
+def _block_manager(frame):
+    manager = getattr(frame, '_mgr', None)
+    if manager is None:
+        manager = frame._data
+    return manager
+
+
+def _dump_array(array, directory, name):
+    fname = '{}.npy'.format(name)
+    np.save(os.path.join(directory, fname), np.ascontiguousarray(array))
+    return fname
+
+
+def _dump_frame(frame, directory, name):
+    blocks = []
+    for i, block in enumerate(_block_manager(frame).blocks):
+        values = block.values
+        if values.dtype.hasobject:
+            stored = values
+        else:
+            stored = _dump_array(values, directory, '{}.{}'.format(name, i))
+        blocks.append((stored, block.mgr_locs.as_array))
+    return {
+            'columns': frame.columns,
+            'index': frame.index,
+            'blocks': blocks,
+            }
+
+
+def _load_array(stored, directory):
+    if isinstance(stored, str):
+        return np.load(os.path.join(directory, stored), mmap_mode='r')
+    return stored
+
+
+def _load_frame(spec, directory):
+    values = [(_load_array(stored, directory), placement)
+              for stored, placement in spec['blocks']]
+    if BlockManager is not None:
+        blocks = [make_block(v, placement=p, ndim=2) for v, p in values]
+        return pd.DataFrame(
+                BlockManager(blocks, [spec['columns'], spec['index']]))
+    logger.warning('pandas block internals not available - '
+                   'copying the shared atomic data')
+    frames = [pd.DataFrame(v.T, index=spec['index'],
+                           columns=spec['columns'][p])
+              for v, p in values]
+    return pd.concat(frames, axis=1)[spec['columns']]
+
+
+def dump_shared_atom_data(atom_data, directory):
+    """
+    Write the tables of an AtomData to a directory that other processes can
+    attach to with `attach_shared_atom_data`.
+
+    DataFrames and numerical arrays are stored as .npy files, all other
+    attributes are pickled.
+
+    Parameters
+    ----------
+    atom_data: ~tardis.atomic.AtomData
+    directory: ~str
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    frames = {}
+    arrays = {}
+    attributes = {}
+    for name, value in vars(atom_data).items():
+        if isinstance(value, pd.DataFrame):
+            frames[name] = _dump_frame(value, directory, name)
+        elif isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            arrays[name] = _dump_array(value, directory, name)
+        else:
+            attributes[name] = value
+    with open(os.path.join(directory, META_FILE), 'wb') as fh:
+        pickle.dump({
+            'class': atom_data.__class__,
+            'frames': frames,
+            'arrays': arrays,
+            'attributes': attributes,
+            }, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def attach_shared_atom_data(directory):
+    """
+    Create an AtomData whose tables are read-only memory maps of the files
+    written by `dump_shared_atom_data`.
+
+    Parameters
+    ----------
+    directory: ~str
+
+    Returns
+    -------
+        : ~tardis.atomic.AtomData
+    """
+    with open(os.path.join(directory, META_FILE), 'rb') as fh:
+        meta = pickle.load(fh)
+    atom_data = meta['class'].__new__(meta['class'])
+    atom_data.__dict__.update(meta['attributes'])
+    for name, stored in meta['arrays'].items():
+        setattr(atom_data, name, _load_array(stored, directory))
+    for name, spec in meta['frames'].items():
+        setattr(atom_data, name, _load_frame(spec, directory))
+    return atom_data
+
+
+def load_shared_atom_data(fname, directory):
+    """
+    Attach to the shared atomic data in directory, creating it from the HDF5
+    file fname first if it does not exist yet.
+
+    The data is written to a temporary directory and moved into place with an
+    atomic rename, so concurrently starting processes never see a partially
+    written directory. If another process wins the race its copy is used.
+
+    Parameters
+    ----------
+    fname: ~str
+        atomic data HDF5 file
+    directory: ~str
+        directory holding the shared copy
+
+    Returns
+    -------
+        : ~tardis.atomic.AtomData
+    """
+    if not os.path.exists(os.path.join(directory, META_FILE)):
+        from tardis.atomic import AtomData
+        parent = os.path.dirname(os.path.abspath(directory))
+        tmp_dir = tempfile.mkdtemp(dir=parent)
+        try:
+            dump_shared_atom_data(AtomData.from_hdf5(fname), tmp_dir)
+            os.rename(tmp_dir, directory)
+            logger.info('Shared atomic data from %s in %s', fname, directory)
+        except OSError:
+            if not os.path.exists(os.path.join(directory, META_FILE)):
+                raise
+        finally:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir)
+    return attach_shared_atom_data(directory)
@@ -0,0 +1,127 @@
+from astropy import units as u
+
+
+def structural_copy(namespace):
+    """
+    Copy the dict and list containers of a configuration namespace while
+    sharing all leaves (numbers, strings, Quantities) with the original.
+
+    `Configuration.from_config_dict` rewrites sections and items of the
+    namespace it is given, but it never changes a leaf in place. Copying the
+    containers is therefore enough to keep the original namespace intact and
+    is much cheaper than a deepcopy of every Quantity.
+
+    Parameters
+    ----------
+    namespace: ~tardis.io.config_reader.ConfigurationNameSpace
+
+    Returns
+    -------
+        : ~tardis.io.config_reader.ConfigurationNameSpace
+    """
+    if isinstance(namespace, dict):
+        # bypass __init__ and __setitem__: the values are already converted
+        new = namespace.__class__.__new__(namespace.__class__)
+        for key, value in namespace.items():
+            dict.__setitem__(new, key, structural_copy(value))
+        return new
+    elif isinstance(namespace, list):
+        return [structural_copy(value) for value in namespace]
+    else:
+        return namespace
+
+
+class ConfigPath(object):
+    """
+    A dotted configuration path like 'model.structure.velocity.item0'
+    resolved once against a base namespace.
+
+    The path is split into dictionary keys and list indices and the unit of
+    the current value is looked up, so `set` only walks the containers and
+    writes the leaf, which is what `set_config_item` does after parsing the
+    string again on every call. The resolved keys stay valid for every
+    `structural_copy` of the base namespace.
+
+    Parameters
+    ----------
+    path: ~str
+    namespace: ~tardis.io.config_reader.ConfigurationNameSpace
+        base namespace with the current value of the item
+    """
+
+    __slots__ = ('path', 'keys', 'unit')
+
+    def __init__(self, path, namespace):
+        self.path = path
+        keys = []
+        node = namespace
+        parts = path.split('.')
+        for n, part in enumerate(parts):
+            if isinstance(node, list):
+                if not part.startswith('item'):
+                    raise KeyError('{0}: expected an item of a list, got {1}'
+                                   .format(path, part))
+                key = int(part.replace('item', ''))
+            else:
+                key = part
+            keys.append(key)
+            if n == len(parts) - 1 and isinstance(node, dict) and \
+                    key not in node:
+                # a new item, like set_config_item allows
+                node = None
+            else:
+                node = node[key]
+        self.keys = tuple(keys)
+        self.unit = getattr(node, 'unit', None)
+
+    def get(self, namespace):
+        for key in self.keys:
+            namespace = namespace[key]
+        return namespace
+
+    def set(self, namespace, value):
+        container = namespace
+        for key in self.keys[:-1]:
+            container = container[key]
+        if self.unit is not None:
+            value = u.Quantity(value, self.unit)
+        if isinstance(container, dict):
+            # the value is converted already, skip ConfigurationNameSpace
+            dict.__setitem__(container, self.keys[-1], value)
+        else:
+            container[self.keys[-1]] = value
+
+
+class ConfigPaths(object):
+    """
+    ConfigPaths of a base namespace, resolved the first time they are used.
+
+    Parameters
+    ----------
+    namespace: ~tardis.io.config_reader.ConfigurationNameSpace
+    paths: ~list of ~str
+        paths to resolve right away
+    """
+
+    def __init__(self, namespace, paths=()):
+        self._namespace = namespace
+        self._paths = {}
+        for path in paths:
+            self[path]
+
+    def __getitem__(self, path):
+        try:
+            return self._paths[path]
+        except KeyError:
+            config_path = self._paths[path] = ConfigPath(
+                    path, self._namespace)
+            return config_path
+
+    def apply(self, namespace, parameters):
+        """
+        Set the items of a copy of the base namespace to the values of the
+        parameter dictionary {path: value}.
+        """
+        for path, value in parameters.items():
+            self[path].set(namespace, value)
+        return namespace
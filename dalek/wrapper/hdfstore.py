@@ -2,32 +2,98 @@ import os
 import time
 import errno
 import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 from pandas import HDFStore
 
 logger = logging.getLogger(__name__)
 
+# PyTables is not thread-safe, so the threads of a process (e.g. the thread
+# of a MetaWriter and the main thread) open SafeHDFStores one at a time
+_thread_lock = threading.RLock()
+
 
 class SafeHDFStore(HDFStore):
+    """
+    HDFStore that holds an exclusive lock on a lock file next to the store
+    while it is open.
+
+    Where fcntl is available the lock is a blocking flock on "<path>.flock":
+    waiting writers are woken up as soon as the lock is released and the
+    lock of a crashed process is released by the kernel, so there are no
+    stale locks. The file stays in place. It is not the "<path>.lock" of
+    older versions, which would take an existing file for a held lock.
+
+    Without fcntl "<path>.lock" is created exclusively and the writers poll
+    every probe_interval seconds. Lock files older than stale_timeout seconds
+    are considered stale and removed.
+
+    Within a process the stores are also opened by one thread at a time.
+    """
+
     def __init__(self, *args, **kwargs):
         probe_interval = kwargs.pop("probe_interval", 1)
-        self._lock = "%s.lock" % args[0]
+        stale_timeout = kwargs.pop("stale_timeout", 3600)
+        _thread_lock.acquire()
+        try:
+            if fcntl is not None:
+                self._lock = "%s.flock" % args[0]
+                self._flock = os.open(self._lock, os.O_CREAT | os.O_RDWR)
+                fcntl.flock(self._flock, fcntl.LOCK_EX)
+            else:
+                self._lock = "%s.lock" % args[0]
+                self._flock = self._create_lock_file(probe_interval,
+                                                     stale_timeout)
+        except Exception:
+            _thread_lock.release()
+            raise
+        try:
+            HDFStore.__init__(self, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+
+    def _create_lock_file(self, probe_interval, stale_timeout):
         while True:
             try:
-                self._flock = os.open(self._lock, os.O_CREAT |
-                                                  os.O_EXCL |
-                                                  os.O_WRONLY)
-                break
+                return os.open(self._lock, os.O_CREAT |
+                                           os.O_EXCL |
+                                           os.O_WRONLY)
             except OSError as e:
-                if e.errno == errno.EEXIST:
-                    time.sleep(probe_interval)
-                else:
+                if e.errno != errno.EEXIST:
                     raise e
+            try:
+                age = time.time() - os.path.getmtime(self._lock)
+            except OSError:
+                continue
+            if age > stale_timeout:
+                logger.warning('Removing stale lock file %s', self._lock)
+                try:
+                    os.remove(self._lock)
+                except OSError:
+                    pass
+            else:
+                time.sleep(probe_interval)
 
-        HDFStore.__init__(self, *args, **kwargs)
+    def _release(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._flock, fcntl.LOCK_UN)
+                os.close(self._flock)
+            else:
+                os.close(self._flock)
+                os.remove(self._lock)
+        finally:
+            _thread_lock.release()
 
     def __exit__(self, *args, **kwargs):
         logger.debug('Exit SafeHDFStore')
-        HDFStore.__exit__(self, *args, **kwargs)
-        os.close(self._flock)
-        os.remove(self._lock)
+        try:
+            HDFStore.__exit__(self, *args, **kwargs)
+        finally:
+            self._release()
@@ -0,0 +1,171 @@
+import logging
+from copy import copy
+
+import numpy as np
+import pandas as pd
+
+from tardis.io.config_reader import Configuration
+from tardis.util import element_symbol2atomic_number
+
+from dalek.wrapper.config import structural_copy
+
+logger = logging.getLogger(__name__)
+
+# Parts of a parsed Configuration that depend on a parameter path (prefix).
+# Paths that are not listed require a full Configuration.from_config_dict.
+PATH_DEPENDENCIES = [
+    ('model.abundances.', 'abundances'),
+    ('plasma.initial_t_inner', 't_inner'),
+]
+
+
+def path_dependencies(paths):
+    """
+    Parts of the Configuration to recompute for changed parameter paths.
+
+    Parameters
+    ----------
+    paths: ~list of ~str
+
+    Returns
+    -------
+        : ~set of ~str or None
+        None if one of the paths is not in PATH_DEPENDENCIES
+    """
+    parts = set()
+    for path in paths:
+        for prefix, part in PATH_DEPENDENCIES:
+            if path.startswith(prefix):
+                parts.add(part)
+                break
+        else:
+            return None
+    return parts
+
+
+def uniform_abundances(abundances_section, no_of_shells):
+    """
+    The abundance table of a uniform abundances section, as built by
+    `Configuration.from_config_dict`.
+    """
+    fractions = {}
+    for symbol in abundances_section:
+        if symbol == 'type':
+            continue
+        fractions[element_symbol2atomic_number(symbol)] = float(
+                abundances_section[symbol])
+    atomic_numbers = sorted(z for z, value in fractions.items() if value > 0)
+    values = np.array([fractions[z] for z in atomic_numbers], dtype=np.float64)
+    abundances = pd.DataFrame(
+            np.repeat(values[:, np.newaxis], no_of_shells, axis=1),
+            index=pd.Index(atomic_numbers, name='atomic_number'),
+            columns=np.arange(no_of_shells))
+    norm_factor = abundances.sum(axis=0)
+    if np.any(np.abs(norm_factor - 1) > 1e-12):
+        logger.warning(
+                "Abundances have not been normalized to 1. - normalizing")
+        abundances /= norm_factor
+    return abundances
+
+
+def copy_arrays(section):
+    """
+    Replace the arrays (including Quantities) and pandas objects in the
+    dicts and lists of section by copies, in place.
+
+    A Radial1DModel keeps references to arrays of its Configuration and
+    updates some of them in place (e.g. `t_rads += ...`), so a built
+    Configuration must not share them with the base.
+    """
+    items = (section.items() if isinstance(section, dict)
+             else enumerate(section))
+    for key, value in list(items):
+        if isinstance(value, (dict, list)):
+            copy_arrays(value)
+        elif isinstance(value, (np.ndarray, pd.Series, pd.DataFrame)):
+            if isinstance(section, dict):
+                dict.__setitem__(section, key, value.copy())
+            else:
+                section[key] = value.copy()
+
+
+class IncrementalConfigBuilder(object):
+    """
+    Build Configurations from namespaces that differ from a base namespace
+    only in a few parameter paths.
+
+    The base namespace is parsed once. If all changed paths are listed in
+    PATH_DEPENDENCIES, a new Configuration reuses the parsed structure
+    (velocity grid, densities, volumes, spectrum and Monte Carlo settings)
+    of the base and only recomputes the dependent parts. Other changes fall
+    back to `Configuration.from_config_dict`. The arrays of the base are
+    copied, so running a model never changes the base.
+
+    Parameters
+    ----------
+    namespace: ~tardis.io.config_reader.ConfigurationNameSpace
+        base namespace, not modified
+    atom_data: ~tardis.atomic.AtomData
+    """
+
+    def __init__(self, namespace, atom_data):
+        self._namespace = namespace
+        self._atom_data = atom_data
+        self._base = None
+        self.incremental_builds = 0
+        self.full_builds = 0
+
+    @property
+    def base(self):
+        if self._base is None:
+            self._base = Configuration.from_config_dict(
+                    structural_copy(self._namespace), validate=False,
+                    atom_data=copy(self._atom_data))
+        return self._base
+
+    def _full(self, namespace):
+        self.full_builds += 1
+        return Configuration.from_config_dict(
+                namespace, validate=False, atom_data=copy(self._atom_data))
+
+    def build(self, namespace, paths):
+        """
+        Parameters
+        ----------
+        namespace: ~tardis.io.config_reader.ConfigurationNameSpace
+            copy of the base namespace with the parameters applied
+        paths: ~list of ~str
+            the paths that may differ from the base namespace
+
+        Returns
+        -------
+            : ~tardis.io.config_reader.Configuration
+        """
+        parts = path_dependencies(paths)
+        if parts is None:
+            return self._full(namespace)
+        base = self.base
+        if ('abundances' in parts and
+                namespace['model']['abundances']['type'] != 'uniform'):
+            return self._full(namespace)
+        if ('t_inner' in parts and
+                namespace['plasma']['initial_t_inner'].value < 0):
+            return self._full(namespace)
+        config_dict = structural_copy(dict(base))
+        copy_arrays(config_dict)
+        config_dict['structure'] = config_dict['model']['structure']
+        plasma = config_dict['plasma']
+        plasma['t_rads'] = (np.ones(base['structure']['no_of_shells']) *
+                            plasma['initial_t_rad'])
+        if 'abundances' in parts:
+            config_dict['model']['abundances'] = namespace['model'][
+                'abundances']
+            config_dict['abundances'] = uniform_abundances(
+                    namespace['model']['abundances'],
+                    base['structure']['no_of_shells'])
+        if 't_inner' in parts:
+            initial_t_inner = namespace['plasma']['initial_t_inner']
+            config_dict['plasma']['initial_t_inner'] = initial_t_inner
+            config_dict['plasma']['t_inner'] = initial_t_inner
+        self.incremental_builds += 1
+        return Configuration(config_dict, copy(self._atom_data))
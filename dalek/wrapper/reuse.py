@@ -0,0 +1,113 @@
+import copy
+import logging
+import itertools
+
+import numpy as np
+
+from tardis import packet_source
+from tardis.model import Radial1DModel
+
+logger = logging.getLogger(__name__)
+
+
+def _array_key(quantity):
+    return np.asarray(getattr(quantity, 'value', quantity)).tobytes()
+
+
+class ReusableModel(object):
+    """
+    Return the same Radial1DModel for every configuration that is compatible
+    with the previous one, reset in place, instead of building a new model.
+
+    Configurations are compatible if they select the same elements and have
+    the same shells, plasma settings and spectrum grid. These are all
+    abundance and temperature changes of a sampling campaign. The expensive
+    parts of a new model are skipped on reuse: the preparation of the atomic
+    data for the selected elements (line list and macro atom tables) and the
+    allocation of the plasma. The reset sets everything else that
+    `Radial1DModel.__init__` derives from the configuration: t_inner, t_rads,
+    the number densities, the iteration counters, the number of packets,
+    the t_inner update cycle, a packet source seeded from montecarlo.seed
+    and empty spectra. It restores the initial dilution factors and
+    recalculates the plasma. A reused model therefore runs exactly like a
+    new one.
+
+    The returned model is changed by the next call, so keep only the results
+    of an evaluation (e.g. a dalek.tools.cache.ModelSnapshot), not the
+    model.
+    """
+
+    def __init__(self):
+        self.model = None
+        self._key = None
+        self._initial_ws = None
+        self.created = 0
+        self.reused = 0
+        self.last_reused = False
+
+    @staticmethod
+    def compatibility_key(config):
+        plasma = config.plasma
+        structure = config.structure
+        return (tuple(config.abundances.index),
+                _array_key(structure.v_inner),
+                _array_key(structure.v_outer),
+                _array_key(structure.mean_densities),
+                _array_key(config.supernova.time_explosion),
+                _array_key(config.spectrum.frequency),
+                plasma.line_interaction_type,
+                tuple(plasma.nlte.species),
+                plasma.ionization,
+                plasma.excitation)
+
+    def __call__(self, config):
+        key = self.compatibility_key(config)
+        self.last_reused = False
+        if self.model is not None and key == self._key:
+            try:
+                self._reset(self.model, config)
+            except AttributeError as e:
+                # a TARDIS version with a different model layout
+                logger.warning('Could not reset the model (%s), building a '
+                               'new one', e)
+            else:
+                self.reused += 1
+                self.last_reused = True
+                return self.model
+        self.model = Radial1DModel(config)
+        self._key = key
+        self._initial_ws = np.copy(self.model.ws)
+        self.created += 1
+        return self.model
+
+    def _reset(self, model, config):
+        plasma_array = model.plasma_array
+        montecarlo = config.montecarlo
+        # the atomic data of the model is prepared for the same elements
+        config.atom_data = model.atom_data
+        model.tardis_config = config
+        model.converged = False
+        sampling = montecarlo.black_body_sampling
+        model.packet_src = packet_source.SimplePacketSource.from_wavelength(
+                sampling.start, sampling.end,
+                blackbody_sampling=sampling.samples, seed=montecarlo.seed)
+        model.current_no_of_packets = montecarlo.no_of_packets
+        model.t_inner = config.plasma.t_inner
+        model.t_rads = config.plasma.t_rads.copy()
+        model.iterations_max_requested = montecarlo.iterations
+        model.iterations_remaining = montecarlo.iterations
+        model.iterations_executed = 0
+        convergence_strategy = montecarlo.convergence_strategy
+        if convergence_strategy.type == 'specific':
+            model.global_convergence_parameters = copy.deepcopy(
+                    convergence_strategy.global_convergence_parameters)
+        t_inner_lock_cycle = [False] * convergence_strategy.lock_t_inner_cyles
+        t_inner_lock_cycle[0] = True
+        model.t_inner_update = itertools.cycle(t_inner_lock_cycle)
+        model.ws = self._initial_ws.copy()
+        for name in ('spectrum', 'spectrum_virtual', 'spectrum_reabsorbed'):
+            setattr(model, name, type(getattr(model, name))(
+                    config.spectrum.frequency, config.supernova.distance))
+        plasma_array.number_densities = config.number_densities
+        model.calculate_j_blues(init_detailed_j_blues=True)
+        model.update_plasmas(initialize_nlte=True)
@@ -7,7 +7,7 @@ import os
 import logging
 
 from uuid import uuid4
-from copy import deepcopy
+from copy import copy
 
 from tardis.atomic import AtomData
 from tardis.model import Radial1DModel
@@ -15,29 +15,83 @@ from tardis.simulation import run_radial1d
 from tardis.io.config_reader import Configuration, ConfigurationNameSpace
 
 from dalek.base.simulation import TinnerSimulation
+from dalek.wrapper.config import structural_copy, ConfigPaths
+from dalek.wrapper.incremental import IncrementalConfigBuilder
+from dalek.wrapper.reuse import ReusableModel
+from dalek.wrapper.atom_data import load_shared_atom_data
+from dalek.util import file_hash
+
+logger = logging.getLogger(__name__)
 
 class TardisWrapper(object):
 
-    def __init__(self, config_fname, atom_data=None, log_dir='./logs/'):
+    def __init__(self, config_fname, atom_data=None, log_dir='./logs/',
+                 shared_atom_data=None, incremental=True, reuse_model=False):
+        """
+        Parameters
+        ----------
+        config_fname: ~str
+        atom_data: ~tardis.atomic.AtomData
+            use this AtomData instead of reading the one in the config
+        log_dir: ~str
+        shared_atom_data: ~str
+            directory of a memory-mapped copy of the atomic data shared
+            by all processes on a node (see dalek.wrapper.atom_data)
+        incremental: ~bool
+            reuse the parsed configuration when the parameters only change
+            sections listed in dalek.wrapper.incremental.PATH_DEPENDENCIES
+        reuse_model: ~bool
+            reset the Radial1DModel of the previous run in place if the
+            new configuration is compatible (see
+            dalek.wrapper.reuse.ReusableModel). The model returned by a
+            call is then changed by the next one.
+        """
         self._log_dir = log_dir
         self.set_logger('startup')
         self._config = ConfigurationNameSpace.from_yaml(config_fname)
-        if atom_data is None:
-            self._atom_data = AtomData.from_hdf5(self._config.atom_data)
-        else:
+        self.config_paths = ConfigPaths(self._config)
+        self.config_hash = file_hash(config_fname)
+        if atom_data is not None:
             self._atom_data = atom_data
-
-
-    def __call__(self, callback, log_name=None):
+        elif shared_atom_data is not None:
+            self._atom_data = load_shared_atom_data(
+                    self._config.atom_data, shared_atom_data)
+        else:
+            self._atom_data = AtomData.from_hdf5(self._config.atom_data)
+        self.config_builder = (
+                IncrementalConfigBuilder(self._config, self._atom_data)
+                if incremental else None)
+        self.model_factory = ReusableModel() if reuse_model else Radial1DModel
+
+    def __call__(self, callback, log_name=None, parameters=None,
+                 changed_paths=None):
+        """
+        Parameters
+        ----------
+        callback: function
+            gets a copy of the configuration namespace and returns the
+            namespace to run
+        log_name: ~str
+        parameters: ~dict
+            the parameters applied by callback, used to find similar
+            previous runs (see TInnerWrapper)
+        changed_paths: ~list of ~str
+            all configuration paths callback changes. With the config
+            builder, only the parts of the configuration that depend on
+            them are rebuilt. If None, the configuration is built in full.
+        """
         if log_name is None:
             log_name = uuid4()
         self.set_logger(log_name)
-        config = self._generate_config(callback)
+        self._parameters = parameters
+        config = self._generate_config(callback, changed_paths)
         self.model = self.run_tardis(config)
         return self.model
 
-    def _generate_config(self, callback):
+    def _generate_config(self, callback, changed_paths=None):
         config_ns = callback(self.config)
+        if self.config_builder is not None and changed_paths is not None:
+            return self.config_builder.build(config_ns, list(changed_paths))
         return Configuration.from_config_dict(
                 config_ns,
                 validate=False,
@@ -54,27 +108,80 @@ class TardisWrapper(object):
         tardis_logger.handlers = [fileHandler]
 
     def run_tardis(self, config):
-        mdl = Radial1DModel(config)
+        mdl = self.model_factory(config)
         run_radial1d(mdl)
         return mdl
 
 
     @property
     def atom_data(self):
-        return deepcopy(self._atom_data)
+        """
+        A shallow copy of the AtomData that shares all tables with the
+        original. AtomData.prepare_atom_data assigns the filtered tables to
+        the copy instead of changing the shared ones, so the original stays
+        untouched without copying the whole atomic database.
+        """
+        return copy(self._atom_data)
 
     @property
     def config(self):
-        return deepcopy(self._config)
+        return structural_copy(self._config)
 
 
 class TInnerWrapper(TardisWrapper):
+    """
+    Run TARDIS with a fixed inner boundary temperature.
+
+    Keyword arguments:
+    warm_start -- a dalek.base.warmstart.WarmStartStore. The plasma state of
+                  the closest previously converged parameters is used as
+                  starting point of the iterations (default: None)
+    packet_schedule -- a dalek.base.schedule.PacketSchedule giving the
+                       number of packets per iteration (default: None)
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.warm_start = kwargs.pop('warm_start', None)
+        self.packet_schedule = kwargs.pop('packet_schedule', None)
+        super(TInnerWrapper, self).__init__(*args, **kwargs)
 
     def run_tardis(self, config):
-        mdl = Radial1DModel(config)
+        mdl = self.model_factory(config)
         t_inner = config.get_config_item('plasma.t_inner')
-        simulation = TinnerSimulation(config)
-        simulation.run_simulation(mdl, t_inner)
+        simulation = self._simulation(config)
+        parameters = getattr(self, '_parameters', None)
+        use_warm_start = self.warm_start is not None and parameters
+        state = None
+        if use_warm_start:
+            state, distance = self.warm_start.query(parameters)
+        simulation.run_simulation(mdl, t_inner, initial_state=state)
+        if use_warm_start and simulation.converged:
+            self.warm_start.add(
+                    parameters, mdl.t_inner, mdl.t_rads, mdl.ws,
+                    simulation.iterations_executed, warm=state is not None)
+        if state is not None:
+            cold = self.warm_start.mean_cold_iterations
+            logger.info(
+                    'Warm start at distance %.3g converged in %d iterations '
+                    '(cold starts: %.1f, saved %.1f)', distance,
+                    simulation.iterations_executed, cold,
+                    cold - simulation.iterations_executed)
         mdl.runner = simulation.runner
         return mdl
 
+    def _simulation(self, config):
+        """
+        A TinnerSimulation for config. With a reused model the simulation
+        of the previous run and its MontecarloRunner are reused as well.
+        """
+        simulation = getattr(self, '_last_simulation', None)
+        if simulation is not None and getattr(
+                self.model_factory, 'last_reused', False):
+            simulation.tardis_config = config
+            return simulation
+        simulation = TinnerSimulation(
+                config, packet_schedule=self.packet_schedule)
+        if isinstance(self.model_factory, ReusableModel):
+            self._last_simulation = simulation
+        return simulation
+
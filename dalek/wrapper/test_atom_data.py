@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import pytest
+import numpy as np
+import pandas as pd
+
+from dalek.wrapper.atom_data import (
+        dump_shared_atom_data, attach_shared_atom_data)
+
+
+class DummyAtomData(object):
+
+    def __init__(self):
+        self.lines = pd.DataFrame({
+            'atomic_number': np.arange(100) % 3 + 1,
+            'wavelength': np.linspace(1000, 9000, 100),
+            'f_lu': np.random.random(100),
+            }).set_index('atomic_number', append=True)
+        self.atom_data = pd.DataFrame(
+                {'symbol': ['H', 'He', 'Li'], 'mass': [1., 4., 7.]},
+                index=pd.Index([1, 2, 3], name='atomic_number'))
+        self.temperatures = np.linspace(1000, 20000, 20)
+        self.has_zeta_data = False
+
+
+@pytest.fixture
+def shared_dir(request):
+    directory = tempfile.mkdtemp()
+    request.addfinalizer(lambda: shutil.rmtree(directory))
+    return os.path.join(directory, 'atom_data')
+
+
+def test_shared_atom_data(shared_dir):
+    original = DummyAtomData()
+    dump_shared_atom_data(original, shared_dir)
+    attached = attach_shared_atom_data(shared_dir)
+    assert isinstance(attached, DummyAtomData)
+    assert attached.has_zeta_data is False
+    pd.util.testing.assert_frame_equal(attached.lines, original.lines)
+    pd.util.testing.assert_frame_equal(attached.atom_data, original.atom_data)
+    np.testing.assert_array_equal(attached.temperatures, original.temperatures)
+
+    # numerical tables are read-only memory maps
+    values = attached.lines['wavelength'].values
+    assert not values.flags.writeable
+    with pytest.raises(ValueError):
+        values[0] = 0
+    selected = attached.lines[attached.lines.wavelength > 5000]
+    assert len(selected) == (original.lines.wavelength > 5000).sum()
@@ -0,0 +1,67 @@
+import pytest
+import numpy as np
+from astropy import units as u
+
+from dalek.wrapper.config import structural_copy, ConfigPath, ConfigPaths
+
+
+class NameSpace(dict):
+    pass
+
+
+def test_structural_copy():
+    leaf = np.arange(5)
+    base = NameSpace(
+            model=NameSpace(abundances={'o': 0.1, 'si': 0.2}, array=leaf),
+            spectrum=[1, 2, {'a': 3}])
+    new = structural_copy(base)
+    assert new == base
+    assert isinstance(new, NameSpace)
+    assert isinstance(new['model'], NameSpace)
+    assert new['model'] is not base['model']
+    assert new['spectrum'][2] is not base['spectrum'][2]
+    assert new['model']['array'] is leaf
+
+    new['model']['abundances']['o'] = 0.5
+    new['spectrum'][2].pop('a')
+    assert base['model']['abundances']['o'] == 0.1
+    assert base['spectrum'][2] == {'a': 3}
+
+
+def config_namespace():
+    return NameSpace(
+            model=NameSpace(
+                abundances=NameSpace(o=0.1, si=0.2),
+                structure=NameSpace(velocity=[1e4 * u.km / u.s,
+                                              2e4 * u.km / u.s, 20])),
+            plasma=NameSpace(t_inner=1e4 * u.K))
+
+
+def test_config_path():
+    base = config_namespace()
+    velocity = ConfigPath('model.structure.velocity.item0', base)
+    assert velocity.keys == ('model', 'structure', 'velocity', 0)
+    assert velocity.unit == u.km / u.s
+    t_inner = ConfigPath('plasma.t_inner', base)
+    new = structural_copy(base)
+    velocity.set(new, 1.2e4)
+    t_inner.set(new, 9000 * u.K)
+    assert velocity.get(new) == 1.2e4 * u.km / u.s
+    assert new['plasma']['t_inner'] == 9000 * u.K
+    assert base['model']['structure']['velocity'][0] == 1e4 * u.km / u.s
+    assert base['plasma']['t_inner'] == 1e4 * u.K
+    with pytest.raises(KeyError):
+        ConfigPath('model.missing.o', base)
+    with pytest.raises(KeyError):
+        ConfigPath('model.structure.velocity.first', base)
+
+
+def test_config_paths():
+    base = config_namespace()
+    paths = ConfigPaths(base, ['model.abundances.o'])
+    assert list(paths._paths) == ['model.abundances.o']
+    new = paths.apply(structural_copy(base), {'model.abundances.o': 0.3,
+                                              'model.abundances.c': 0.05})
+    assert paths['model.abundances.c'] is paths['model.abundances.c']
+    assert new['model']['abundances'] == {'o': 0.3, 'si': 0.2, 'c': 0.05}
+    assert base['model']['abundances'] == {'o': 0.1, 'si': 0.2}